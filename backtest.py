@@ -0,0 +1,275 @@
+"""
+历史回测引擎
+在 fmz_simulator 的模拟环境中, 用K线数据驱动未经修改的策略状态机
+(order_strategy_main.py 的 OrderBasedStrategyManager,
+ order_strategy_limit.py 的 LimitOrderStrategyManager)
+- 每根K线展开为 O→L→H→C / O→H→L→C 路径, 加仓STOP_MARKET、保护性止损重挂
+  (按路径上的最新价触发)、止盈阶梯和跟踪止盈都在K线内按路径撮合
+- Sleep只推进模拟时钟, 一年1分钟数据在数秒到数十秒内跑完
+- 输出逐笔交易报告和汇总统计
+
+命令行:
+    python backtest.py --klines BTC_USDT_1m.csv --symbol BTC_USDT \\
+        --strategy order_strategy_main.py --out trades.csv
+"""
+import argparse
+import copy
+import csv
+import time
+
+from fmz_simulator import DAY_MS, MarketSpec, Simulator, load_klines
+
+STRATEGY_CLASSES = ("OrderBasedStrategyManager", "LimitOrderStrategyManager")
+
+
+# ============================================================
+# 1. 入场信号
+# ============================================================
+class PrevDaySignal:
+    """
+    默认入场信号: 每个UTC日第一根K线, 按前一日K线方向开仓 (收阳做多, 收阴做空)
+    策略本身是手动下单的, 回测需要一个确定的入场来源; 可替换为任意
+    signal(bt, t) -> start_entry参数dict 或 None 的可调用对象
+    """
+    def __init__(self, max_loss=50, entry_mode=1, volatility_mode=1, atr_percentage=0):
+        self.params = {'max_loss': max_loss, 'entry_mode': entry_mode,
+                       'volatility_mode': volatility_mode, 'atr_percentage': atr_percentage}
+        self.last_day = None
+
+    def __call__(self, bt, t):
+        day = int(t // DAY_MS)
+        if day == self.last_day:
+            return None
+        self.last_day = day
+        daily = bt.sim.exchange.markets[bt.symbol].daily
+        if len(daily) < 2:
+            return None
+        prev = daily[-2]
+        if prev['Close'] == prev['Open']:
+            return None
+        direction = "buy" if prev['Close'] > prev['Open'] else "sell"
+        return dict(self.params, direction=direction)
+
+
+class ScheduledEntries:
+    """
+    按计划时间入场
+    entries: [(时间毫秒, start_entry参数dict), ...], 参数dict含 direction/max_loss/entry_mode 等
+    到点时策略若不空闲则跳过该次入场
+    """
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda e: e[0])
+        self.pos = 0
+
+    def __call__(self, bt, t):
+        due = None
+        while self.pos < len(self.entries) and self.entries[self.pos][0] <= t:
+            due = self.entries[self.pos][1]
+            self.pos += 1
+        return due
+
+
+# ============================================================
+# 2. 回测结果
+# ============================================================
+class BacktestResult:
+    """回测结果: 逐笔交易 + 汇总统计"""
+    def __init__(self, trades, fills, elapsed, steps, api_calls):
+        self.trades = trades
+        self.fills = fills
+        self.elapsed = elapsed
+        self.steps = steps
+        self.api_calls = api_calls
+
+    def summary(self):
+        """汇总统计: 胜率、期望值、盈亏比、最大回撤等"""
+        pnls = [t['net_pnl'] for t in self.trades]
+        wins = [p for p in pnls if p > 0]
+        losses = [p for p in pnls if p <= 0]
+        equity = 0.0
+        peak = 0.0
+        max_dd = 0.0
+        for p in pnls:
+            equity += p
+            peak = max(peak, equity)
+            max_dd = max(max_dd, peak - equity)
+        count = len(pnls)
+        return {
+            'trades': count,
+            'win_rate': len(wins) / count if count else 0.0,
+            'net_pnl': sum(pnls),
+            'expectancy': sum(pnls) / count if count else 0.0,
+            'expectancy_r': sum(t['r_multiple'] for t in self.trades) / count if count else 0.0,
+            'profit_factor': sum(wins) / -sum(losses) if losses and sum(losses) < 0 else float('inf') if wins else 0.0,
+            'max_drawdown': max_dd,
+            'fees': sum(t['fees'] for t in self.trades),
+            'elapsed_sec': self.elapsed,
+            'steps': self.steps,
+            'api_calls': self.api_calls,
+        }
+
+    def to_csv(self, path):
+        """写出逐笔交易报告"""
+        if not self.trades:
+            return
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.trades[0].keys()))
+            writer.writeheader()
+            writer.writerows(self.trades)
+
+    def print_report(self):
+        fmt = lambda ts: time.strftime("%Y-%m-%d %H:%M", time.gmtime(ts / 1000))
+        print(f"{'开仓时间':<17} {'平仓时间':<17} {'方向':<4} {'底仓价':>10} {'平均出场':>10} "
+              f"{'最大持仓':>10} {'净盈亏':>10} {'R':>6}  出场方式")
+        for t in self.trades:
+            print(f"{fmt(t['open_time']):<17} {fmt(t['close_time']):<17} {t['direction']:<4} "
+                  f"{t['entry_price']:>10.4f} {t['exit_price']:>10.4f} {t['max_position']:>10.4f} "
+                  f"{t['net_pnl']:>10.2f} {t['r_multiple']:>6.2f}  {t['exit_kinds']}")
+        print("-" * 100)
+        for k, v in self.summary().items():
+            print(f"{k}: {v:.4f}" if isinstance(v, float) else f"{k}: {v}")
+
+
+def trades_from_fills(fills, entries):
+    """
+    按仓位从0开始到回到0切分交易
+    entries: 已提交的入场 [(时间毫秒, 单笔最大亏损), ...] (按时间排序),
+             每笔交易按开仓前最近一次入场的最大亏损计算R倍数
+    """
+    trades = []
+    cur = None
+    idx = 0
+    for f in fills:
+        if cur is None:
+            while idx < len(entries) and entries[idx][0] <= f['time']:
+                idx += 1
+            max_loss = entries[idx - 1][1] if idx else 0
+            cur = {'open_time': f['time'], 'symbol': f['symbol'],
+                   'direction': "long" if f['side'] == "BUY" else "short",
+                   'entry_price': f['price'], 'max_loss': max_loss, 'fills': 0, 'max_position': 0.0,
+                   'exit_qty': 0.0, 'exit_value': 0.0, 'gross_pnl': 0.0, 'fees': 0.0, 'exit_kinds': []}
+        cur['fills'] += 1
+        cur['fees'] += f['fee']
+        cur['gross_pnl'] += f['pnl']
+        cur['max_position'] = max(cur['max_position'], abs(f['position']))
+        is_exit = (f['side'] == "SELL") == (cur['direction'] == "long")
+        if is_exit:
+            cur['exit_qty'] += f['qty']
+            cur['exit_value'] += f['qty'] * f['price']
+            if f['kind'] not in cur['exit_kinds']:
+                cur['exit_kinds'].append(f['kind'])
+        if f['position'] == 0:
+            cur['close_time'] = f['time']
+            cur['exit_price'] = cur['exit_value'] / cur['exit_qty'] if cur['exit_qty'] else 0.0
+            cur['net_pnl'] = cur['gross_pnl'] - cur['fees']
+            cur['r_multiple'] = cur['net_pnl'] / cur['max_loss'] if cur['max_loss'] else 0.0
+            cur['exit_kinds'] = "+".join(cur['exit_kinds'])
+            del cur['exit_qty'], cur['exit_value']
+            trades.append(cur)
+            cur = None
+    return trades
+
+
+# ============================================================
+# 3. 回测引擎
+# ============================================================
+class Backtester:
+    """
+    strategy_path: 策略文件 (order_strategy_main.py / order_strategy_limit.py)
+    klines: fmz_simulator.KlineSeries (1m/1s)
+    spec: 交易对参数 MarketSpec
+    config: 覆盖策略 STRATEGY_CONFIG 的参数 (参数扫描用)
+    signal: 入场信号, 默认 PrevDaySignal()
+    """
+    def __init__(self, strategy_path, symbol, klines, spec, config=None, signal=None,
+                 log_level=0, **exchange_kwargs):
+        self.strategy_path = strategy_path
+        self.symbol = symbol
+        self.klines = klines
+        self.signal = signal or PrevDaySignal()
+        exchange_kwargs.setdefault('fill_at_trigger', True)
+        start = klines.time[0] if len(klines) else 0
+        self.sim = Simulator({symbol: spec}, start_time=start, log_level=log_level, **exchange_kwargs)
+        self.ns = self.sim.load_strategy(strategy_path)
+        cfg = copy.deepcopy(self.ns['STRATEGY_CONFIG'])
+        if config:
+            cfg.update(config)
+        self.cfg = cfg
+        cls_name = next(name for name in STRATEGY_CLASSES if name in self.ns)
+        self.strategy = self.ns[cls_name](self.sim.exchange, cfg)
+        self.entries = []  # 已提交的入场 (时间, 单笔最大亏损), 逐笔计算R倍数
+
+    def _try_entry(self, t):
+        """策略空闲且有信号时, 走 start_entry + confirm_entry 完整流程"""
+        params = self.signal(self, t)
+        if not params:
+            return
+        # 日线不足时ATR无法计算, 跳过
+        if len(self.sim.exchange.markets[self.symbol].daily) < self.cfg['atr_period'] + 2:
+            return
+        st = self.strategy
+        ok = st.start_entry(self.symbol, params['direction'], params['max_loss'], params.get('entry_mode', 1),
+                            params.get('limit_price', 0), params.get('volatility_mode', 1),
+                            params.get('atr_percentage', 0))
+        if ok:
+            self.entries.append((t, params['max_loss']))
+            st.confirm_entry()
+
+    def run(self):
+        """逐K线回放, 返回 BacktestResult"""
+        sim = self.sim
+        st = self.strategy
+        step = sim.step
+        symbol = self.symbol
+        times = self.klines.time
+        bar_ms = times[1] - times[0] if len(times) > 1 else 60000
+        q = bar_ms / 4
+        steps = 0
+        started = time.time()
+        for t, o, h, l, c, v in self.klines:
+            if st.state == "IDLE":
+                step(symbol, t, o)
+                self._try_entry(t)
+            if c >= o:
+                path = ((t, o), (t + q, l), (t + 2 * q, h), (t + 3 * q, c))
+            else:
+                path = ((t, o), (t + q, h), (t + 2 * q, l), (t + 3 * q, c))
+            for pt, price in path:
+                step(symbol, pt, price)
+                if st.state != "IDLE" and st.state != "WAIT_CONFIRM":
+                    try:
+                        st.check_position_and_update_state()
+                    except Exception as e:
+                        # 与实盘主循环一致: 记录错误后继续
+                        sim.log(f"❌ 主循环错误: {e}", "#FF0000")
+            steps += 4
+        trades = trades_from_fills(sim.exchange.fills, self.entries)
+        return BacktestResult(trades, sim.exchange.fills, time.time() - started, steps, sim.exchange.api_calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FMZ策略历史回测")
+    parser.add_argument("--klines", required=True, help="K线CSV: time,open,high,low,close[,volume]")
+    parser.add_argument("--symbol", default="BTC_USDT")
+    parser.add_argument("--strategy", default="order_strategy_main.py")
+    parser.add_argument("--price-precision", type=int, default=1)
+    parser.add_argument("--amount-precision", type=int, default=3)
+    parser.add_argument("--min-qty", type=float, default=0.001)
+    parser.add_argument("--max-loss", type=float, default=50)
+    parser.add_argument("--mode", type=int, default=1, help="入场模式 1-4")
+    parser.add_argument("--volatility", type=int, default=1, help="波动模式 0-2")
+    parser.add_argument("--atr-percentage", type=float, default=0)
+    parser.add_argument("--out", default="", help="逐笔交易CSV输出路径")
+    args = parser.parse_args()
+
+    klines = load_klines(args.klines)
+    spec = MarketSpec(args.price_precision, args.amount_precision, args.min_qty)
+    signal = PrevDaySignal(args.max_loss, args.mode, args.volatility, args.atr_percentage)
+    result = Backtester(args.strategy, args.symbol, klines, spec, signal=signal).run()
+    result.print_report()
+    if args.out:
+        result.to_csv(args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,947 @@
+"""
+FMZ平台离线模拟器
+提供策略文件依赖的FMZ全局对象 (exchange, _C, _N, _D, Sleep, Log, LogStatus,
+GetCommand, TA, ext, PD_LONG/PD_SHORT, PERIOD_D1) 和一个本地撮合引擎:
+- 市价单 / 限价单 (含 reduce_only, 成交时按反向持仓裁剪数量), FMZ Buy/Sell 或 /fapi/v1/order,
+  可按客户端订单ID查询/撤单; drop_responses 模拟"已执行但响应超时"的请求;
+  数值参数按币安格式校验 (科学计数法报 -1100)
+- /fapi/v1/algoOrder 条件单: STOP_MARKET (triggerPrice, CONTRACT_PRICE)
+  与 TRAILING_STOP_MARKET (activatePrice + callbackRate), 可按 clientAlgoId 查询/撤单
+- /fapi/v1/klines 返回由采样价格滚动生成的最近1分钟K线, GetDepth 返回以最新价为中心的合成盘口
+行情由tick或K线文件驱动, Sleep只推进模拟时钟, 不产生真实等待, 无网络访问
+
+用法:
+    sim = Simulator({"BTC_USDT": MarketSpec(price_precision=1, amount_precision=3)})
+    ns = sim.load_strategy("order_strategy_main.py")
+    strategy = ns['OrderBasedStrategyManager'](sim.exchange, ns['STRATEGY_CONFIG'])
+    for t, price in kline_path_points(load_klines("BTC_USDT_1m.csv")):
+        sim.step("BTC_USDT", t, price)
+        strategy.check_position_and_update_state()
+"""
+import csv
+import json
+import os
+import re
+import time
+from array import array
+from collections import deque
+from urllib.parse import parse_qsl
+
+# FMZ常量
+PD_LONG = 0
+PD_SHORT = 1
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+ORDER_STATE_PENDING = 0
+ORDER_STATE_CLOSED = 1
+ORDER_STATE_CANCELED = 2
+PERIOD_M1 = 60
+PERIOD_H1 = 3600
+PERIOD_D1 = 86400
+
+DAY_MS = 86400 * 1000
+TEMPLATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trading_utils.py")
+
+
+# ============================================================
+# 1. 行情数据
+# ============================================================
+class KlineSeries:
+    """K线序列 - 按列存储(array), 便于多进程共享只读内存"""
+    def __init__(self):
+        self.time = array('d')
+        self.open = array('d')
+        self.high = array('d')
+        self.low = array('d')
+        self.close = array('d')
+        self.volume = array('d')
+
+    def append(self, t, o, h, l, c, v=0.0):
+        self.time.append(t)
+        self.open.append(o)
+        self.high.append(h)
+        self.low.append(l)
+        self.close.append(c)
+        self.volume.append(v)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __iter__(self):
+        return zip(self.time, self.open, self.high, self.low, self.close, self.volume)
+
+
+class TickSeries:
+    """成交价序列 (时间毫秒, 价格)"""
+    def __init__(self):
+        self.time = array('d')
+        self.price = array('d')
+
+    def append(self, t, price):
+        self.time.append(t)
+        self.price.append(price)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __iter__(self):
+        return zip(self.time, self.price)
+
+
+def _to_ms(value):
+    """时间戳统一转为毫秒 (兼容秒级时间戳)"""
+    t = float(value)
+    return t * 1000 if t < 1e11 else t
+
+
+def load_klines(path):
+    """
+    加载K线CSV文件
+    需要表头, 列名: time,open,high,low,close[,volume] (time为秒或毫秒时间戳)
+    """
+    series = KlineSeries()
+    with open(path, 'r') as f:
+        for row in csv.DictReader(f):
+            series.append(_to_ms(row['time']), float(row['open']), float(row['high']),
+                          float(row['low']), float(row['close']), float(row.get('volume') or 0))
+    return series
+
+
+def load_ticks(path):
+    """
+    加载tick CSV文件
+    需要表头, 列名: time,price (time为秒或毫秒时间戳)
+    """
+    series = TickSeries()
+    with open(path, 'r') as f:
+        for row in csv.DictReader(f):
+            series.append(_to_ms(row['time']), float(row['price']))
+    return series
+
+
+def kline_path_points(klines, bar_ms=None):
+    """
+    把K线展开为K线内的价格路径: 阳线 O→L→H→C, 阴线 O→H→L→C
+    返回 (时间毫秒, 价格) 生成器, 四个点均匀分布在K线周期内
+    """
+    times = klines.time
+    if bar_ms is None:
+        bar_ms = times[1] - times[0] if len(times) > 1 else 60000
+    step = bar_ms / 4
+    for t, o, h, l, c, v in klines:
+        if c >= o:
+            yield t, o
+            yield t + step, l
+            yield t + 2 * step, h
+        else:
+            yield t, o
+            yield t + step, h
+            yield t + 2 * step, l
+        yield t + 3 * step, c
+
+
+def daily_records_from_klines(klines):
+    """把分钟/秒级K线聚合为日线 (FMZ Records格式)"""
+    records = []
+    for t, o, h, l, c, v in klines:
+        day = int(t // DAY_MS) * DAY_MS
+        if records and records[-1]['Time'] == day:
+            bar = records[-1]
+            bar['High'] = max(bar['High'], h)
+            bar['Low'] = min(bar['Low'], l)
+            bar['Close'] = c
+            bar['Volume'] += v
+        else:
+            records.append({'Time': day, 'Open': o, 'High': h, 'Low': l, 'Close': c, 'Volume': v})
+    return records
+
+
+# ============================================================
+# 2. FMZ全局函数
+# ============================================================
+def _N(value, precision=4):
+    """FMZ _N: 截断到指定小数位"""
+    m = 10 ** precision
+    if value >= 0:
+        return int(value * m + 1e-9) / m
+    return -int(-value * m + 1e-9) / m
+
+
+class _TA:
+    """FMZ TA指标库 (只实现策略用到的指标)"""
+    @staticmethod
+    def ATR(records, period=14):
+        """与FMZ TA.ATR一致: 前period根为TR累计均值, 之后按Wilder平滑"""
+        ret = []
+        total = 0.0
+        n = 0.0
+        prev_close = None
+        for i, r in enumerate(records):
+            if prev_close is None:
+                tr = r['High'] - r['Low']
+            else:
+                tr = max(r['High'] - r['Low'], abs(r['High'] - prev_close), abs(prev_close - r['Low']))
+            total += tr
+            if i < period:
+                n = total / (i + 1)
+            else:
+                n = ((period - 1) * n + tr) / period
+            ret.append(n)
+            prev_close = r['Close']
+        return ret
+
+
+class _Ext:
+    """模板类库导出对象"""
+    pass
+
+
+_CODE_CACHE = {}
+
+
+def _compiled(path):
+    """编译并缓存策略/模板源码 (参数扫描时同一进程会反复加载)"""
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    cached = _CODE_CACHE.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'r') as f:
+        code = compile(f.read(), path, 'exec')
+    _CODE_CACHE[path] = (mtime, code)
+    return code
+
+
+# 带磁盘缓存的工具类: 模拟环境中只用模拟交易所的数据, 不读写工作目录下的实盘缓存文件
+CACHED_CLASSES = ("MarketInfoStore", "ATRService")
+
+
+# 带后台发送线程的工具类: 模拟环境中在调用处同步执行, 日志顺序可复现
+SYNC_CLASSES = ("NotificationManager",)
+
+
+def _isolate_caches(ns):
+    for name in CACHED_CLASSES:
+        if name in ns:
+            ns[name].CACHE_FILE = os.devnull
+    for name in SYNC_CLASSES:
+        if name in ns:
+            ns[name].ASYNC = False
+
+
+# ============================================================
+# 3. 撮合引擎
+# ============================================================
+class MarketSpec:
+    """交易对参数 (对应 GetMarkets 返回的精度信息)"""
+    def __init__(self, price_precision=2, amount_precision=3, min_qty=0.001, tick_size=None, history=None):
+        """history: 回测开始前的日线 (FMZ Records格式), 用于ATR预热"""
+        self.price_precision = price_precision
+        self.amount_precision = amount_precision
+        self.min_qty = min_qty
+        self.tick_size = tick_size if tick_size else 10 ** -price_precision
+        self.history = history or []
+
+
+class SimMarket:
+    """单个交易对的撮合状态"""
+    def __init__(self, symbol, spec):
+        self.symbol = symbol
+        self.symbol_api = symbol.replace("_", "")
+        self.spec = spec
+        self.price = 0.0
+        self.position = 0.0       # 净持仓, 正数=多, 负数=空
+        self.avg_price = 0.0
+        self.orders = []          # 挂单中的限价单
+        self.algo_orders = []     # 挂单中的条件单
+        self.daily = [dict(r) for r in spec.history]
+        self.day = self.daily[-1]['Time'] if self.daily else None
+        self.minutes = deque(maxlen=100)  # 最近的1分钟K线 [开盘时间, 开, 高, 低, 收]
+
+
+class SimExchange:
+    """
+    模拟 FMZ exchange 对象 (币安U本位永续, 单向持仓)
+    fills: 成交流水, 每笔为dict (time, symbol, side, qty, price, fee, pnl, kind, reduce_only)
+    events: 按币安用户数据流格式生成的 ORDER_TRADE_UPDATE / ACCOUNT_UPDATE 事件
+            (仅在 record_events=True 时生成, 由 Simulator.event_source() 开启)
+    """
+    DEPTH_LEVELS = 20
+    DECIMAL = re.compile(r"^([0-9]{1,20})(\.[0-9]{1,20})?$")  # 币安数值参数格式 (不接受科学计数法)
+
+    def __init__(self, sim, specs, balance=10000.0, taker_fee=0.0005, maker_fee=0.0002, slippage=0.0,
+                 fill_at_trigger=False, depth_qty=1.0):
+        """
+        fill_at_trigger: True时条件单按触发价成交 (价格在两个采样点之间连续经过触发价,
+                         如K线内路径), False时按当前采样价成交
+        depth_qty: GetDepth 合成盘口每档的数量
+        """
+        self.sim = sim
+        self.markets = {symbol: SimMarket(symbol, spec) for symbol, spec in specs.items()}
+        self.by_api = {m.symbol_api: m for m in self.markets.values()}
+        self.current = next(iter(self.markets))
+        self.contract_type = ""
+        self.balance = balance
+        self.taker_fee = taker_fee
+        self.maker_fee = maker_fee
+        self.slippage = slippage  # 市价成交的滑点 (比例)
+        self.fill_at_trigger = fill_at_trigger
+        self.depth_qty = depth_qty
+        self.fills = []
+        self.notifications = []
+        self.events = deque()
+        self.record_events = False
+        self.next_id = 1
+        self.api_calls = 0
+        self.client_orders = {}       # 客户端订单ID -> 普通订单
+        self.client_algo_orders = {}  # clientAlgoId -> 条件单
+        self.drop_responses = 0       # >0 时接下来的POST请求执行后丢弃响应 (模拟超时)
+
+    # ---------- 内部工具 ----------
+    def _market(self, symbol=None):
+        if symbol:
+            symbol = symbol.split(".")[0]
+            return self.markets[symbol]
+        return self.markets[self.current]
+
+    def _new_id(self):
+        oid = self.next_id
+        self.next_id += 1
+        return oid
+
+    def _emit(self, event):
+        if not self.record_events:
+            return
+        event['E'] = self.sim.now
+        self.events.append(event)
+
+    def _fill(self, m, side, qty, price, kind, reduce_only=False, maker=False, tag="", stop_price=0.0):
+        """成交并更新持仓/余额, 返回实际成交数量 (reduce_only按反向持仓裁剪)"""
+        signed = qty if side == "BUY" else -qty
+        if reduce_only:
+            if m.position == 0 or (m.position > 0) == (signed > 0):
+                return 0.0
+            signed = max(-abs(m.position), min(abs(m.position), signed))
+            qty = abs(signed)
+        qty = _N(qty, m.spec.amount_precision)
+        if qty <= 0:
+            return 0.0
+        signed = qty if side == "BUY" else -qty
+        pnl = 0.0
+        pos = m.position
+        if pos == 0 or (pos > 0) == (signed > 0):
+            m.avg_price = (abs(pos) * m.avg_price + qty * price) / (abs(pos) + qty)
+            m.position = pos + signed
+        else:
+            closed = min(abs(pos), qty)
+            pnl = (price - m.avg_price) * closed * (1 if pos > 0 else -1)
+            m.position = pos + signed
+            if abs(m.position) < 1e-12:
+                m.position = 0.0
+                m.avg_price = 0.0
+            elif (m.position > 0) != (pos > 0):
+                m.avg_price = price  # 反手
+        m.position = round(m.position, 12)
+        fee = qty * price * (self.maker_fee if maker else self.taker_fee)
+        self.balance += pnl - fee
+        self.fills.append({
+            'time': self.sim.now, 'symbol': m.symbol, 'side': side, 'qty': qty, 'price': price,
+            'fee': fee, 'pnl': pnl, 'kind': kind, 'reduce_only': reduce_only, 'tag': tag,
+            'position': m.position,
+        })
+        self._emit({'e': "ORDER_TRADE_UPDATE", 'o': {
+            's': m.symbol_api, 'S': side, 'o': kind, 'X': "FILLED", 'l': str(qty), 'L': str(price),
+            'ap': str(price), 'sp': str(stop_price), 'R': reduce_only, 'c': tag,
+        }})
+        self._emit({'e': "ACCOUNT_UPDATE", 'a': {'P': [{
+            's': m.symbol_api, 'pa': str(m.position), 'ep': str(m.avg_price), 'ps': "BOTH",
+        }]}})
+        return qty
+
+    def _market_price(self, m, side, price=None):
+        price = m.price if price is None else price
+        slip = self.slippage * price
+        return price + slip if side == "BUY" else price - slip
+
+    @staticmethod
+    def _trigger_level(a):
+        """条件单的触发价位 (跟踪单为极值回调后的价位)"""
+        if a['type'] == "STOP_MARKET":
+            return a['trigger']
+        if a['side'] == "SELL":
+            return a['extreme'] * (1 - a['rate'] / 100)
+        return a['extreme'] * (1 + a['rate'] / 100)
+
+    def match(self, m, continuous=True):
+        """
+        按最新价撮合该交易对的限价单和条件单
+        continuous: 价格是否从上一采样点连续运动而来 (挂单时的即时检查为False)
+        """
+        price = m.price
+        if m.orders:
+            remaining = []
+            for o in m.orders:
+                crossed = price <= o['price'] if o['side'] == "BUY" else price >= o['price']
+                if not crossed:
+                    remaining.append(o)
+                    continue
+                filled = self._fill(m, o['side'], o['qty'], o['price'], "LIMIT", o['reduce_only'], maker=True, tag=o['client_id'])
+                o['deal'] = filled
+                o['status'] = ORDER_STATE_CLOSED if filled > 0 else ORDER_STATE_CANCELED
+            m.orders = remaining
+        if m.algo_orders:
+            remaining = []
+            for a in m.algo_orders:
+                if self._algo_triggered(a, price):
+                    fill_price = self._trigger_level(a) if self.fill_at_trigger and continuous else price
+                    filled = self._fill(m, a['side'], a['qty'], self._market_price(m, a['side'], fill_price), a['type'],
+                                        a['reduce_only'], tag=a['client_id'], stop_price=a['trigger'])
+                    a['status'] = "FINISHED" if filled > 0 else "EXPIRED"
+                else:
+                    remaining.append(a)
+            m.algo_orders = remaining
+
+    @staticmethod
+    def _algo_triggered(a, price):
+        """条件单触发判断 (workingType=CONTRACT_PRICE, 即最新成交价)"""
+        side = a['side']
+        if a['type'] == "STOP_MARKET":
+            return price >= a['trigger'] if side == "BUY" else price <= a['trigger']
+        # TRAILING_STOP_MARKET: 卖出单跟踪最高价, 买入单跟踪最低价
+        if not a['active']:
+            act = a['activate']
+            if act > 0 and (price < act if side == "SELL" else price > act):
+                return False
+            a['active'] = True
+            a['extreme'] = price
+        if side == "SELL":
+            if price > a['extreme']:
+                a['extreme'] = price
+            return price <= a['extreme'] * (1 - a['rate'] / 100)
+        if price < a['extreme']:
+            a['extreme'] = price
+        return price >= a['extreme'] * (1 + a['rate'] / 100)
+
+    def set_price(self, symbol, price):
+        """更新最新价, 滚动日线并撮合"""
+        m = self.markets[symbol]
+        m.price = price
+        day = int(self.sim.now // DAY_MS) * DAY_MS
+        if m.day != day:
+            m.day = day
+            m.daily.append({'Time': day, 'Open': price, 'High': price, 'Low': price, 'Close': price, 'Volume': 0})
+        else:
+            bar = m.daily[-1]
+            if price > bar['High']:
+                bar['High'] = price
+            elif price < bar['Low']:
+                bar['Low'] = price
+            bar['Close'] = price
+        minute = int(self.sim.now // 60000) * 60000
+        bars = m.minutes
+        if not bars or bars[-1][0] != minute:
+            bars.append([minute, price, price, price, price])
+        else:
+            bar = bars[-1]
+            if price > bar[2]:
+                bar[2] = price
+            elif price < bar[3]:
+                bar[3] = price
+            bar[4] = price
+        if m.orders or m.algo_orders:
+            self.match(m)
+
+    # ---------- FMZ exchange 接口 ----------
+    def SetContractType(self, contract_type):
+        self.contract_type = contract_type
+        return True
+
+    def GetContractType(self):
+        return self.contract_type
+
+    def SetCurrency(self, symbol):
+        self.current = symbol
+        return True
+
+    def GetCurrency(self):
+        return self.current
+
+    def GetName(self):
+        return "Futures_Binance"
+
+    def GetTicker(self, symbol=None):
+        self.api_calls += 1
+        m = self._market(symbol)
+        tick = m.spec.tick_size
+        return {'Time': self.sim.now, 'Last': m.price, 'Buy': m.price - tick, 'Sell': m.price + tick,
+                'High': m.daily[-1]['High'] if m.daily else m.price,
+                'Low': m.daily[-1]['Low'] if m.daily else m.price, 'Volume': 0,
+                'Symbol': f"{m.symbol}.swap"}
+
+    def GetDepth(self, symbol=None):
+        """以最新价为中心的合成盘口: 每档间隔一个tick, 每档数量 depth_qty"""
+        self.api_calls += 1
+        m = self._market(symbol)
+        tick = m.spec.tick_size
+        levels = range(1, self.DEPTH_LEVELS + 1)
+        return {'Time': self.sim.now,
+                'Asks': [{'Price': m.price + i * tick, 'Amount': self.depth_qty} for i in levels],
+                'Bids': [{'Price': m.price - i * tick, 'Amount': self.depth_qty} for i in levels]}
+
+    def GetTickers(self):
+        self.api_calls += 1
+        tickers = []
+        for symbol in self.markets:
+            ticker = self.GetTicker(symbol)
+            tickers.append(ticker)
+        self.api_calls -= len(tickers)
+        return tickers
+
+    def GetRecords(self, period=PERIOD_D1, *args):
+        self.api_calls += 1
+        if period != PERIOD_D1:
+            raise Exception(f"模拟器只支持日线K线, period={period}")
+        return [dict(r) for r in self._market().daily]
+
+    def GetMarkets(self):
+        self.api_calls += 1
+        return {f"{m.symbol}.swap": {
+            'Symbol': f"{m.symbol}.swap", 'PricePrecision': m.spec.price_precision,
+            'AmountPrecision': m.spec.amount_precision, 'MinQty': m.spec.min_qty,
+            'TickSize': m.spec.tick_size,
+        } for m in self.markets.values()}
+
+    def GetAccount(self):
+        self.api_calls += 1
+        return {'Balance': self.balance, 'Equity': self.balance + self._unrealized(), 'FrozenBalance': 0}
+
+    def _unrealized(self):
+        return sum((m.price - m.avg_price) * m.position for m in self.markets.values() if m.position)
+
+    def _position_list(self, m):
+        if m.position == 0:
+            return []
+        return [{
+            'Symbol': f"{m.symbol}.swap", 'Type': PD_LONG if m.position > 0 else PD_SHORT,
+            'Amount': abs(m.position), 'FrozenAmount': 0, 'Price': m.avg_price,
+            'Profit': (m.price - m.avg_price) * m.position, 'MarginLevel': 1, 'ContractType': "swap",
+        }]
+
+    def GetPosition(self):
+        self.api_calls += 1
+        return self._position_list(self._market())
+
+    def GetPositions(self, symbol=None):
+        """symbol: 为空返回全部, "USDT.swap" 按计价币种过滤, "BTC_USDT.swap" 按交易对过滤"""
+        self.api_calls += 1
+        markets = self.markets.values()
+        if symbol:
+            name = symbol.split(".")[0]
+            if "_" in name:
+                markets = [self.markets[name]]
+            else:
+                markets = [m for m in markets if m.symbol.split("_")[1] == name]
+        return [p for m in markets for p in self._position_list(m)]
+
+    def _order_view(self, o):
+        return {'Id': o['id'], 'Price': o['price'], 'Amount': o['qty'], 'DealAmount': o.get('deal', 0),
+                'Type': ORDER_TYPE_BUY if o['side'] == "BUY" else ORDER_TYPE_SELL,
+                'Status': o['status'], 'Symbol': f"{o['symbol']}.swap", 'ClientOrderId': o['client_id']}
+
+    def GetOrders(self, symbol=None):
+        self.api_calls += 1
+        return [self._order_view(o) for o in self._market(symbol).orders]
+
+    def _place(self, side, price, amount, args, client_id="", m=None):
+        m = m or self._market()
+        reduce_only = "reduce_only" in args
+        amount = float(amount)
+        if reduce_only and (m.position == 0 or (m.position > 0) == (side == "BUY")):
+            return None  # 币安 -2022: ReduceOnly Order is rejected
+        oid = f"{m.symbol}.swap,{self._new_id()}"
+        order = {'id': oid, 'symbol': m.symbol, 'side': side, 'price': float(price), 'qty': amount,
+                 'reduce_only': reduce_only, 'status': ORDER_STATE_PENDING, 'client_id': client_id}
+        if client_id:
+            self.client_orders[client_id] = order
+        if price == -1:
+            order['deal'] = self._fill(m, side, amount, self._market_price(m, side), "MARKET", reduce_only, tag=client_id)
+            order['status'] = ORDER_STATE_CLOSED
+            return oid
+        marketable = m.price <= price if side == "BUY" else m.price >= price
+        if marketable:
+            # 立即成交的限价单按吃单价成交
+            order['deal'] = self._fill(m, side, amount, m.price, "LIMIT", reduce_only, tag=client_id)
+            order['status'] = ORDER_STATE_CLOSED
+            return oid
+        m.orders.append(order)
+        return oid
+
+    def Buy(self, price, amount, *args):
+        self.api_calls += 1
+        return self._place("BUY", price, amount, args)
+
+    def Sell(self, price, amount, *args):
+        self.api_calls += 1
+        return self._place("SELL", price, amount, args)
+
+    def CancelOrder(self, order_id, *args):
+        self.api_calls += 1
+        for m in self.markets.values():
+            for o in m.orders:
+                if o['id'] == order_id:
+                    o['status'] = ORDER_STATE_CANCELED
+                    m.orders.remove(o)
+                    return True
+        return False
+
+    def Go(self, method, *args):
+        """exchange.Go: 模拟器中同步执行, 返回可 wait() 的句柄"""
+        try:
+            return SimGoHandle(getattr(self, method)(*args))
+        except Exception:
+            return SimGoHandle(None)
+
+    def IO(self, kind, *args):
+        if kind == "push":
+            self.notifications.append(args[0])
+            return True
+        if kind == "send_email":
+            self.notifications.append(" ".join(str(a) for a in args))
+            return True
+        if kind != "api":
+            raise Exception(f"模拟器不支持 IO({kind})")
+        self.api_calls += 1
+        method, endpoint = args[0], args[1]
+        params = dict(parse_qsl(args[2])) if len(args) > 2 and args[2] else {}
+        handler = self.API_ROUTES.get((method, endpoint))
+        if not handler:
+            raise Exception(f"模拟器不支持 {method} {endpoint}")
+        ret = handler(self, params)
+        if self.drop_responses > 0 and method == "POST":
+            # 模拟超时: 请求已在交易所执行, 但响应丢失
+            self.drop_responses -= 1
+            raise Exception("Post request timeout")
+        return ret
+
+    # ---------- 币安REST接口 ----------
+    def _decimal(self, params, key):
+        """按币安规则解析数值参数, 非定点小数 (如 1e-05) 报 -1100"""
+        text = params.get(key, "0")
+        if not self.DECIMAL.match(text):
+            raise Exception(f'{{"code":-1100,"msg":"Illegal characters found in parameter \'{key}\'."}}')
+        return float(text)
+
+    def _api_algo_order(self, params):
+        m = self.by_api[params['symbol']]
+        reduce_only = params.get('reduceOnly') == "true"
+        side = params['side']
+        if reduce_only and (m.position == 0 or (m.position > 0) == (side == "BUY")):
+            raise Exception('{"code":-2022,"msg":"ReduceOnly Order is rejected."}')
+        self._check_client_id(params.get('clientAlgoId', ""), algo=True)
+        algo = {
+            'algoId': self._new_id(), 'symbol': m.symbol, 'side': side, 'type': params['type'],
+            'qty': self._decimal(params, 'quantity'), 'reduce_only': reduce_only, 'status': "NEW",
+            'trigger': self._decimal(params, 'triggerPrice'), 'activate': self._decimal(params, 'activatePrice'),
+            'rate': self._decimal(params, 'callbackRate'), 'active': False, 'extreme': 0.0,
+            'client_id': params.get('clientAlgoId', ""),
+        }
+        m.algo_orders.append(algo)
+        if algo['client_id']:
+            self.client_algo_orders[algo['client_id']] = algo
+        # 挂单后立即按当前价检查一次 (如止损价已被穿越, 按当前价成交)
+        self.match(m, continuous=False)
+        return {'algoId': algo['algoId'], 'clientAlgoId': algo['client_id'], 'algoStatus': algo['status'],
+                'symbol': m.symbol_api, 'side': side, 'orderType': algo['type']}
+
+    def _check_client_id(self, client_id, algo=False):
+        """客户端订单ID在挂单中必须唯一 (币安 -4116)"""
+        if algo:
+            dup = any(a['client_id'] == client_id for m in self.markets.values() for a in m.algo_orders)
+        else:
+            o = self.client_orders.get(client_id)
+            dup = o is not None and o['status'] == ORDER_STATE_PENDING
+        if client_id and dup:
+            raise Exception('{"code":-4116,"msg":"ClientOrderId is duplicated."}')
+
+    def _rest_order_view(self, m, o):
+        """普通订单的币安REST格式"""
+        status = {ORDER_STATE_PENDING: "NEW", ORDER_STATE_CLOSED: "FILLED"}.get(o['status'], "CANCELED")
+        return {'orderId': int(o['id'].split(",")[1]), 'clientOrderId': o['client_id'], 'symbol': m.symbol_api,
+                'side': o['side'], 'type': "MARKET" if o['price'] == -1 else "LIMIT", 'price': str(o['price']),
+                'origQty': str(o['qty']), 'executedQty': str(o.get('deal', 0)), 'status': status}
+
+    def _api_order(self, params):
+        m = self.by_api[params['symbol']]
+        client_id = params.get('newClientOrderId') or f"sim{self.next_id}"  # 未指定时由交易所生成
+        self._check_client_id(client_id)
+        args = ("reduce_only",) if params.get('reduceOnly') == "true" else ()
+        price = -1 if params['type'] == "MARKET" else self._decimal(params, 'price')
+        oid = self._place(params['side'], price, self._decimal(params, 'quantity'), args, client_id, m)
+        if oid is None:
+            raise Exception('{"code":-2022,"msg":"ReduceOnly Order is rejected."}')
+        return self._rest_order_view(m, self.client_orders[client_id])
+
+    def _api_query_order(self, params):
+        m = self.by_api[params['symbol']]
+        o = self.client_orders.get(params.get('origClientOrderId', ""))
+        if not o or o['symbol'] != m.symbol:
+            raise Exception('{"code":-2013,"msg":"Order does not exist."}')
+        return self._rest_order_view(m, o)
+
+    def _api_cancel_order(self, params):
+        m = self.by_api[params['symbol']]
+        o = self.client_orders.get(params.get('origClientOrderId', ""))
+        if not o or o['symbol'] != m.symbol or o['status'] != ORDER_STATE_PENDING:
+            raise Exception('{"code":-2011,"msg":"Unknown order sent."}')
+        o['status'] = ORDER_STATE_CANCELED
+        m.orders.remove(o)
+        return self._rest_order_view(m, o)
+
+    def _api_query_algo_order(self, params):
+        client_id = params.get('clientAlgoId', "")
+        a = self.client_algo_orders.get(client_id)
+        if not a:
+            raise Exception('{"code":-2013,"msg":"Order does not exist."}')
+        return {'algoId': a['algoId'], 'clientAlgoId': client_id, 'symbol': self.markets[a['symbol']].symbol_api,
+                'side': a['side'], 'orderType': a['type'], 'algoStatus': a['status']}
+
+    def _api_cancel_algo_order(self, params):
+        a = self.client_algo_orders.get(params.get('clientAlgoId', ""))
+        m = self.markets[a['symbol']] if a else None
+        if not a or a not in m.algo_orders:
+            raise Exception('{"code":-2011,"msg":"Unknown order sent."}')
+        a['status'] = "CANCELED"
+        m.algo_orders.remove(a)
+        return {'algoId': a['algoId'], 'clientAlgoId': a['client_id'], 'code': "200", 'msg': "success"}
+
+    def _api_klines(self, params):
+        """最近的1分钟K线 (只支持 interval=1m)"""
+        if params.get('interval') != "1m":
+            raise Exception(f"模拟器只支持1分钟K线: {params.get('interval')}")
+        bars = list(self.by_api[params['symbol']].minutes)[-int(params.get('limit', 500)):]
+        return [[t, str(o), str(h), str(l), str(c), "0", t + 59999] for t, o, h, l, c in bars]
+
+    def _api_batch_orders(self, params):
+        orders = json.loads(params['batchOrders'])
+        if len(orders) > 5:
+            raise Exception('{"code":-1130,"msg":"Data sent for parameter batchOrders is not valid."}')
+        ret = []
+        for o in orders:
+            try:
+                ret.append(self._api_order(o))
+            except Exception as e:
+                ret.append(json.loads(str(e)))
+        return ret
+
+    def _api_cancel_all_open_orders(self, params):
+        m = self.by_api[params['symbol']]
+        for o in m.orders:
+            o['status'] = ORDER_STATE_CANCELED
+        m.orders = []
+        return {'code': 200, 'msg': "The operation of cancel all open order is done."}
+
+    def _api_cancel_algo_open_orders(self, params):
+        m = self.by_api[params['symbol']]
+        for a in m.algo_orders:
+            a['status'] = "CANCELED"
+        m.algo_orders = []
+        return {'code': 200, 'msg': "The operation of cancel all open order is done."}
+
+    def _api_open_algo_orders(self, params):
+        markets = [self.by_api[params['symbol']]] if 'symbol' in params else self.markets.values()
+        return [{'algoId': a['algoId'], 'clientAlgoId': a['client_id'], 'symbol': m.symbol_api,
+                 'side': a['side'], 'orderType': a['type'], 'quantity': str(a['qty']),
+                 'triggerPrice': str(a['trigger']), 'algoStatus': a['status']}
+                for m in markets for a in m.algo_orders]
+
+    def _api_listen_key(self, params):
+        return {'listenKey': "simulated"}
+
+    API_ROUTES = {
+        ("POST", "/fapi/v1/order"): _api_order,
+        ("GET", "/fapi/v1/order"): _api_query_order,
+        ("DELETE", "/fapi/v1/order"): _api_cancel_order,
+        ("POST", "/fapi/v1/algoOrder"): _api_algo_order,
+        ("GET", "/fapi/v1/algoOrder"): _api_query_algo_order,
+        ("DELETE", "/fapi/v1/algoOrder"): _api_cancel_algo_order,
+        ("POST", "/fapi/v1/batchOrders"): _api_batch_orders,
+        ("DELETE", "/fapi/v1/allOpenOrders"): _api_cancel_all_open_orders,
+        ("DELETE", "/fapi/v1/algoOpenOrders"): _api_cancel_algo_open_orders,
+        ("GET", "/fapi/v1/openAlgoOrders"): _api_open_algo_orders,
+        ("GET", "/fapi/v1/klines"): _api_klines,
+        ("POST", "/fapi/v1/listenKey"): _api_listen_key,
+        ("PUT", "/fapi/v1/listenKey"): _api_listen_key,
+    }
+
+
+class SimGoHandle:
+    """exchange.Go 返回的句柄"""
+    def __init__(self, result):
+        self.result = result
+
+    def wait(self, timeout=None):
+        return self.result, True
+
+
+class SimEventSource:
+    """模拟用户数据流 - 与 UserDataStream 接口一致, 推送撮合引擎产生的事件"""
+    def __init__(self, sim):
+        self.sim = sim
+
+    def connect(self):
+        return True
+
+    def close(self):
+        pass
+
+    def poll(self, timeout_ms):
+        events = self.sim.exchange.events
+        if not events:
+            self.sim.sleep(timeout_ms)
+            return []
+        batch = list(events)
+        events.clear()
+        return batch
+
+
+class SimPriceSource:
+    """模拟行情流 - 与 PriceStream 接口一致, 订阅交易对的价格每次变化推送一条"""
+    def __init__(self, sim):
+        self.sim = sim
+        self.symbol = ""
+        self.last = None
+
+    def watch(self, symbol_api):
+        if symbol_api != self.symbol:
+            self.symbol = symbol_api
+            self.last = None
+        return symbol_api in self.sim.exchange.by_api
+
+    def connect(self):
+        return True
+
+    def close(self):
+        pass
+
+    def poll(self, timeout_ms):
+        market = self.sim.exchange.by_api.get(self.symbol)
+        if market is None or market.price == self.last:
+            self.sim.sleep(timeout_ms)
+            return []
+        self.last = market.price
+        return [(self.sim.now, market.price)]
+
+
+# ============================================================
+# 4. 模拟器
+# ============================================================
+class Simulator:
+    """
+    离线运行环境: 模拟时钟 + SimExchange + FMZ全局函数
+    specs: {symbol: MarketSpec}
+    log_level: 0=不记录日志, 1=记录到 self.logs, 2=同时打印
+    """
+    def __init__(self, specs, start_time=0, log_level=1, **exchange_kwargs):
+        self.now = start_time
+        self.log_level = log_level
+        self.logs = []
+        self.status = ""
+        self.commands = deque()
+        self.store = {}
+        self.exchange = SimExchange(self, specs, **exchange_kwargs)
+
+    # ---------- 驱动 ----------
+    def step(self, symbol, t, price):
+        """推进到时间t(毫秒)并以price撮合"""
+        if t > self.now:
+            self.now = t
+        self.exchange.set_price(symbol, price)
+
+    def sleep(self, ms):
+        """模拟Sleep: 只推进时钟"""
+        self.now += ms
+
+    def push_command(self, cmd):
+        """模拟界面按钮, 下一次 GetCommand() 返回"""
+        self.commands.append(cmd)
+
+    def event_source(self):
+        """供事件驱动模式使用的用户数据流"""
+        self.exchange.record_events = True
+        return SimEventSource(self)
+
+    def price_source(self):
+        """供程序内触发监控使用的行情流"""
+        return SimPriceSource(self)
+
+    # ---------- FMZ全局 ----------
+    def log(self, *args):
+        if self.log_level:
+            line = " ".join(str(a) for a in args)
+            self.logs.append((self.now, line))
+            if self.log_level > 1:
+                print(f"[{self._fmt_time()}] {line}")
+
+    def _fmt_time(self, ts=None):
+        ts = self.now if ts is None else ts
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts / 1000))
+
+    def _log_status(self, *args):
+        self.status = " ".join(str(a) for a in args)
+
+    def _get_command(self):
+        return self.commands.popleft() if self.commands else None
+
+    def _g(self, key=None, value=None):
+        """_G: 持久化键值存储 (模拟器中保存在内存)"""
+        if key is None:
+            self.store.clear()
+            return None
+        if value is None:
+            return self.store.get(key)
+        self.store[key] = value
+        return value
+
+    def globals(self):
+        """构造策略运行所需的全局命名空间"""
+        def _C(func, *args):
+            for _ in range(3):
+                ret = func(*args)
+                if ret is not None:
+                    return ret
+            return ret
+
+        return {
+            '__builtins__': __builtins__,
+            'exchange': self.exchange, 'exchanges': [self.exchange],
+            '_C': _C, '_N': _N, '_D': self._fmt_time, '_G': self._g,
+            'Sleep': self.sleep, 'Log': self.log, 'LogStatus': self._log_status,
+            'GetCommand': self._get_command, 'TA': _TA,
+            'Unix': lambda: int(self.now // 1000), 'UnixNano': lambda: int(self.now * 1000000),
+            'PD_LONG': PD_LONG, 'PD_SHORT': PD_SHORT,
+            'ORDER_TYPE_BUY': ORDER_TYPE_BUY, 'ORDER_TYPE_SELL': ORDER_TYPE_SELL,
+            'ORDER_STATE_PENDING': ORDER_STATE_PENDING, 'ORDER_STATE_CLOSED': ORDER_STATE_CLOSED,
+            'ORDER_STATE_CANCELED': ORDER_STATE_CANCELED,
+            'PERIOD_M1': PERIOD_M1, 'PERIOD_H1': PERIOD_H1, 'PERIOD_D1': PERIOD_D1,
+        }
+
+    def load_template(self, path=TEMPLATE_FILE):
+        """执行模板类库 (trading_utils.py), 返回导出了工具类的ext对象"""
+        ns = self.globals()
+        ns['ext'] = _Ext()
+        ns['__name__'] = "fmz_template"
+        exec(_compiled(path), ns)
+        _isolate_caches(ns)
+        return ns['ext']
+
+    def load_strategy(self, path, template_path=TEMPLATE_FILE):
+        """
+        在模拟环境中加载策略文件 (不执行main), 返回策略模块的全局命名空间
+        策略源码不做任何修改
+        """
+        ns = self.globals()
+        ns['ext'] = self.load_template(template_path)
+        ns['__name__'] = "fmz_strategy"
+        exec(_compiled(path), ns)
+        _isolate_caches(ns)
+        return ns
@@ -1,5 +1,12 @@
+import threading
 import time
 import json
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 # ============================================================
 # 基于交易所挂单的趋势策略
 # 核心思想: 通过交易所原生订单(止损单、跟踪单、限价单)实现策略
@@ -74,9 +81,28 @@ else:
 # 1. 通知管理类
 # ============================================================
 class NotificationManager:
-    """管理邮件和APP推送通知"""
+    """
+    管理邮件和APP推送通知
+    send_notification() 只把消息放入有界队列后立即返回, 由后台线程调用 IO 发送, 下单路径不等待推送/邮件:
+    - 队列中只有一条时立即发送; 发送期间又积压了多条时等待 COALESCE_WINDOW, 按标题 (含币种) 合并发送
+    - 队列满时丢弃最早的消息; 推送/邮件各自失败退避重试, stats 记录发送/合并/丢弃/失败次数和延迟
+    - 后台线程不调用 Log, 发送结果放入 results, 由主循环调用 flush() 输出日志
+    ASYNC=False 时在调用处同步发送
+    """
+    ASYNC = True
+    MAX_QUEUE = 100          # 队列上限(条)
+    COALESCE_WINDOW = 1000   # 合并窗口(毫秒)
+    MAX_RETRIES = 3
+    RETRY_DELAY = 1000       # 首次重试等待(毫秒), 之后翻倍
+
     def __init__(self, exchange_obj):
         self.ex = exchange_obj
+        self.queue = deque()
+        self.results = deque()  # 待主循环输出的发送结果 (日志内容, 颜色)
+        self.cond = threading.Condition()
+        self.worker = None
+        self.stats = {'queued': 0, 'sent': 0, 'merged': 0, 'dropped': 0, 'failed': 0,
+                      'delay_total': 0, 'delay_max': 0}
 
     def send_notification(self, title, message):
         """
@@ -84,19 +110,100 @@ class NotificationManager:
         title: 通知标题
         message: 通知内容
         """
-        try:
-            # 发送APP推送
-            self.ex.IO("push", f"{title}\n{message}")
-            Log(f"📱 APP通知已发送: {title}")
-        except Exception as e:
-            Log(f"⚠️ APP推送失败: {e}", "#FF9900")
+        item = (title, message, time.time())
+        if not self.ASYNC:
+            self._send([item])
+            self.flush()
+            return
+        with self.cond:
+            if len(self.queue) >= self.MAX_QUEUE:
+                self.queue.popleft()
+                self.stats['dropped'] += 1
+            self.queue.append(item)
+            self.stats['queued'] += 1
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="notify", daemon=True)
+                self.worker.start()
+            self.cond.notify()
 
-        try:
-            # 发送邮件
-            self.ex.IO("send_email", title, message)
-            Log(f"📧 邮件通知已发送: {title}")
-        except Exception as e:
-            Log(f"⚠️ 邮件发送失败: {e}", "#FF9900")
+    def _run(self):
+        """后台发送线程"""
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                if len(self.queue) > 1:
+                    # 突发: 等待合并窗口结束, 期间到达的消息一并合并
+                    self.cond.wait(self.COALESCE_WINDOW / 1000)
+                batch = list(self.queue)
+                self.queue.clear()
+            self._send(batch)
+
+    def _send(self, batch):
+        """按标题分组发送, 同一标题的多条合并为一条"""
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[0], []).append(item)
+        for group in groups.values():
+            self._deliver(group)
+
+    def flush(self):
+        """输出后台线程的发送结果 (主循环调用)"""
+        while self.results:
+            text, color = self.results.popleft()
+            if color:
+                Log(text, color)
+            else:
+                Log(text)
+
+    def _retry(self, name, func):
+        """调用失败时退避重试, 返回是否成功"""
+        delay = self.RETRY_DELAY
+        for attempt in range(self.MAX_RETRIES):
+            try:
+                func()
+                return True
+            except Exception as e:
+                if attempt == self.MAX_RETRIES - 1:
+                    self.results.append((f"⚠️ {name}失败: {e}", "#FF9900"))
+                    return False
+                time.sleep(delay / 1000)
+                delay *= 2
+
+    def _deliver(self, batch):
+        """发送同一标题的一批消息 (多条时合并)"""
+        title = batch[0][0]
+        if len(batch) == 1:
+            message = batch[0][1]
+        else:
+            title = f"{title} ({len(batch)}条)"
+            message = "\n\n".join(m for _, m, _ in batch)
+            self.stats['merged'] += len(batch) - 1
+
+        # 发送APP推送
+        pushed = self._retry("APP推送", lambda: self.ex.IO("push", f"{title}\n{message}"))
+        if pushed:
+            self.results.append((f"📱 APP通知已发送: {title}", ""))
+        # 发送邮件
+        mailed = self._retry("邮件发送", lambda: self.ex.IO("send_email", title, message))
+        if mailed:
+            self.results.append((f"📧 邮件通知已发送: {title}", ""))
+
+        if not (pushed or mailed):
+            self.stats['failed'] += len(batch)
+            return
+        now = time.time()
+        for _, _, queued_at in batch:
+            delay_ms = (now - queued_at) * 1000
+            self.stats['delay_total'] += delay_ms
+            self.stats['delay_max'] = max(self.stats['delay_max'], delay_ms)
+        self.stats['sent'] += len(batch)
+
+    def report(self):
+        st = self.stats
+        avg = st['delay_total'] / st['sent'] if st['sent'] else 0
+        return (f"通知: 入队{st['queued']} 发送{st['sent']} 合并{st['merged']} 丢弃{st['dropped']} 失败{st['failed']}"
+                f" 待发{len(self.queue)} | 延迟 平均{avg:.0f}ms 最大{st['delay_max']:.0f}ms")
 
 # ============================================================
 # 2. 交易所订单管理类
@@ -293,42 +400,187 @@ class OrderManager:
 # ============================================================
 # 3. ATR计算工具
 # ============================================================
-def get_atr(exchange, symbol, period=20, exclude_today=True):
+class ATRService:
     """
-    获取ATR值
-    exclude_today: True时排除今日K线,使用前20日数据
+    日线ATR增量缓存
+    每个 (币种, 周期) 只保存已收盘日线的递推状态 (最后K线时间/收盘价/ATR/计数)，
+    与 TA.ATR 使用相同递推: 前period根为TR累计均值, 之后按Wilder平滑
+    - 同一UTC日内重复查询直接返回缓存，不请求K线
+    - UTC日切换后只追加新收盘的日线，每根O(1)
+    - 状态写入 CACHE_FILE，重启后同样只补齐缺失的日线
     """
-    try:
+    CACHE_FILE = "atr_cache.json"
+    DAY_MS = 86400000
+
+    def __init__(self, exchange_obj):
+        self.ex = exchange_obj
+        self.states = self.load_cache()
+
+    def load_cache(self):
+        """加载缓存"""
+        try:
+            with open(self.CACHE_FILE, 'r') as f:
+                return json.load(f)
+        except:
+            return {}
+
+    def save_cache(self):
+        """保存缓存"""
+        try:
+            with open(self.CACHE_FILE, 'w') as f:
+                json.dump(self.states, f, indent=2)
+        except:
+            pass
+
+    @staticmethod
+    def _true_range(records):
+        """TR序列: 首根为 High-Low, 之后取三者最大值 (有numpy时向量化计算)"""
+        if np is not None:
+            high = np.array([r['High'] for r in records], dtype=float)
+            low = np.array([r['Low'] for r in records], dtype=float)
+            close = np.array([r['Close'] for r in records], dtype=float)
+            tr = high - low
+            prev_close = close[:-1]
+            tr[1:] = np.maximum(tr[1:], np.maximum(np.abs(high[1:] - prev_close), np.abs(prev_close - low[1:])))
+            return tr.tolist()
+        tr = []
+        prev_close = None
+        for r in records:
+            if prev_close is None:
+                tr.append(r['High'] - r['Low'])
+            else:
+                tr.append(max(r['High'] - r['Low'], abs(r['High'] - prev_close), abs(prev_close - r['Low'])))
+            prev_close = r['Close']
+        return tr
+
+    @staticmethod
+    def _step(state, tr, period):
+        """递推一根K线 (返回新ATR, 不修改state)"""
+        count = state['count']
+        if count < period:
+            return (state['sum'] + tr) / (count + 1)
+        return ((period - 1) * state['atr'] + tr) / period
+
+    def _append(self, state, bar, period):
+        """追加一根已收盘日线"""
+        tr = max(bar['High'] - bar['Low'], abs(bar['High'] - state['close']), abs(state['close'] - bar['Low']))
+        state['atr'] = self._step(state, tr, period)
+        state['sum'] += tr
+        state['count'] += 1
+        state['time'] = bar['Time']
+        state['close'] = bar['Close']
+
+    def _build(self, closed, period):
+        """从完整的已收盘日线重建状态"""
+        state = {'time': 0, 'close': 0.0, 'atr': 0.0, 'sum': 0.0, 'count': 0}
+        for tr in self._true_range(closed):
+            state['atr'] = self._step(state, tr, period)
+            state['sum'] += tr
+            state['count'] += 1
+        state['time'] = closed[-1]['Time']
+        state['close'] = closed[-1]['Close']
+        return state
+
+    def _fetch_records(self, symbol):
         # 必须先设置合约类型，再设置币种
-        exchange.SetContractType("swap")
-        exchange.SetCurrency(symbol)
+        self.ex.SetContractType("swap")
+        self.ex.SetCurrency(symbol)
         # 使用 _C() 包装 GetRecords，提供自动重试机制
-        records = _C(exchange.GetRecords, PERIOD_D1)
-        if not records or len(records) < period + 2:
-            Log(f"⚠️ K线数据不足: 需要{period+2}根，实际{len(records) if records else 0}根")
+        return _C(self.ex.GetRecords, PERIOD_D1)
+
+    def _update(self, key, records, period, today_start):
+        """用新拉取的日线更新状态, 数据不足时返回None"""
+        closed = [r for r in records if r['Time'] < today_start]
+        if len(closed) < period + 1:
+            Log(f"⚠️ K线数据不足: 需要{period+1}根已收盘日线，实际{len(closed)}根")
             return None
-        atr_array = TA.ATR(records, period)
-        if exclude_today:
-            # 使用倒数第2根K线(昨日)的ATR, 排除今日未完成K线
-            return atr_array[-2]
+        state = self.states.get(key)
+        times = [r['Time'] for r in closed]
+        if state and state['time'] in times:
+            # 只追加缓存之后新收盘的日线
+            for bar in closed[times.index(state['time']) + 1:]:
+                self._append(state, bar, period)
         else:
-            return atr_array[-1]
-    except Exception as e:
-        Log(f"❌ ATR计算失败: {e}")
-        return None
+            state = self._build(closed, period)
+        self.states[key] = state
+        self.save_cache()
+        return state
+
+    def get_atr(self, symbol, period=20, exclude_today=True):
+        """
+        获取ATR值
+        exclude_today: True时使用昨日收盘的ATR (同一UTC日内命中缓存)；
+                       False时包含今日未完成K线, 需要拉取一次日线
+        """
+        try:
+            key = f"{symbol}:{period}"
+            today_start = int(UnixNano() / 1000000 // self.DAY_MS) * self.DAY_MS
+            state = self.states.get(key)
+            if exclude_today and state and state['time'] >= today_start - self.DAY_MS:
+                return state['atr']
+            records = self._fetch_records(symbol)
+            if not records:
+                Log(f"⚠️ K线数据不足: 需要{period+1}根已收盘日线，实际0根")
+                return None
+            state = self._update(key, records, period, today_start)
+            if not state:
+                return None
+            if exclude_today:
+                return state['atr']
+            today = records[-1]
+            if today['Time'] < today_start:
+                return state['atr']
+            tr = max(today['High'] - today['Low'], abs(today['High'] - state['close']), abs(state['close'] - today['Low']))
+            return self._step(state, tr, period)
+        except Exception as e:
+            Log(f"❌ ATR计算失败: {e}")
+            return None
+
+    def prefetch(self, symbols, period=20):
+        """启动时预热常用币种, 之后开仓确认无需等待K线请求; 结束后恢复原合约类型和交易对"""
+        contract_type = self.ex.GetContractType()
+        current = self.ex.GetCurrency()
+        for symbol in symbols:
+            self.get_atr(symbol, period)
+        # 恢复原合约类型和交易对 (同样先设置合约类型, 再设置币种)
+        if contract_type:
+            self.ex.SetContractType(contract_type)
+        self.ex.SetCurrency(current)
+
+
+_atr_service = None
+
+
+def get_atr_service(exchange):
+    """同一交易所对象共享一个 ATRService"""
+    global _atr_service
+    if _atr_service is None or _atr_service.ex is not exchange:
+        _atr_service = ATRService(exchange)
+    return _atr_service
+
+
+def get_atr(exchange, symbol, period=20, exclude_today=True):
+    """
+    获取ATR值
+    exclude_today: True时排除今日K线,使用前20日数据
+    """
+    return get_atr_service(exchange).get_atr(symbol, period, exclude_today)
 
 # ============================================================
 # 4. 精度管理 (复用all_in_one的逻辑)
 # ============================================================
-class PrecisionManager:
-    """管理交易精度"""
+class MarketInfoStore:
+    """
+    交易对元数据 (价格/数量精度、最小下单量、最小价格变动)
+    一次 GetMarkets 快照索引全部永续合约，查询为内存字典命中；数据有变化时才写入 CACHE_FILE
+    """
     CACHE_FILE = "precision_cache.json"
-    def __init__(self, exchange):
-        self.ex = exchange
-        self.price_precision = 2
-        self.amount_precision = 4
-        self.min_amount = 0.00001
-        self.tick_size = 0.01
+    TTL = 6 * 3600 * 1000          # 快照有效期(毫秒)
+    MISS_REFRESH_INTERVAL = 60000  # 未命中时两次拉取的最小间隔(毫秒)
+    def __init__(self, exchange_obj):
+        self.ex = exchange_obj
+        self.markets = self.load_cache()
+        self.updated = 0
     def load_cache(self):
         """加载缓存"""
         try:
@@ -336,51 +588,72 @@ class PrecisionManager:
                 return json.load(f)
         except:
             return {}
-    def save_cache(self, cache):
+    def save_cache(self):
         """保存缓存"""
         try:
             with open(self.CACHE_FILE, 'w') as f:
-                json.dump(cache, f, indent=2)
+                json.dump(self.markets, f, indent=2)
         except:
             pass
-    def set_precision(self, symbol):
-        """设置精度"""
-        cache = self.load_cache()
-        # 检查缓存
-        if symbol in cache:
-            data = cache[symbol]
-            self.price_precision = int(data['price_precision'])
-            self.amount_precision = int(data['amount_precision'])
-            self.min_amount = float(data['min_amount'])
-            self.tick_size = float(data['tick_size'])
-            Log(f"💾 [{symbol}] 从缓存加载精度")
-            return True
-        # 从交易所获取
+    def refresh(self):
+        """拉取 GetMarkets 快照并重建索引"""
         try:
-            markets = _C(self.ex.GetMarkets)
-            lookup_symbol = f"{symbol}.swap"
-            target = markets.get(lookup_symbol)
-            if target:
-                self.price_precision = int(target['PricePrecision'])
-                self.amount_precision = int(target['AmountPrecision'])
-                self.min_amount = float(target['MinQty'])
-                self.tick_size = float(target['TickSize'])
-                # 保存缓存
-                cache[symbol] = {
-                    'price_precision': self.price_precision,
-                    'amount_precision': self.amount_precision,
-                    'min_amount': self.min_amount,
-                    'tick_size': self.tick_size
-                }
-                self.save_cache(cache)
-                Log(f"✅ [{symbol}] 精度获取成功")
-                return True
-            else:
-                Log(f"❌ 无法获取 {lookup_symbol} 精度")
-                return False
+            snapshot = _C(self.ex.GetMarkets)
         except Exception as e:
             Log(f"❌ 精度获取失败: {e}")
             return False
+        self.updated = UnixNano() / 1000000
+        if not snapshot:
+            return False
+        markets = dict(self.markets)
+        for key, target in snapshot.items():
+            if not key.endswith(".swap"):
+                continue
+            markets[key[:-5]] = {
+                'price_precision': int(target['PricePrecision']),
+                'amount_precision': int(target['AmountPrecision']),
+                'min_amount': float(target['MinQty']),
+                'tick_size': float(target['TickSize'])
+            }
+        if markets != self.markets:
+            self.markets = markets
+            self.save_cache()
+        return True
+    def get(self, symbol):
+        """查询交易对元数据, 不存在返回None"""
+        elapsed = UnixNano() / 1000000 - self.updated
+        if elapsed >= self.TTL or (symbol not in self.markets and elapsed >= self.MISS_REFRESH_INTERVAL):
+            self.refresh()
+        return self.markets.get(symbol)
+
+class PrecisionManager:
+    """管理交易精度"""
+    shared_store = None
+    def __init__(self, exchange):
+        self.ex = exchange
+        self.store = PrecisionManager.get_store(exchange)
+        self.price_precision = 2
+        self.amount_precision = 4
+        self.min_amount = 0.00001
+        self.tick_size = 0.01
+    @staticmethod
+    def get_store(exchange):
+        """同一交易所对象共享一个 MarketInfoStore"""
+        store = PrecisionManager.shared_store
+        if store is None or store.ex is not exchange:
+            store = PrecisionManager.shared_store = MarketInfoStore(exchange)
+        return store
+    def set_precision(self, symbol):
+        """设置精度"""
+        data = self.store.get(symbol)
+        if not data:
+            Log(f"❌ 无法获取 {symbol}.swap 精度")
+            return False
+        self.price_precision = data['price_precision']
+        self.amount_precision = data['amount_precision']
+        self.min_amount = data['min_amount']
+        self.tick_size = data['tick_size']
+        return True
     def format_price(self, price):
         """格式化价格"""
         return _N(price, self.price_precision)
@@ -982,6 +1255,9 @@ def main():
     exchange.SetContractType("swap")
     # 初始化策略管理器
     strategy = OrderBasedStrategyManager(exchange, STRATEGY_CONFIG)
+    # 预热全部交易对精度和常用币种的ATR缓存, 开仓确认时无需再请求行情元数据
+    PrecisionManager.get_store(exchange).refresh()
+    get_atr_service(exchange).prefetch(MY_SYMBOLS, STRATEGY_CONFIG['atr_period'])
     # UI按钮配置
     btn_trade = {
         "type": "button",
@@ -1014,6 +1290,8 @@ def main():
         try:
             # 定期检查仓位变化
             strategy.check_position_and_update_state()
+            # 输出通知线程的发送结果
+            strategy.notif_mgr.flush()
             # UI渲染
             if strategy.state == "WAIT_CONFIRM":
                 confirm_info = strategy.get_confirm_info()
@@ -1043,6 +1321,7 @@ def main():
                         strategy._reset()
                     elif cmd == "ShowInfo":
                         status_display = strategy.get_status_info()
+                        Log(f"📨 {strategy.notif_mgr.report()}")
                 except Exception as e:
                     Log(f"❌ 指令处理错误: {e}", "#FF0000")
         except Exception as e:
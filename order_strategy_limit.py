@@ -12,6 +12,25 @@ import json
 MY_SYMBOLS = ["BTC_USDT", "ETH_USDT", "ETH_USDC", "SOL_USDT",
               "ZEC_USDT","1000PEPE_USDT","DOGE_USDT"
             ]
+USE_PRICE_STREAM = True      # True=行情流逐笔检查程序内触发, False=随每秒仓位检查轮询价格
+PRICE_STREAM = "aggTrade"    # 行情流类型: aggTrade(逐笔成交) / bookTicker(最优买卖价)
+CHECK_INTERVAL = 1000        # 没有运行中的交易时的检查间隔(毫秒)
+# 自适应检查间隔: 价格距最近触发价 <= POLL_NEAR_ATR 时每 POLL_FLOOR 毫秒检查一次,
+# >= POLL_FAR_ATR 时每 POLL_CEILING 毫秒, 之间线性插值
+POLL_FLOOR = 500
+POLL_CEILING = 3000
+POLL_NEAR_ATR = 0.05
+POLL_FAR_ATR = 1.0
+COMMAND_INTERVAL = 100       # 界面命令读取间隔(毫秒), 操作员点击在此时间内执行
+UI_INTERVAL = 1000           # 状态栏检查间隔(毫秒), 命令执行和仓位检查后立即检查
+UI_HEARTBEAT = 10000         # 状态栏内容未变化时的最长推送间隔(毫秒)
+PROFILE = False              # True=统计交易所调用和状态处理函数耗时 (ShowInfo查看并写入PROFILE_FILE)
+PROFILE_FILE = "latency_profile.json"
+TRIGGER_FILE = "trigger_latency.csv"  # ShowInfo时写出程序内触发单的逐条延迟/滑点记录
+# 计时的策略管理器方法 (状态处理函数)
+PROFILED_METHODS = ("check_position_and_update_state", "on_price", "_handle_wait_entry_state",
+                    "_handle_entry_done_state", "_handle_wait_exit_state", "_check_and_place_protective_sl",
+                    "_place_orders_after_base_entry", "_place_orders_after_full_position")
 
 # 策略参数（实盘）
 STRATEGY_CONFIG = {
@@ -27,6 +46,9 @@ STRATEGY_CONFIG = {
     'full_sl_atr': 0.3,     # 满仓止损: -0.3 ATR
     'trail_activation': 0.28, # 跟踪止盈激活: 0.28 ATR
     'trail_callback': 0.15,  # 跟踪止盈回调: 0.15 ATR
+    'trigger_slippage': 0.002,  # 程序内触发单按盘口定价的滑点上限: 0.2%
+    'chase_timeout': 3000,   # 触发单未成交的撤单重挂时间(毫秒)
+    'chase_max': 3,          # 限价追单次数上限, 之后剩余数量市价成交
     # 小波动模式 (0): 直接在+0.3ATR走90%
     'volatility_small': [
         {'atr': 0.3, 'pct': 0.9}
@@ -54,8 +76,14 @@ class LimitOrderStrategyManager:
         # 从模板类库导入工具类 (通过ext对象直接调用)
         self.precision_mgr = ext.PrecisionManager(exchange)
         self.order_mgr = ext.OrderManager(exchange, self.precision_mgr)
+        self.depth_pricer = ext.DepthPricer(exchange, self.precision_mgr)  # 触发单按盘口深度定价
+        self.chaser = ext.OrderChaser(self.order_mgr, self.depth_pricer, self._client_id)  # 触发单成交跟踪
         self.notif_mgr = ext.NotificationManager(exchange)
         self.atr_calc = ext.ATRCalculator
+        self.snapshot = ext.MarketSnapshot(exchange)  # 每轮循环的行情/持仓快照
+        self.price_range = ext.PriceRangeTracker(exchange)  # 两次检查之间的最高/最低价
+        # 程序内触发单的延迟与滑点记录
+        self.triggers = ext.TriggerTracker.get_default()
         # 策略状态
         self.state = "IDLE"
         self.symbol = ""
@@ -71,6 +99,9 @@ class LimitOrderStrategyManager:
         self.base_price = 0   # 底仓均价
         # 上次检查的仓位
         self.last_position_amount = 0
+        # 交易ID, 与订单腿组成客户端订单ID (确认开仓时生成)
+        self.trade_id = ""
+        self.leg_counts = {}
         # 确认信息存储
         self.pending_confirm_info = {}
         # 保护性止损标志
@@ -114,9 +145,7 @@ class LimitOrderStrategyManager:
         if self.symbol:
             # 撤销所有挂单 - 包括FMZ订单和Algo订单
             Log("🔄 撤销所有挂单...", "#FFA500")
-            self.order_mgr.cancel_all_orders(self.symbol, self.symbol_for_api)
-            Sleep(500)  # 等待撤单完成
-            # 二次确认撤单（防止网络延迟导致撤单失败）
+            # 批量撤单后轮询确认挂单已清空
             self.order_mgr.cancel_all_orders(self.symbol, self.symbol_for_api)
         self.state = "IDLE"
         self.symbol = ""
@@ -130,9 +159,14 @@ class LimitOrderStrategyManager:
         self.full_amount = 0
         self.base_price = 0
         self.last_position_amount = 0
+        self.trade_id = ""
+        self.leg_counts = {}
         self.pending_confirm_info = {}
         self.protective_sl_placed = False
         self.current_stop_loss_price = 0
+        self.snapshot.clear()
+        self.price_range.reset()
+        self.chaser.clear()
         self.entry_config = {
             'volatility_desc': '',
             'atr_mode': '',
@@ -166,6 +200,21 @@ class LimitOrderStrategyManager:
         """
         return symbol.replace("_", "")
 
+    def _client_id(self, leg):
+        """
+        订单腿的客户端订单ID (交易ID + 订单腿), 重复提交时交易所可据此去重
+        同一笔交易中同一订单腿再次挂单时追加序号 (tp1, tp1.2, ...)
+        """
+        count = self.leg_counts.get(leg, 0) + 1
+        self.leg_counts[leg] = count
+        return ext.OrderManager.client_order_id(self.trade_id, leg if count == 1 else f"{leg}.{count}")
+
+    def _place_batch(self, legs):
+        """按订单腿名称分配客户端订单ID后批量挂单"""
+        for leg in legs:
+            leg['client_id'] = self._client_id(leg['name'])
+        return self.order_mgr.place_batch(self.symbol_for_api, legs)
+
     def start_entry(self, symbol, direction_str, max_loss, entry_mode, limit_price=0, volatility_mode=1, atr_percentage=0):
         """
         启动入场流程
@@ -285,6 +334,7 @@ class LimitOrderStrategyManager:
             Log("❌ 当前不在确认状态", "#FF0000")
             return False
         Log("✅ 用户确认开仓，开始挂单", "#00FF00")
+        self.trade_id = ext.OrderManager.new_trade_id(self.symbol_for_api)
 
         # 保存入场配置信息
         info = self.pending_confirm_info
@@ -302,7 +352,7 @@ class LimitOrderStrategyManager:
         if self.entry_mode == 1:
             # 模式1: 市价入场
             Log("🚀 模式1: 市价入场")
-            res = self.order_mgr.place_market(side, base_amount)
+            res = self.order_mgr.place_market(side, base_amount, client_id=self._client_id("entry"))
             if res:
                 Log(f"✅ 市价单已提交: {res}")
                 self.state = "WAIT_ENTRY"
@@ -313,7 +363,7 @@ class LimitOrderStrategyManager:
         elif self.entry_mode == 2:
             # 模式2: 限价入场
             Log(f"📌 模式2: 限价入场 @ {self.entry_limit_price}")
-            res = self.order_mgr.place_limit(side, base_amount, self.entry_limit_price)
+            res = self.order_mgr.place_limit(side, base_amount, self.entry_limit_price, client_id=self._client_id("entry"))
             if res:
                 Log(f"✅ 限价单已提交: {res}")
                 self.state = "WAIT_ENTRY"
@@ -324,9 +374,10 @@ class LimitOrderStrategyManager:
         elif self.entry_mode == 3:
             # 模式3: 市价激活跟踪入场 - 改为程序内监控
             Log("🎣 模式3: 市价激活跟踪入场(程序监控)")
-            # 获取当前价格作为参考点
-            ticker = _C(self.ex.GetTicker)
-            current_price = ticker['Last']
+            # 以行情快照的最新价作为参考点 (确认前不做仓位检查, 快照此时为空)
+            if not self.snapshot.ticker:
+                self.snapshot.refresh()
+            current_price = self.snapshot.last
             # 回调距离 = 0.1 ATR (配置值) * ATR值
             callback_distance = self.cfg['entry_callback'] * self.atr_val
 
@@ -369,23 +420,6 @@ class LimitOrderStrategyManager:
         self._reset()
         return True
 
-    def _get_position_amount(self):
-        """获取当前持仓数量"""
-        try:
-            # 防御性编程：确保在调用GetPosition前已设置合约类型和币种
-            if self.symbol:
-                self.ex.SetContractType("swap")
-                self.ex.SetCurrency(self.symbol)
-            positions = _C(self.ex.GetPosition)
-            target_type = PD_LONG if self.direction == 1 else PD_SHORT
-            for p in positions:
-                if p['Type'] == target_type and p['Amount'] > 0:
-                    return p['Amount'], p['Price']
-            return 0, 0
-        except Exception as e:
-            Log(f"⚠️ 获取持仓失败: {e}")
-            return None, None
-
     def _send_stop_loss_notification(self, sl_price):
         """发送止损通知"""
         direction_str = "做多🟢" if self.direction == 1 else "做空🔴"
@@ -402,7 +436,7 @@ class LimitOrderStrategyManager:
             f"亏损金额: {loss_amount} USDT\n"
             f"时间: {_D()}"
         )
-        self.notif_mgr.send_notification(notif_title, notif_msg)
+        self.notif_mgr.send_notification(notif_msg, notif_title)
 
     def _send_base_entry_notification(self, current_amount, current_price):
         """发送底仓开仓通知"""
@@ -417,7 +451,7 @@ class LimitOrderStrategyManager:
             f"ATR: {self.atr_val}\n"
             f"时间: {_D()}"
         )
-        self.notif_mgr.send_notification(notif_title, notif_msg)
+        self.notif_mgr.send_notification(notif_msg, notif_title)
 
     def _send_add_position_notification(self, current_amount, current_price):
         """发送加仓通知"""
@@ -434,7 +468,7 @@ class LimitOrderStrategyManager:
             f"满仓价值: {current_amount * current_price} USDT\n"
             f"时间: {_D()}"
         )
-        self.notif_mgr.send_notification(notif_title, notif_msg)
+        self.notif_mgr.send_notification(notif_msg, notif_title)
 
     def _send_close_position_notification(self, close_price):
         """发送平仓通知"""
@@ -454,7 +488,7 @@ class LimitOrderStrategyManager:
             f"持仓数量: {self.last_position_amount}\n"
             f"时间: {_D()}"
         )
-        self.notif_mgr.send_notification(notif_title, notif_msg)
+        self.notif_mgr.send_notification(notif_msg, notif_title)
 
 
     def _handle_wait_entry_state(self, current_amount, position_price, market_price, expected_base, tolerance):
@@ -471,6 +505,83 @@ class LimitOrderStrategyManager:
             return
 
         # 2. 监控入场跟踪（仅跟踪模式）
+        self._monitor_entry_tracking(market_price)
+
+        # 3. 判断底仓是否建立: 改用市场价格判断而非仓位
+        # 如果有仓位且上次无仓位，说明刚刚建立仓位，记录底仓价格并转入ENTRY_DONE状态
+        if self.last_position_amount == 0 and current_amount > 0:
+            Log(f"✅ 底仓建立 {current_amount:.4f} @ {position_price:.2f}", "#00FF00")
+            self.base_price = position_price
+            self.last_position_amount = current_amount
+            self.state = "ENTRY_DONE"
+
+            # 发送开仓通知
+            self._send_base_entry_notification(current_amount, position_price)
+
+            # 执行步骤3的挂单动作
+            self._place_orders_after_base_entry()
+
+    def _handle_entry_done_state(self, current_amount, position_price, market_price, expected_base, expected_full, tolerance):
+        """
+        处理 ENTRY_DONE 状态: 底仓已建立，等待加仓或止损
+        包含加仓监控逻辑
+        position_price: 持仓均价
+        market_price: 实时市场价格
+        """
+        # 1. 检查仓位归零（止损触发）
+        if self.last_position_amount > 0 and current_amount == 0:
+            # 发送止损通知
+            self._send_stop_loss_notification(market_price)
+
+            Log(f"🛑 底仓止损触发，全部平仓", "#FF0000")
+            self._reset()
+            return
+
+        # 2. 监控加仓触发
+        self._monitor_add_position(market_price)
+
+        # 3. 判断加仓是否完成: 改用加仓限价单已触发 + 仓位增加来判断
+        # 只要加仓单已触发，且当前仓位大于底仓，说明加仓已完成（可能部分成交）
+        if self.add_position_monitor['triggered'] and current_amount > self.last_position_amount:
+            Log(f"✅ 加仓完成 {current_amount:.4f}", "#00FF00")
+
+            # 发送加仓通知
+            self._send_add_position_notification(current_amount, market_price)
+
+            self.last_position_amount = current_amount
+            self.state = "WAIT_EXIT"
+
+            # 执行步骤4的挂单动作
+            self._place_orders_after_full_position()
+
+    def _handle_wait_exit_state(self, current_amount, position_price, market_price):
+        """
+        处理 WAIT_EXIT 状态: 满仓已建立，等待平仓或保护性止损
+        包含跟踪止盈监控逻辑
+        position_price: 持仓均价
+        market_price: 实时市场价格
+        """
+        # 1. 检查仓位归零（最高优先级）
+        if self.last_position_amount > 0 and current_amount == 0:
+            # 发送平仓通知
+            self._send_close_position_notification(market_price)
+
+            Log(f"✅ 全部平仓，策略完成", "#00FF00")
+            self._reset()
+            return
+        
+        # 2. 监控跟踪止盈
+        self._monitor_trailing_tp(market_price, current_amount)
+
+        # 3. 检查保护性止损触发条件（仅在有仓位情况下检查）
+        if not self.protective_sl_placed and current_amount > 0:
+            self._check_and_place_protective_sl(market_price, current_amount)
+
+    def _monitor_entry_tracking(self, market_price, extreme_only=False):
+        """
+        入场跟踪监控 (模式3/4): 触达激活价后跟踪价格极值, 回调到位时以限价单入场
+        extreme_only: 只更新激活状态和极值, 不判断回调 (用于轮询间隔内的历史极值)
+        """
         track = self.entry_tracking
         # 模式4: 限价激活跟踪 - 先检查是否触达激活价
         if self.entry_mode == 4 and track['is_monitoring'] == False and track['limit_order_placed'] == False:
@@ -494,6 +605,8 @@ class LimitOrderStrategyManager:
             else:  # 做空：跟踪最高价
                 if market_price > track['price_extreme']:
                     track['price_extreme'] = market_price
+            if extreme_only:
+                return
 
             # 检查是否回调到位
             callback_happened = False
@@ -510,52 +623,24 @@ class LimitOrderStrategyManager:
                 # 计算限价单价格和数量
                 base_amount = self.precision_mgr.format_amount(self.full_amount * self.cfg['base_position_pct'])
                 side = "BUY" if self.direction == 1 else "SELL"
-                # 使用当前市场价格作为限价单价格，确保能成交
-                limit_price = self.precision_mgr.format_price(market_price)
-
-                res = self.order_mgr.place_limit(side, base_amount, limit_price)
+                # 按盘口深度定价, 在滑点上限内一次成交, 不挂在盘口等待
+                limit_price = self.depth_pricer.price(side, base_amount, market_price, self.cfg['trigger_slippage'])
+
+                rec = self.triggers.detect("entry", side, trigger_price, self.snapshot)
+                self.triggers.submit(rec, limit_price)
+                client_id = self._client_id("entry")
+                res = self.order_mgr.place_limit(side, base_amount, limit_price, client_id=client_id)
+                self.triggers.ack(rec, res, self.snapshot.last)
                 if res:
                     Log(f"✅ 限价单已提交: {res}, 价格={limit_price}")
                     # 标记已下单，避免重复下单
                     self.entry_tracking['limit_order_placed'] = True
+                    self.chaser.track("entry", client_id, side, base_amount)
                 else:
                     Log("❌ 限价单提交失败", "#FF0000")
 
-
-        # 3. 判断底仓是否建立: 改用市场价格判断而非仓位
-        # 如果有仓位且上次无仓位，说明刚刚建立仓位，记录底仓价格并转入ENTRY_DONE状态
-        if self.last_position_amount == 0 and current_amount > 0:
-            Log(f"✅ 底仓建立 {current_amount:.4f} @ {position_price:.2f}", "#00FF00")
-            self.base_price = position_price
-            self.last_position_amount = current_amount
-            self.state = "ENTRY_DONE"
-
-            # 发送开仓通知
-            self._send_base_entry_notification(current_amount, position_price)
-
-            # 执行步骤3的挂单动作
-            self._place_orders_after_base_entry()
-
-    def _handle_entry_done_state(self, current_amount, position_price, market_price, expected_base, expected_full, tolerance):
-        """
-        处理 ENTRY_DONE 状态: 底仓已建立，等待加仓或止损
-        包含加仓监控逻辑
-        position_price: 持仓均价
-        market_price: 实时市场价格
-        """
-        # 1. 检查仓位归零（止损触发）
-        if self.last_position_amount > 0 and current_amount == 0:
-            ticker = _C(self.ex.GetTicker)
-            sl_price = ticker['Last']
-
-            # 发送止损通知
-            self._send_stop_loss_notification(sl_price)
-
-            Log(f"🛑 底仓止损触发，全部平仓", "#FF0000")
-            self._reset()
-            return
-
-        # 2. 监控加仓触发
+    def _monitor_add_position(self, market_price):
+        """加仓监控: 价格越过加仓触发价时以限价单加仓"""
         if self.add_position_monitor['trigger_price'] > 0 and not self.add_position_monitor['triggered']:
             trigger_price = self.add_position_monitor['trigger_price']
             triggered = False
@@ -572,57 +657,28 @@ class LimitOrderStrategyManager:
                 add_amount = self.precision_mgr.format_amount(self.full_amount * self.cfg['add_position_pct'])
                 add_side = "BUY" if self.direction == 1 else "SELL"
 
-                # 使用当前市场价格作为限价单价格，确保能成交
-                limit_price = self.precision_mgr.format_price(market_price)
+                # 按盘口深度定价, 在滑点上限内一次成交, 不挂在盘口等待
+                limit_price = self.depth_pricer.price(add_side, add_amount, market_price, self.cfg['trigger_slippage'])
 
                 # 加仓不应使用reduce_only，因为是增加仓位
-                res = self.order_mgr.place_limit(add_side, add_amount, limit_price)
+                rec = self.triggers.detect("add", add_side, trigger_price, self.snapshot)
+                self.triggers.submit(rec, limit_price)
+                client_id = self._client_id("add")
+                res = self.order_mgr.place_limit(add_side, add_amount, limit_price, client_id=client_id)
+                self.triggers.ack(rec, res, self.snapshot.last)
                 if res:
                     Log(f"✅ 加仓限价单已提交: {res}, 价格={limit_price}")
                     # 标记为已触发，避免重复下单
                     self.add_position_monitor['triggered'] = True
+                    self.chaser.track("add", client_id, add_side, add_amount)
                 else:
                     Log("❌ 加仓限价单提交失败", "#FF0000")
 
-
-        # 3. 判断加仓是否完成: 改用加仓限价单已触发 + 仓位增加来判断
-        # 只要加仓单已触发，且当前仓位大于底仓，说明加仓已完成（可能部分成交）
-        if self.add_position_monitor['triggered'] and current_amount > self.last_position_amount:
-            Log(f"✅ 加仓完成 {current_amount:.4f}", "#00FF00")
-
-            # 获取当前价格
-            ticker = _C(self.ex.GetTicker)
-            current_price = ticker['Last']
-
-            # 发送加仓通知
-            self._send_add_position_notification(current_amount, current_price)
-
-            self.last_position_amount = current_amount
-            self.state = "WAIT_EXIT"
-
-            # 执行步骤4的挂单动作
-            self._place_orders_after_full_position()
-
-    def _handle_wait_exit_state(self, current_amount, position_price, market_price):
+    def _monitor_trailing_tp(self, market_price, current_amount, extreme_only=False):
         """
-        处理 WAIT_EXIT 状态: 满仓已建立，等待平仓或保护性止损
-        包含跟踪止盈监控逻辑
-        position_price: 持仓均价
-        market_price: 实时市场价格
+        跟踪止盈监控: 触达激活价后跟踪价格极值, 回调到位时以限价单平仓
+        extreme_only: 只更新激活状态和极值, 不判断回调 (用于轮询间隔内的历史极值)
         """
-        # 1. 检查仓位归零（最高优先级）
-        if self.last_position_amount > 0 and current_amount == 0:
-            ticker = _C(self.ex.GetTicker)
-            close_price = ticker['Last']
-
-            # 发送平仓通知
-            self._send_close_position_notification(close_price)
-
-            Log(f"✅ 全部平仓，策略完成", "#00FF00")
-            self._reset()
-            return
-        
-        # 2. 监控跟踪止盈
         # 先检查是否触达激活价
         monitor = self.trailing_tp_monitor
         if monitor['is_monitoring'] == False and monitor['limit_order_placed'] == False:
@@ -646,6 +702,8 @@ class LimitOrderStrategyManager:
             else:  # 做空：跟踪最低价
                 if market_price < monitor['price_extreme']:
                     monitor['price_extreme'] = market_price
+            if extreme_only:
+                return
 
             # 检查是否回调到位
             callback_happened = False
@@ -662,21 +720,103 @@ class LimitOrderStrategyManager:
                 # 计算限价单数量和价格
                 close_side = "SELL" if self.direction == 1 else "BUY"
                 current_amount_formatted = self.precision_mgr.format_amount(current_amount)
-                # 使用当前市场价格作为限价单价格，确保能成交
-                limit_price = self.precision_mgr.format_price(market_price)
-
-                res = self.order_mgr.place_limit(close_side, current_amount_formatted, limit_price, reduce_only=True)
+                # 按盘口深度定价, 在滑点上限内一次成交, 不挂在盘口等待
+                limit_price = self.depth_pricer.price(close_side, current_amount_formatted, market_price,
+                                                      self.cfg['trigger_slippage'])
+
+                rec = self.triggers.detect("trail_tp", close_side, trigger_price, self.snapshot)
+                self.triggers.submit(rec, limit_price)
+                client_id = self._client_id("tclose")
+                res = self.order_mgr.place_limit(close_side, current_amount_formatted, limit_price, reduce_only=True,
+                                                 client_id=client_id)
+                self.triggers.ack(rec, res, self.snapshot.last)
                 if res:
                     Log(f"✅ 跟踪止盈限价单已提交: {res}, 价格={limit_price}")
                     # 标记已下单，避免重复下单
                     self.trailing_tp_monitor['limit_order_placed'] = True
+                    self.chaser.track("tclose", client_id, close_side, current_amount_formatted, reduce_only=True)
                 else:
                     Log("❌ 跟踪止盈限价单提交失败", "#FF0000")
 
+    def _update_interval_extremes(self):
+        """
+        跟踪监控 (入场跟踪/跟踪止盈) 进行中时, 用上次检查以来的真实最高/最低价更新激活状态和价格极值,
+        随后的回调判断基于真实极值而非两次采样价; 不需要提高轮询频率
+        """
+        if self.state == "WAIT_ENTRY" and self.entry_mode in [3, 4] and not self.entry_tracking['limit_order_placed']:
+            price_low, price_high = self.price_range.update(self.symbol_for_api)
+            extreme = price_low if self.direction == 1 else price_high
+            if extreme is not None:
+                self._monitor_entry_tracking(extreme, extreme_only=True)
+        elif self.state == "WAIT_EXIT" and not self.trailing_tp_monitor['limit_order_placed']:
+            price_low, price_high = self.price_range.update(self.symbol_for_api)
+            extreme = price_high if self.direction == 1 else price_low
+            if extreme is not None:
+                self._monitor_trailing_tp(extreme, 0, extreme_only=True)
+        else:
+            self.price_range.reset()
+
+    def _check_forced_stop(self, market_price, current_amount):
+        """
+        强制止损检查: 价格越过当前止损位时撤销所有订单并市价平仓
+        返回: True=已平仓并重置策略
+        """
+        if self.current_stop_loss_price <= 0 or not current_amount or current_amount <= 0:
+            return False
+        if self.direction == 1:  # 做多：价格跌破止损位
+            sl_triggered = (market_price <= self.current_stop_loss_price)
+        else:  # 做空：价格涨破止损位
+            sl_triggered = (market_price >= self.current_stop_loss_price)
+        if not sl_triggered:
+            return False
+
+        # 强制平仓
+        Log(f"🚨 触发当前止损位 {self.current_stop_loss_price}，强制平仓", "#FF0000")
+        # 发送止损通知
+        self._send_stop_loss_notification(market_price)
 
-        # 3. 检查保护性止损触发条件（仅在有仓位情况下检查）
-        if not self.protective_sl_placed and current_amount > 0:
-            self._check_and_place_protective_sl(market_price, current_amount)
+        # 撤销所有订单并强制市价平仓 (跟踪中的触发单停止追单)
+        self.chaser.cancel()
+        self.order_mgr.cancel_all_orders(self.symbol, self.symbol_for_api)
+
+        # 强制市价平仓
+        close_side = "SELL" if self.direction == 1 else "BUY"
+        current_amount_formatted = self.precision_mgr.format_amount(current_amount)
+        res_close = self.order_mgr.place_market(close_side, current_amount_formatted, ext.RequestScheduler.PROTECT,
+                                                client_id=self._client_id("fclose"))
+        if res_close:
+            Log(f"✅ 强制市价平仓订单已提交: {res_close}")
+        else:
+            Log("❌ 强制市价平仓订单提交失败", "#FF0000")
+
+        # 轮询确认平仓完成 (退避等待, 不再固定等待2秒)
+        self.order_mgr.wait_flat()
+
+        # 重置策略
+        self._reset()
+        return True
+
+    def on_price(self, price, trade_time=0):
+        """
+        价格流回调: 每条成交价到达时立即检查强制止损和程序内触发 (入场跟踪/加仓/跟踪止盈),
+        不等待下一轮仓位检查
+        持仓数量沿用最近一次快照, 仓位变化引起的状态推进仍由 check_position_and_update_state 处理
+        trade_time: 成交时间(毫秒), 记入快照供触发延迟统计
+        """
+        if self.state not in ("WAIT_ENTRY", "ENTRY_DONE", "WAIT_EXIT"):
+            return
+        if self.snapshot.positions is None:
+            return  # 本笔交易尚未完成过一次仓位检查
+        self.snapshot.update_price(price, trade_time)
+        current_amount, _ = self.snapshot.position(self.direction)
+        if self._check_forced_stop(price, current_amount):
+            return
+        if self.state == "WAIT_ENTRY":
+            self._monitor_entry_tracking(price)
+        elif self.state == "ENTRY_DONE":
+            self._monitor_add_position(price)
+        else:
+            self._monitor_trailing_tp(price, current_amount)
 
     def check_position_and_update_state(self):
         """
@@ -691,14 +831,11 @@ class LimitOrderStrategyManager:
             self.ex.SetContractType("swap")
             self.ex.SetCurrency(self.symbol)
 
-        # 获取当前市场价格（用于监控触发）
-        ticker = _C(self.ex.GetTicker)
-        market_price = ticker['Last']
-
-        # 获取当前持仓
-        current_amount, position_price = self._get_position_amount()
-        if current_amount is None:
+        # 并发获取本轮的市场价格（用于监控触发）和持仓, 本轮处理函数都读取该快照
+        if not self.snapshot.refresh():
             return  # 获取失败，跳过本轮
+        market_price = self.snapshot.last
+        current_amount, position_price = self.snapshot.position(self.direction)
 
         # 计算预期的底仓和满仓数量
         expected_base = self.precision_mgr.format_amount(self.full_amount * self.cfg['base_position_pct'])
@@ -709,42 +846,11 @@ class LimitOrderStrategyManager:
 
         # ========== 强制止损检查 ==========
         # 在所有状态下都要检查是否触发当前止损位
-        if self.current_stop_loss_price > 0 and current_amount > 0:
-            sl_triggered = False
-            if self.direction == 1:  # 做多：价格跌破止损位
-                sl_triggered = (market_price <= self.current_stop_loss_price)
-            else:  # 做空：价格涨破止损位
-                sl_triggered = (market_price >= self.current_stop_loss_price)
-
-            if sl_triggered:
-                # 强制平仓
-                Log(f"🚨 触发当前止损位 {self.current_stop_loss_price}，强制平仓", "#FF0000")
-                # 获取当前价格用于通知
-                ticker = _C(self.ex.GetTicker)
-                sl_price = ticker['Last']
-
-                # 发送止损通知
-                self._send_stop_loss_notification(sl_price)
-
-                # 撤销所有订单并强制市价平仓
-                self.order_mgr.cancel_all_orders(self.symbol, self.symbol_for_api)
-                Sleep(500)
-
-                # 强制市价平仓
-                close_side = "SELL" if self.direction == 1 else "BUY"
-                current_amount_formatted = self.precision_mgr.format_amount(current_amount)
-                res_close = self.order_mgr.place_market(close_side, current_amount_formatted)
-                if res_close:
-                    Log(f"✅ 强制市价平仓订单已提交: {res_close}")
-                else:
-                    Log("❌ 强制市价平仓订单提交失败", "#FF0000")
-
-                # 等待平仓完成
-                Sleep(2000)
+        if self._check_forced_stop(market_price, current_amount):
+            return
 
-                # 重置策略
-                self._reset()
-                return
+        # ========== 轮询间隔内的真实极值 ==========
+        self._update_interval_extremes()
 
         # ========== 原有状态处理 ==========
         # 根据当前状态分发到对应的处理函数
@@ -755,6 +861,12 @@ class LimitOrderStrategyManager:
         elif self.state == "WAIT_EXIT":
             self._handle_wait_exit_state(current_amount, position_price, market_price)
 
+        # ========== 触发单成交跟踪 ==========
+        # 状态处理之后执行 (仓位归零重置时已停止跟踪); 超时未成交的撤单按盘口重挂, 多次未成交改为市价
+        if self.chaser.orders:
+            self.chaser.poll(market_price, self.cfg['chase_timeout'], self.cfg['chase_max'],
+                             self.cfg['trigger_slippage'])
+
     def _check_and_place_protective_sl(self, current_price, current_amount):
         """
         检查并挂保护性止损单
@@ -778,7 +890,8 @@ class LimitOrderStrategyManager:
             sl_side = "SELL" if self.direction == 1 else "BUY"
             # 使用确切的当前仓位数量，而不是 self.full_amount
             current_amount_formatted = self.precision_mgr.format_amount(current_amount)
-            self.order_mgr.place_stop_market(self.symbol_for_api, sl_side, current_amount_formatted, protective_sl_price, reduce_only=True)
+            self.order_mgr.place_stop_market(self.symbol_for_api, sl_side, current_amount_formatted, protective_sl_price,
+                                             reduce_only=True, client_id=self._client_id("psl"))
 
             # 更新当前止损位（使用更有利的保护性止损位）
             self.current_stop_loss_price = protective_sl_price
@@ -786,22 +899,24 @@ class LimitOrderStrategyManager:
             self.protective_sl_placed = True
             Log(f"✅ 保护性止损单已挂: 止损 @ {protective_sl_price}，原止损单保持不变", "#00FF00")
 
-    def _place_tp_orders(self, close_side):
+    def _tp_legs(self, close_side, prefix="tp"):
         """
-        根据波动模式挂限价止盈单
+        根据波动模式生成限价止盈单 (供 place_batch 批量提交)
         close_side: "SELL" (做多平仓) 或 "BUY" (做空平仓)
+        prefix: 订单名前缀, 依次编号为 tp1, tp2...
         """
         volatility_key = {0: 'volatility_small', 1: 'volatility_medium', 2: 'volatility_large'}[self.volatility_mode]
         tp_configs = self.cfg[volatility_key]
+        legs = []
         for idx, tp_config in enumerate(tp_configs, 1):
             atr_mult = tp_config['atr']
             pct = tp_config['pct']
             tp_price = self.base_price + (self.direction * atr_mult * self.atr_val)
             tp_price = self.precision_mgr.format_price(tp_price)
             tp_amount = self.precision_mgr.format_amount(self.full_amount * pct)
-            res_tp = self.order_mgr.place_limit(close_side, tp_amount, tp_price, reduce_only=True)
-            if not res_tp:
-                Log(f"⚠️ 止盈{idx}挂单失败", "#FF9900")
+            legs.append({'name': f"{prefix}{idx}", 'label': f"止盈{idx}", 'type': "LIMIT", 'side': close_side,
+                         'quantity': tp_amount, 'price': tp_price, 'reduce_only': True})
+        return legs
 
     def _place_orders_after_base_entry(self):
         """
@@ -815,7 +930,8 @@ class LimitOrderStrategyManager:
         sl_price = self.precision_mgr.format_price(sl_price)
         # 止损方向: 做多时止损=卖出(SELL), 做空时止损=买入(BUY)
         sl_side = "SELL" if self.direction == 1 else "BUY"
-        res_sl = self.order_mgr.place_stop_market(self.symbol_for_api, sl_side, base_amount, sl_price, reduce_only=True)
+        res_sl = self.order_mgr.place_stop_market(self.symbol_for_api, sl_side, base_amount, sl_price, reduce_only=True,
+                                                  client_id=self._client_id("sl"))
         if not res_sl:
             Log("⚠️ 止损单挂单失败", "#FF9900")
 
@@ -838,17 +954,23 @@ class LimitOrderStrategyManager:
         步骤4: 满仓后的挂单动作
         - 撤销原有止损单
         - 挂新止损单 (-0.3 ATR, 满仓)
+        - 挂3个限价止盈单 (与新止损单一起批量提交)
         - 启动跟踪止盈监控 (激活价0.28 ATR, 回调0.15 ATR)
-        - 挂3个限价止盈单
         """
         # 先撤销所有挂单 - 包括FMZ订单和Algo订单
+        # 跟踪中的触发单 (如部分成交的加仓单) 先停止追单, 不再重挂剩余数量
+        self.chaser.cancel()
         self.order_mgr.cancel_all_orders(self.symbol, self.symbol_for_api)
-        Sleep(500)
         # 1. 新止损单 (-0.3 ATR, 满仓)
         full_sl_price = self.base_price - (self.direction * self.cfg['full_sl_atr'] * self.atr_val)
         full_sl_price = self.precision_mgr.format_price(full_sl_price)
         sl_side = "SELL" if self.direction == 1 else "BUY"
-        self.order_mgr.place_stop_market(self.symbol_for_api, sl_side, self.full_amount, full_sl_price, reduce_only=True)
+        close_side = "SELL" if self.direction == 1 else "BUY"
+        # 满仓止损和限价止盈单一次批量提交, 缩短加仓成交后的无保护窗口
+        legs = [{'name': "fsl", 'label': "满仓止损单", 'type': "STOP_MARKET", 'side': sl_side,
+                 'quantity': self.full_amount, 'stop_price': full_sl_price, 'reduce_only': True}]
+        legs += self._tp_legs(close_side)
+        self._place_batch(legs)
 
         # 更新当前止损位
         self.current_stop_loss_price = full_sl_price
@@ -868,9 +990,40 @@ class LimitOrderStrategyManager:
 
         Log(f"📊 跟踪止盈监控已启动: 激活价={trail_activation:.2f}, 回调距离={callback_distance:.2f}", "#00BFFF")
 
-        # 3. 挂限价止盈单
-        close_side = "SELL" if self.direction == 1 else "BUY"
-        self._place_tp_orders(close_side)
+    def pending_levels(self):
+        """
+        待触发价位 (供 AdaptivePoller 按距离计算下次检查间隔):
+        入场激活价/回调触发价、加仓触发价、保护性止损触发价、跟踪止盈激活价/回调触发价、当前止损位
+        """
+        levels = [self.current_stop_loss_price]
+        if self.state == "WAIT_ENTRY":
+            track = self.entry_tracking
+            if self.entry_mode in (2, 4) and not track['is_monitoring']:
+                levels.append(self.entry_limit_price)
+            if track['is_monitoring'] and not track['limit_order_placed']:
+                levels.append(track['price_extreme'] + self.direction * track['callback_distance'])
+        elif self.state == "ENTRY_DONE":
+            if not self.add_position_monitor['triggered']:
+                levels.append(self.add_position_monitor['trigger_price'])
+        elif self.state == "WAIT_EXIT":
+            if not self.protective_sl_placed:
+                levels.append(self.base_price + self.direction * self.cfg['protective_sl_trigger'] * self.atr_val)
+            monitor = self.trailing_tp_monitor
+            if not monitor['limit_order_placed']:
+                if monitor['is_monitoring']:
+                    levels.append(monitor['price_extreme'] - self.direction * monitor['callback_distance'])
+                else:
+                    levels.append(monitor['activation_price'])
+        return levels
+
+    def status_model(self):
+        """状态栏展示的字段 (StatusRenderer 据此判断是否需要重建状态文本)"""
+        if self.state == "WAIT_CONFIRM":
+            return (self.state, tuple(sorted(self.pending_confirm_info.items())))
+        return (self.state, self.symbol, self.direction, tuple(self.entry_config.values()),
+                self.atr_val, self.full_amount, self.base_price, self.last_position_amount,
+                tuple(self.entry_tracking.values()), tuple(self.add_position_monitor.values()),
+                tuple(self.trailing_tp_monitor.values()))
 
     def get_status_info(self):
         """获取状态信息"""
@@ -956,8 +1109,24 @@ def main():
     Log("🚀 基于程序监控的限价单策略启动", "#00FF00")
     exchange.SetContractType("swap")
 
+    # 性能统计: 未开启时直接使用原始对象, 没有额外开销
+    profiler = ext.Profiler() if PROFILE else None
+    ex = profiler.wrap(exchange) if profiler else exchange
+    log_status = profiler.timed("LogStatus", LogStatus) if profiler else LogStatus
+    get_command = profiler.timed("GetCommand", GetCommand) if profiler else GetCommand
+    sleep = profiler.timed("Sleep", Sleep) if profiler else Sleep
+
     # 初始化策略管理器 (直接使用ext对象中的工具类)
-    strategy = LimitOrderStrategyManager(exchange, STRATEGY_CONFIG)
+    strategy = LimitOrderStrategyManager(ex, STRATEGY_CONFIG)
+    if profiler:
+        profiler.instrument(strategy, PROFILED_METHODS, "Manager.")
+    # 预热全部交易对精度和常用币种的ATR缓存, 开仓确认时无需再请求行情元数据
+    # ATR预热为低优先级请求, 由调度器在请求权重充足时执行
+    scheduler = ext.RequestScheduler.get_default()
+    retry = ext.RetryPolicy.get_default()
+    ext.PrecisionManager.prefetch(ex)
+    scheduler.defer("atr_prefetch", ext.ATRCalculator.prefetch, ex, MY_SYMBOLS, STRATEGY_CONFIG['atr_period'],
+                    costs={'weight': 5 * len(MY_SYMBOLS)})
     # UI按钮配置
     btn_trade = {
         "type": "button",
@@ -977,53 +1146,115 @@ def main():
     btn_cancel = {"type": "button", "cmd": "CancelEntry", "name": "❌ 取消"}
     btn_reset = {"type": "button", "cmd": "ResetStrategy", "name": "🔄 重置策略"}
     btn_info = {"type": "button", "cmd": "ShowInfo", "name": "📊 查看状态"}
-    ui_layout = (
-        f'`{json.dumps(btn_trade, ensure_ascii=False)}`\n' +
-        f'`{json.dumps(btn_confirm, ensure_ascii=False)}`\n' +
-        f'`{json.dumps(btn_cancel, ensure_ascii=False)}`\n' +
-        f'`{json.dumps(btn_reset, ensure_ascii=False)}`\n' +
-        f'`{json.dumps(btn_info, ensure_ascii=False)}`'
-    )
-    status_display = "等待操作..."
-    # 主循环
-    while True:
-        try:
-            # 定期检查仓位变化
-            strategy.check_position_and_update_state()
-            # UI渲染
-            if strategy.state == "WAIT_CONFIRM":
-                confirm_info = strategy.get_confirm_info()
-                status_display = "\n".join(confirm_info)
-            else:
-                status_display = strategy.get_status_info()
-            LogStatus(f"{ui_layout}\n\n最后更新: {_D()}\n\n{status_display}")
-            # 处理命令
-            cmd = GetCommand()
-            if cmd:
-                try:
-                    if cmd.startswith("TradeCmd:"):
-                        data = json.loads(cmd.split(":", 1)[1])
-                        symbol = MY_SYMBOLS[int(data['symbol'])]
-                        direction = "buy" if int(data['direction']) == 0 else "sell"
-                        mode = int(data['mode']) + 1
-                        volatility_mode = int(data.get('volatility', 0))  # 0=小波动, 1=中波动, 2=大波动
-                        max_loss = float(data['max_loss'])
-                        atr_percentage = float(data.get('atr_percentage', 0))  # 0表示使用默认周期
-                        limit_price = float(data.get('limit_price', 0))
-                        strategy.start_entry(symbol, direction, max_loss, mode, limit_price, volatility_mode, atr_percentage)
-                    elif cmd == "ConfirmEntry":
-                        strategy.confirm_entry()
-                    elif cmd == "CancelEntry":
-                        strategy.cancel_entry()
-                    elif cmd == "ResetStrategy":
-                        strategy._reset()
-                    elif cmd == "ShowInfo":
-                        status_display = strategy.get_status_info()
-                except Exception as e:
-                    Log(f"❌ 指令处理错误: {e}", "#FF0000")
-        except Exception as e:
-            Log(f"❌ 主循环错误: {e}", "#FF0000")
-        Sleep(1000)  # 每1秒循环一次
+    # 按钮布局只序列化一次, 状态内容变化或到达心跳间隔时才推送状态栏
+    renderer = ext.StatusRenderer([btn_trade, btn_confirm, btn_cancel, btn_reset, btn_info], UI_HEARTBEAT, log_status)
+    # 行情流: 两次仓位检查之间逐条检查强制止损和程序内触发, 不可用时回退到随仓位检查轮询价格
+    prices = ext.PriceStream(PRICE_STREAM) if USE_PRICE_STREAM else None
+    if prices:
+        poll = profiler.timed("prices.poll", prices.poll) if profiler else prices.poll
+    # 自适应检查间隔: 接近触发价时加快, 远离时放慢
+    poller = ext.AdaptivePoller(POLL_FLOOR, POLL_CEILING, POLL_NEAR_ATR, POLL_FAR_ATR, CHECK_INTERVAL)
+    streaming = False  # 行情流是否已订阅当前交易对
+
+    def wait(ms):
+        """任务之间的等待: 订阅行情流时持续等待价格, 每批到达后立即检查触发"""
+        if not streaming:
+            sleep(ms)
+            return
+        for trade_time, price in poll(ms):
+            try:
+                strategy.on_price(price, trade_time)
+            except Exception as e:
+                Log(f"❌ 行情处理错误: {e}", "#FF0000")
+        strategy.notif_mgr.flush()
+
+    def check_interval():
+        """按最新价与待触发价位的距离决定下一次仓位检查的时间"""
+        targets = []
+        if strategy.state in ("WAIT_ENTRY", "ENTRY_DONE", "WAIT_EXIT") and strategy.snapshot.ticker:
+            targets.append((strategy.snapshot.last, strategy.pending_levels(), strategy.atr_val))
+        return poller.interval(targets)
+
+    def check():
+        nonlocal streaming
+        # 执行延后的低优先级请求
+        scheduler.run_deferred()
+        # 定期检查仓位变化
+        strategy.check_position_and_update_state()
+        strategy.notif_mgr.flush()
+        loop.trigger("ui")
+        if profiler:
+            profiler.end_loop()
+        watching = strategy.symbol_for_api if strategy.state in ("WAIT_ENTRY", "ENTRY_DONE", "WAIT_EXIT") else ""
+        streaming = bool(prices and prices.watch(watching))
+
+    def status_text():
+        if strategy.state == "WAIT_CONFIRM":
+            return "\n".join(strategy.get_confirm_info())
+        return strategy.get_status_info()
+
+    def render():
+        renderer.render(strategy.status_model(), status_text)
+
+    def handle_command(cmd):
+        if cmd.startswith("TradeCmd:"):
+            data = json.loads(cmd.split(":", 1)[1])
+            symbol = MY_SYMBOLS[int(data['symbol'])]
+            direction = "buy" if int(data['direction']) == 0 else "sell"
+            mode = int(data['mode']) + 1
+            volatility_mode = int(data.get('volatility', 0))  # 0=小波动, 1=中波动, 2=大波动
+            max_loss = float(data['max_loss'])
+            atr_percentage = float(data.get('atr_percentage', 0))  # 0表示使用默认周期
+            limit_price = float(data.get('limit_price', 0))
+            strategy.start_entry(symbol, direction, max_loss, mode, limit_price, volatility_mode, atr_percentage)
+        elif cmd == "ConfirmEntry":
+            # 确认后立即检查一次仓位并订阅行情流
+            if strategy.confirm_entry():
+                loop.trigger("check")
+        elif cmd == "CancelEntry":
+            strategy.cancel_entry()
+        elif cmd == "ResetStrategy":
+            strategy._reset()
+        elif cmd == "ShowInfo":
+            # 各操作实际付出的等待 (重试退避 + 限频排队)
+            for line in retry.report():
+                Log(f"⏱️ {line}")
+            Log(f"⏱️ 限频排队: 请求{scheduler.stats['requests']}次 等待{scheduler.stats['waited_ms']}ms")
+            if profiler:
+                for line in profiler.report():
+                    Log(f"📈 {line}")
+                profiler.dump(PROFILE_FILE)
+            Log(f"⏲️ {poller.report()}")
+            Log(f"🖥️ {renderer.report()}")
+            Log(f"📨 {strategy.notif_mgr.report()}")
+            renderer.invalidate()
+            # 触发单成交耗时与追单次数
+            for line in strategy.chaser.report():
+                Log(f"🏃 {line}")
+            # 程序内触发的滑点-延迟报告
+            if strategy.triggers.records:
+                for line in strategy.triggers.report():
+                    Log(f"🎯 {line}")
+                strategy.triggers.dump(TRIGGER_FILE)
+
+    def commands():
+        """读取并执行全部排队的界面命令, 执行后立即刷新状态栏"""
+        cmd = get_command()
+        while cmd:
+            try:
+                handle_command(cmd)
+            except Exception as e:
+                Log(f"❌ 指令处理错误: {e}", "#FF0000")
+            loop.trigger("ui")
+            cmd = get_command()
+        strategy.notif_mgr.flush()
+
+    # 主循环: 命令、仓位检查、界面刷新各按自己的间隔调度, 命令最先执行
+    loop = ext.LoopScheduler(wait)
+    loop.every("commands", COMMAND_INTERVAL, commands)
+    loop.every("check", check_interval, check)
+    loop.every("ui", UI_INTERVAL, render)
+    loop.run()
 
 # 启动主程序
 if __name__ == "__main__":
@@ -10,6 +10,27 @@ import json
 MY_SYMBOLS = ["BTC_USDT", "ETH_USDT", "ETH_USDC", "SOL_USDT",
               "ZEC_USDT","1000PEPE_USDT","DOGE_USDT"
             ]
+USE_USER_STREAM = True       # True=用户数据流事件驱动, False=每2秒轮询仓位
+RECONCILE_INTERVAL = 30000   # 事件驱动模式下的兜底对账间隔(毫秒)
+# 自适应检查间隔: 价格距最近触发价 <= POLL_NEAR_ATR 时每 POLL_FLOOR 毫秒检查一次,
+# >= POLL_FAR_ATR 时每 POLL_CEILING 毫秒, 之间线性插值; 没有运行中的交易时每 POLL_IDLE 毫秒
+POLL_FLOOR = 500
+POLL_CEILING = 5000
+POLL_NEAR_ATR = 0.05
+POLL_FAR_ATR = 1.0
+POLL_IDLE = 2000
+COMMAND_INTERVAL = 100       # 界面命令读取间隔(毫秒), 操作员点击在此时间内执行
+UI_INTERVAL = 1000           # 状态栏检查间隔(毫秒), 命令执行和仓位检查后立即检查
+UI_HEARTBEAT = 10000         # 状态栏内容未变化时的最长推送间隔(毫秒)
+STREAM_REPLAY_FILE = ""      # 非空时回放录制的事件文件代替实时数据流(本地测试)
+PROFILE = False              # True=统计交易所调用和状态处理函数耗时 (ShowInfo查看并写入PROFILE_FILE)
+PROFILE_FILE = "latency_profile.json"
+PERSIST_STATE = True         # True=状态转换时写入_G, 重启后与交易所仓位/挂单对账恢复
+# 计时的策略管理器方法 (状态处理函数)
+PROFILED_METHODS = ("check_position_and_update_state", "on_stream_event", "_update_state",
+                    "_handle_wait_entry_state", "_handle_entry_done_state", "_handle_wait_exit_state",
+                    "_check_and_place_protective_sl", "_place_orders_after_base_entry",
+                    "_place_orders_after_full_position")
 
 # 策略参数（实盘）
 STRATEGY_CONFIG = {
@@ -46,14 +67,26 @@ STRATEGY_CONFIG = {
 # ============================================================
 class OrderBasedStrategyManager:
     """基于交易所挂单的策略管理器"""
-    def __init__(self, exchange, config):
+    # 持久化的状态字段 (重启后恢复)
+    PERSIST_FIELDS = ("state", "symbol", "symbol_for_api", "direction", "max_loss", "entry_mode",
+                      "entry_limit_price", "volatility_mode", "atr_val", "full_amount", "base_price",
+                      "last_position_amount", "trade_id", "leg_counts", "protective_sl_placed", "entry_config")
+
+    def __init__(self, exchange, config, journal=None, notifier=None):
         self.ex = exchange
         self.cfg = config
         # 从模板类库导入工具类 (通过ext对象直接调用)
         self.precision_mgr = ext.PrecisionManager(exchange)
         self.order_mgr = ext.OrderManager(exchange, self.precision_mgr)
-        self.notif_mgr = ext.NotificationManager(exchange)
+        # 通知队列 (多币种托管时共用一个, 同时触发的通知合并发送)
+        self.notif_mgr = notifier or ext.NotificationManager(exchange)
+        # 原生条件单成交滑点记录 (与限价版程序内触发对照)
+        self.triggers = ext.TriggerTracker.get_default()
         self.atr_calc = ext.ATRCalculator
+        # 本交易挂单模型 (保护性止损只替换变化的订单)
+        self.order_set = ext.OrderSet(self.order_mgr, self._client_id)
+        # 状态持久化 (StateJournal, 为None时不持久化, 如回测)
+        self.journal = journal
         # 策略状态
         self.state = "IDLE"
         self.symbol = ""
@@ -69,10 +102,17 @@ class OrderBasedStrategyManager:
         self.base_price = 0   # 底仓均价
         # 上次检查的仓位
         self.last_position_amount = 0
+        # 交易ID, 与订单腿组成客户端订单ID (确认开仓时生成)
+        self.trade_id = ""
+        self.leg_counts = {}
         # 确认信息存储
         self.pending_confirm_info = {}
         # 保护性止损标志
         self.protective_sl_placed = False
+        # 事件流收到成交后置位，主循环立即轮询一次仓位对账
+        self.need_reconcile = False
+        # 组合托管时本轮共享行情中的最新价 (0表示需自行查询)
+        self.tick_price = 0
         # 入场配置信息（用于策略状态展示）
         self.entry_config = {
             'volatility_desc': '',
@@ -86,10 +126,9 @@ class OrderBasedStrategyManager:
         if self.symbol:
             # 撤销所有挂单 - 包括FMZ订单和Algo订单
             Log("🔄 撤销所有挂单...", "#FFA500")
+            # 批量撤单后轮询确认挂单已清空
             self.order_mgr.cancel_all_orders(self.symbol, self.symbol_for_api)
-            Sleep(500)  # 等待撤单完成
-            # 二次确认撤单（防止网络延迟导致撤单失败）
-            self.order_mgr.cancel_all_orders(self.symbol, self.symbol_for_api)
+        self.order_set.clear()
         self.state = "IDLE"
         self.symbol = ""
         self.symbol_for_api = ""
@@ -102,16 +141,89 @@ class OrderBasedStrategyManager:
         self.full_amount = 0
         self.base_price = 0
         self.last_position_amount = 0
+        self.trade_id = ""
+        self.leg_counts = {}
         self.pending_confirm_info = {}
         self.protective_sl_placed = False
+        self.need_reconcile = False
         self.entry_config = {
             'volatility_desc': '',
             'atr_mode': '',
             'atr_value': 0,
             'entry_mode_desc': ''
         }
+        self._persist()
         Log("🔄 策略已重置")
 
+    def _persist(self):
+        """
+        状态转换后写入持久化存储 (内容未变化时不写)
+        确认开仓前的参数不持久化, 重启后需重新发起
+        """
+        if not self.journal:
+            return
+        if self.state == "IDLE" or self.state == "WAIT_CONFIRM":
+            self.journal.save({'state': "IDLE"})
+        else:
+            self.journal.save({key: getattr(self, key) for key in self.PERSIST_FIELDS})
+
+    def restore(self):
+        """
+        重启后恢复运行中的交易: 载入持久化状态, 一次查询实时仓位和挂单完成对账
+        - 仓位变化交给状态机处理 (离线期间止损/加仓/平仓按正常流程推进并通知),
+          挂单使用确定性的客户端订单ID, 重复提交按已存在处理
+        - 无仓位且入场单已不在挂单中: 交易已在离线期间结束, 撤销残留挂单并重置
+        - 有仓位但交易所上没有本交易的挂单: 按当前阶段重新挂止损/止盈
+        返回: 是否恢复了运行中的交易
+        """
+        saved = self.journal.load() if self.journal else None
+        if not saved or saved.get('state') not in ("WAIT_ENTRY", "ENTRY_DONE", "WAIT_EXIT"):
+            return False
+        for key in self.PERSIST_FIELDS:
+            if key in saved:
+                setattr(self, key, saved[key])
+        Log(f"♻️ [{self.symbol}] 恢复交易 {self.trade_id}: {self.state}, 持仓 {self.last_position_amount}", "#00BFFF")
+        self.ex.SetContractType("swap")
+        self.ex.SetCurrency(self.symbol)
+        if not self.precision_mgr.set_precision(self.symbol):
+            # 精度不可用时保留状态, 由之后的仓位检查继续推进
+            self.need_reconcile = True
+            return True
+        # 仓位和挂单并发查询
+        position_go = self.ex.Go("GetPosition")
+        client_ids = self.order_mgr.open_client_ids(self.symbol, self.symbol_for_api)
+        try:
+            positions, _ = position_go.wait()
+        except Exception:
+            positions = None
+        if positions is None or client_ids is None:
+            Log(f"⚠️ [{self.symbol}] 对账查询失败，等待下一轮仓位检查", "#FF9900")
+            self.need_reconcile = True
+            return True
+        target_type = PD_LONG if self.direction == 1 else PD_SHORT
+        current_amount, current_price = next(((p['Amount'], p['Price']) for p in positions
+                                              if p['Type'] == target_type and p['Amount'] > 0), (0, 0))
+        live = [cid for cid in client_ids if cid.startswith(self.trade_id + "-")]
+        Log(f"♻️ [{self.symbol}] 实时持仓 {current_amount}, 本交易挂单 {len(live)} 个")
+        if current_amount == 0 and self.last_position_amount == 0 and not live:
+            Log(f"⚠️ [{self.symbol}] 入场单已不在挂单中且无持仓，策略重置", "#FF9900")
+            self._reset()
+            return False
+        state = self.state
+        self._update_state(current_amount, current_price)
+        if self.state == "IDLE":
+            return False
+        # 状态未推进(推进时已重新挂单)且本交易挂单全部丢失: 按当前阶段补挂
+        if self.state == state and current_amount > 0 and not live:
+            Log(f"⚠️ [{self.symbol}] 持仓无保护挂单，按{self.state}阶段重新挂单", "#FF9900")
+            if self.state == "ENTRY_DONE":
+                self._place_orders_after_base_entry()
+            else:
+                self.protective_sl_placed = False
+                self._place_orders_after_full_position(current_amount)
+            self._persist()
+        return True
+
     def _convert_symbol_for_api(self, symbol):
         """
         转换币种格式用于API调用
@@ -119,6 +231,27 @@ class OrderBasedStrategyManager:
         """
         return symbol.replace("_", "")
 
+    def _client_id(self, leg):
+        """
+        订单腿的客户端订单ID (交易ID + 订单腿), 重复提交时交易所可据此去重
+        同一笔交易中同一订单腿再次挂单时追加序号 (tp1, tp1.2, ...)
+        """
+        count = self.leg_counts.get(leg, 0) + 1
+        self.leg_counts[leg] = count
+        return ext.OrderManager.client_order_id(self.trade_id, leg if count == 1 else f"{leg}.{count}")
+
+    def _place_batch(self, legs):
+        """按订单腿名称分配客户端订单ID后批量挂单, 成功的订单记入挂单模型"""
+        return self.order_set.place(self.symbol_for_api, legs)
+
+    def _sync_orders(self, legs):
+        """
+        将本交易挂单同步为legs: 只挂新增/变化的订单, 新单提交后再撤旧单,
+        参数不变的订单保持不动
+        """
+        placed, cancelled = self.order_set.sync(self.symbol, self.symbol_for_api, self.trade_id + "-", legs)
+        Log(f"🔁 挂单同步: 新挂 {placed} 个, 撤销 {cancelled} 个")
+
     def start_entry(self, symbol, direction_str, max_loss, entry_mode, limit_price=0, volatility_mode=1, atr_percentage=0):
         """
         启动入场流程
@@ -238,6 +371,10 @@ class OrderBasedStrategyManager:
             Log("❌ 当前不在确认状态", "#FF0000")
             return False
         Log("✅ 用户确认开仓，开始挂单", "#00FF00")
+        self.trade_id = ext.OrderManager.new_trade_id(self.symbol_for_api)
+        # 多币种托管时当前交易对可能已被其他实例切换 (行情查询按当前交易对, 订单显式指定币种)
+        self.ex.SetContractType("swap")
+        self.ex.SetCurrency(self.symbol)
 
         # 保存入场配置信息
         info = self.pending_confirm_info
@@ -255,7 +392,8 @@ class OrderBasedStrategyManager:
         if self.entry_mode == 1:
             # 模式1: 市价入场
             Log("🚀 模式1: 市价入场")
-            res = self.order_mgr.place_market(side, base_amount)
+            res = self.order_mgr.place_market(side, base_amount, client_id=self._client_id("entry"),
+                                              symbol_api=self.symbol_for_api)
             if res:
                 Log(f"✅ 市价单已提交: {res}")
                 self.state = "WAIT_ENTRY"
@@ -266,7 +404,8 @@ class OrderBasedStrategyManager:
         elif self.entry_mode == 2:
             # 模式2: 限价入场
             Log(f"📌 模式2: 限价入场 @ {self.entry_limit_price}")
-            res = self.order_mgr.place_limit(side, base_amount, self.entry_limit_price)
+            res = self.order_mgr.place_limit(side, base_amount, self.entry_limit_price, client_id=self._client_id("entry"),
+                                             symbol_api=self.symbol_for_api)
             if res:
                 Log(f"✅ 限价单已提交: {res}")
                 self.state = "WAIT_ENTRY"
@@ -289,7 +428,8 @@ class OrderBasedStrategyManager:
             # 保留两位小数
             callback_rate = _N(callback_rate, 2)
             Log(f"📊 入场跟踪单: 回调距离={callback_distance:.2f}, 回调率={callback_rate:.2f}%")
-            res = self.order_mgr.place_trailing_stop(self.symbol_for_api, side, base_amount, callback_rate, 0)
+            res = self.order_mgr.place_trailing_stop(self.symbol_for_api, side, base_amount, callback_rate, 0,
+                                                     client_id=self._client_id("entry"))
             if res:
                 Log(f"✅ 跟踪单已提交: {res}")
                 self.state = "WAIT_ENTRY"
@@ -309,7 +449,8 @@ class OrderBasedStrategyManager:
             # 保留两位小数
             callback_rate = _N(callback_rate, 2)
             Log(f"📊 入场跟踪单: 激活价={self.entry_limit_price}, 回调距离={callback_distance:.2f}, 回调率={callback_rate:.2f}%")
-            res = self.order_mgr.place_trailing_stop(self.symbol_for_api, side, base_amount, callback_rate, formatted_price)
+            res = self.order_mgr.place_trailing_stop(self.symbol_for_api, side, base_amount, callback_rate, formatted_price,
+                                                     client_id=self._client_id("entry"))
             if res:
                 Log(f"✅ 限价跟踪单已提交: {res}")
                 self.state = "WAIT_ENTRY"
@@ -317,6 +458,7 @@ class OrderBasedStrategyManager:
                 Log("❌ 限价跟踪单提交失败", "#FF0000")
                 self._reset()
                 return False
+        self._persist()
         return True
 
     def cancel_entry(self):
@@ -345,6 +487,13 @@ class OrderBasedStrategyManager:
             Log(f"⚠️ 获取持仓失败: {e}")
             return None, None
 
+    def _last_price(self):
+        """最新价: 优先使用本轮共享行情, 否则查询Ticker"""
+        if self.tick_price > 0:
+            return self.tick_price
+        ticker = _C(self.ex.GetTicker)
+        return ticker['Last']
+
     def _send_stop_loss_notification(self, sl_price):
         """发送止损通知"""
         direction_str = "做多🟢" if self.direction == 1 else "做空🔴"
@@ -361,7 +510,7 @@ class OrderBasedStrategyManager:
             f"亏损金额: {loss_amount} USDT\n"
             f"时间: {_D()}"
         )
-        self.notif_mgr.send_notification(notif_title, notif_msg)
+        self.notif_mgr.send_notification(notif_msg, notif_title)
 
     def _send_base_entry_notification(self, current_amount, current_price):
         """发送底仓开仓通知"""
@@ -376,7 +525,7 @@ class OrderBasedStrategyManager:
             f"ATR: {self.atr_val}\n"
             f"时间: {_D()}"
         )
-        self.notif_mgr.send_notification(notif_title, notif_msg)
+        self.notif_mgr.send_notification(notif_msg, notif_title)
 
     def _send_add_position_notification(self, current_amount, current_price):
         """发送加仓通知"""
@@ -393,7 +542,7 @@ class OrderBasedStrategyManager:
             f"满仓价值: {current_amount * current_price} USDT\n"
             f"时间: {_D()}"
         )
-        self.notif_mgr.send_notification(notif_title, notif_msg)
+        self.notif_mgr.send_notification(notif_msg, notif_title)
 
     def _send_close_position_notification(self, close_price):
         """发送平仓通知"""
@@ -413,7 +562,7 @@ class OrderBasedStrategyManager:
             f"持仓数量: {self.last_position_amount}\n"
             f"时间: {_D()}"
         )
-        self.notif_mgr.send_notification(notif_title, notif_msg)
+        self.notif_mgr.send_notification(notif_msg, notif_title)
 
     def _handle_wait_entry_state(self, current_amount, current_price, expected_base, tolerance):
         """
@@ -444,8 +593,7 @@ class OrderBasedStrategyManager:
         """
         # 检查仓位归零（止损触发）
         if self.last_position_amount > 0 and current_amount == 0:
-            ticker = _C(self.ex.GetTicker)
-            sl_price = ticker['Last']
+            sl_price = self._last_price()
 
             # 发送止损通知
             self._send_stop_loss_notification(sl_price)
@@ -459,8 +607,7 @@ class OrderBasedStrategyManager:
             Log(f"✅ 加仓完成 {current_amount:.4f}", "#00FF00")
 
             # 获取当前价格
-            ticker = _C(self.ex.GetTicker)
-            current_price = ticker['Last']
+            current_price = self._last_price()
 
             # 发送加仓通知
             self._send_add_position_notification(current_amount, current_price)
@@ -471,14 +618,14 @@ class OrderBasedStrategyManager:
             # 执行步骤4的挂单动作
             self._place_orders_after_full_position()
 
-    def _handle_wait_exit_state(self, current_amount, current_price):
+    def _handle_wait_exit_state(self, current_amount, position_price):
         """
         处理 WAIT_EXIT 状态: 满仓已建立，等待平仓或保护性止损
+        position_price: 持仓均价 (保护性止损按实时市场价判断, 不使用均价)
         """
         # 先检查仓位归零（最高优先级）
         if self.last_position_amount > 0 and current_amount == 0:
-            ticker = _C(self.ex.GetTicker)
-            close_price = ticker['Last']
+            close_price = self._last_price()
 
             # 发送平仓通知
             self._send_close_position_notification(close_price)
@@ -489,11 +636,14 @@ class OrderBasedStrategyManager:
 
         # 再检查保护性止损触发条件（仅在有仓位情况下检查）
         if not self.protective_sl_placed and current_amount > 0:
-            self._check_and_place_protective_sl(current_price, current_amount)
+            self._check_and_place_protective_sl(self._last_price(), current_amount)
 
-    def check_position_and_update_state(self):
+    def check_position_and_update_state(self, position=None, price=0):
         """
         核心逻辑: 每2秒检查仓位变化，根据变化判断状态
+        事件驱动模式下仅作为低频对账兜底
+        position: 组合托管时传入共享查询得到的 (数量, 均价)，为None时自行查询
+        price: 组合托管时传入共享行情的最新价
         """
         if self.state == "IDLE" or self.state == "WAIT_CONFIRM":
             return
@@ -504,10 +654,63 @@ class OrderBasedStrategyManager:
             self.ex.SetCurrency(self.symbol)
 
         # 获取当前持仓
-        current_amount, current_price = self._get_position_amount()
+        if position is None:
+            position = self._get_position_amount()
+        current_amount, current_price = position
         if current_amount is None:
             return  # 获取失败，跳过本轮
+        self.need_reconcile = False
+        self.tick_price = price
+        try:
+            self._update_state(current_amount, current_price)
+        finally:
+            self.tick_price = 0
 
+    def on_stream_event(self, event):
+        """
+        处理用户数据流事件
+        - ACCOUNT_UPDATE: 直接用推送的仓位推进状态机
+        - ORDER_TRADE_UPDATE: 本币种订单成交时标记立即对账(防止仓位推送丢失)
+        """
+        if self.state == "IDLE" or self.state == "WAIT_CONFIRM":
+            return
+        event_type = event.get('e')
+        if event_type == "ACCOUNT_UPDATE":
+            for p in event.get('a', {}).get('P', []):
+                if p.get('s') != self.symbol_for_api:
+                    continue
+                # 双向持仓模式下只看策略方向的仓位
+                position_side = p.get('ps', 'BOTH')
+                if (position_side == 'LONG' and self.direction != 1) or (position_side == 'SHORT' and self.direction != -1):
+                    continue
+                signed_amount = float(p['pa'])
+                # 单向持仓模式下用数量符号判断方向，反向仓位视为0
+                if signed_amount * self.direction > 0:
+                    current_amount, current_price = abs(signed_amount), float(p['ep'])
+                else:
+                    current_amount, current_price = 0, 0
+                Log(f"📡 仓位推送: {current_amount} @ {current_price}")
+                # 多币种托管时当前交易对可能已被其他实例切换
+                self.ex.SetContractType("swap")
+                self.ex.SetCurrency(self.symbol)
+                self._update_state(current_amount, current_price)
+                if self.state == "IDLE":
+                    return
+        elif event_type == "ORDER_TRADE_UPDATE":
+            order = event.get('o', {})
+            if order.get('s') == self.symbol_for_api and order.get('X') in ("FILLED", "PARTIALLY_FILLED"):
+                Log(f"📡 成交推送: {order.get('S')} {order.get('l')} @ {order.get('L')} ({order.get('o')})")
+                self.need_reconcile = True
+                # 原生条件单的成交滑点 (与限价版程序内触发对照)
+                stop_price = float(order.get('sp', 0) or 0)
+                if order.get('X') == "FILLED" and order.get('o') == "STOP_MARKET" and stop_price > 0:
+                    leg = order.get('c', "").split("-")[-1]
+                    self.triggers.record_native(leg or "stop", order.get('S'), stop_price, float(order.get('ap') or order.get('L')))
+
+    def _update_state(self, current_amount, current_price):
+        """
+        根据最新仓位分发到状态处理函数 (轮询和事件流共用)
+        """
         # 计算预期的底仓和满仓数量
         expected_base = self.precision_mgr.format_amount(self.full_amount * self.cfg['base_position_pct'])
         expected_full = self.full_amount
@@ -522,76 +725,67 @@ class OrderBasedStrategyManager:
             self._handle_entry_done_state(current_amount, current_price, expected_base, expected_full, tolerance)
         elif self.state == "WAIT_EXIT":
             self._handle_wait_exit_state(current_amount, current_price)
+        self._persist()
 
-    def _check_and_place_protective_sl(self, current_price, current_amount):
+    def _check_and_place_protective_sl(self, market_price, current_amount):
         """
         检查并挂保护性止损单
-        当底仓浮盈达到 +0.2 ATR 时，撤销所有订单并重新挂单：
-        - 新的保护性止损单（-0.2 ATR，满仓）
-        - 重新挂跟踪止盈单（参数不变）
-        - 重新挂所有限价止盈单（参数不变）
+        market_price: 实时市场价格
+        当底仓浮盈达到 +0.2 ATR 时，满仓止损替换为保护性止损（-0.2 ATR，当前仓位）
+        跟踪止盈单和限价止盈单参数不变，保持原挂单不动；先挂新止损再撤旧止损，替换期间仓位始终有保护
         """
         # 计算触发价格 (底仓价格 + 方向 * 0.2 ATR)
         trigger_price = self.base_price + (self.direction * self.cfg['protective_sl_trigger'] * self.atr_val)
         # 检查是否达到触发条件
         if self.direction == 1:  # 做多
-            reached = current_price >= trigger_price
+            reached = market_price >= trigger_price
         else:  # 做空
-            reached = current_price <= trigger_price
+            reached = market_price <= trigger_price
         if reached:
             Log(f"🛡️ 底仓浮盈达到 +{self.cfg['protective_sl_trigger']} ATR，更新为保护性止损", "#00BFFF")
-            # 1. 撤销所有订单（FMZ订单和Algo订单）
-            self.order_mgr.cancel_all_orders(self.symbol, self.symbol_for_api)
-            Sleep(500)
-
-            # 2. 挂保护性止损单 (-0.2 ATR, 使用当前确切的仓位数量)
+            # 保护性止损单 (-0.2 ATR, 使用当前确切的仓位数量)
             protective_sl_price = self.base_price - (self.direction * self.cfg['protective_sl_offset'] * self.atr_val)
             protective_sl_price = self.precision_mgr.format_price(protective_sl_price)
             sl_side = "SELL" if self.direction == 1 else "BUY"
             # 使用确切的当前仓位数量，而不是 self.full_amount
             current_amount_formatted = self.precision_mgr.format_amount(current_amount)
-            self.order_mgr.place_stop_market(self.symbol_for_api, sl_side, current_amount_formatted, protective_sl_price, reduce_only=True)
-
-            # 3. 重新挂跟踪止盈单 (激活价0.28 ATR, 回调0.15 ATR, 使用当前确切的仓位数量)
-            trail_activation = self.base_price + (self.direction * self.cfg['trail_activation'] * self.atr_val)
-            trail_activation = self.precision_mgr.format_price(trail_activation)
-            callback_distance = self.cfg['trail_callback'] * self.atr_val
-            callback_rate = (callback_distance / trail_activation) * 100
-            callback_rate = max(0.1, min(5.0, callback_rate))
-            callback_rate = _N(callback_rate, 2)
-            close_side = "SELL" if self.direction == 1 else "BUY"
-            # 使用当前确切的仓位数量，而不是 self.full_amount
-            self.order_mgr.place_trailing_stop(
-                self.symbol_for_api,
-                close_side,
-                current_amount_formatted,
-                callback_rate,
-                trail_activation,
-                reduce_only=True
-            )
-
-            # 4. 重新挂限价止盈单
-            self._place_tp_orders(close_side)
+            legs = [{'name': "psl", 'label': "保护性止损单", 'type': "STOP_MARKET", 'side': sl_side,
+                     'quantity': current_amount_formatted, 'stop_price': protective_sl_price, 'reduce_only': True}]
+            # 跟踪止盈和未成交的限价止盈与满仓时相同, 已在交易所的订单和已成交的止盈不重复提交
+            self._sync_orders(legs + self._exit_legs(current_amount))
 
             self.protective_sl_placed = True
             Log(f"✅ 保护性止损体系已建立: 止损 @ {protective_sl_price}", "#00FF00")
 
-    def _place_tp_orders(self, close_side):
+    def _tp_legs(self, close_side, position=None, prefix="tp"):
         """
-        根据波动模式挂限价止盈单
+        根据波动模式生成限价止盈单 (供 place_batch 批量提交)
         close_side: "SELL" (做多平仓) 或 "BUY" (做空平仓)
+        position: 当前持仓数量, 为None时按满仓; 止盈档按价格由近到远成交,
+                  已平掉的数量 (满仓时的持仓 - 当前持仓) 依次从最近的档位扣除: 已全部成交的档位不再生成, 部分成交的只挂剩余数量
+        prefix: 订单名前缀, 依次编号为 tp1, tp2...
         """
         volatility_key = {0: 'volatility_small', 1: 'volatility_medium', 2: 'volatility_large'}[self.volatility_mode]
         tp_configs = self.cfg[volatility_key]
+        # 持仓和各档数量都在数量精度的网格上, 按精度舍入消除浮点误差
+        digits = self.precision_mgr.amount_precision
+        closed = 0 if position is None else round(max(0, self.last_position_amount - position), digits)
+        legs = []
         for idx, tp_config in enumerate(tp_configs, 1):
             atr_mult = tp_config['atr']
             pct = tp_config['pct']
             tp_price = self.base_price + (self.direction * atr_mult * self.atr_val)
             tp_price = self.precision_mgr.format_price(tp_price)
             tp_amount = self.precision_mgr.format_amount(self.full_amount * pct)
-            res_tp = self.order_mgr.place_limit(close_side, tp_amount, tp_price, reduce_only=True)
-            if not res_tp:
-                Log(f"⚠️ 止盈{idx}挂单失败", "#FF9900")
+            if closed > 0:
+                filled = min(closed, tp_amount)
+                closed -= filled
+                tp_amount = round(tp_amount - filled, digits)
+                if tp_amount < self.precision_mgr.min_amount:
+                    continue
+            legs.append({'name': f"{prefix}{idx}", 'label': f"止盈{idx}", 'type': "LIMIT", 'side': close_side,
+                         'quantity': tp_amount, 'price': tp_price, 'reduce_only': True})
+        return legs
 
     def _place_orders_after_base_entry(self):
         """
@@ -605,9 +799,6 @@ class OrderBasedStrategyManager:
         sl_price = self.precision_mgr.format_price(sl_price)
         # 止损方向: 做多时止损=卖出(SELL), 做空时止损=买入(BUY)
         sl_side = "SELL" if self.direction == 1 else "BUY"
-        res_sl = self.order_mgr.place_stop_market(self.symbol_for_api, sl_side, base_amount, sl_price, reduce_only=True)
-        if not res_sl:
-            Log("⚠️ 止损单挂单失败", "#FF9900")
         # 条件委托单: 浮盈0.1 ATR时市价加仓
         add_trigger_price = self.base_price + (self.direction * self.cfg['add_trigger'] * self.atr_val)
         add_trigger_price = self.precision_mgr.format_price(add_trigger_price)
@@ -615,27 +806,19 @@ class OrderBasedStrategyManager:
         add_amount = self.precision_mgr.format_amount(self.full_amount * self.cfg['add_position_pct'])
         # 加仓方向: 做多时加仓=买入(BUY), 做空时加仓=卖出(SELL)
         add_side = "BUY" if self.direction == 1 else "SELL"
-        res_add = self.order_mgr.place_stop_market(self.symbol_for_api, add_side, add_amount, add_trigger_price)
-        if not res_add:
-            Log("⚠️ 加仓触发单挂单失败", "#FF9900")
+        # 两个条件单并发提交
+        self._place_batch([
+            {'name': "sl", 'label': "止损单", 'type': "STOP_MARKET", 'side': sl_side,
+             'quantity': base_amount, 'stop_price': sl_price, 'reduce_only': True},
+            {'name': "add", 'label': "加仓触发单", 'type': "STOP_MARKET", 'side': add_side,
+             'quantity': add_amount, 'stop_price': add_trigger_price},
+        ])
 
-    def _place_orders_after_full_position(self):
+    def _exit_legs(self, position=None):
         """
-        步骤4: 满仓后的挂单动作
-        - 撤销原有止损单
-        - 挂新止损单 (-0.3 ATR, 满仓)
-        - 挂跟踪单平仓 (激活价0.3 ATR, 回调0.15 ATR, 满仓)
-        - 挂3个限价止盈单
+        满仓后的出场挂单: 跟踪止盈单 (激活价0.28 ATR, 回调0.15 ATR, 满仓) + 限价止盈单
+        position: 当前持仓数量, 止盈单按剩余仓位生成 (见 _tp_legs), 为None时按满仓
         """
-        # 先撤销所有挂单 - 包括FMZ订单和Algo订单
-        self.order_mgr.cancel_all_orders(self.symbol, self.symbol_for_api)
-        Sleep(500)
-        # 1. 新止损单 (-0.3 ATR, 满仓)
-        full_sl_price = self.base_price - (self.direction * self.cfg['full_sl_atr'] * self.atr_val)
-        full_sl_price = self.precision_mgr.format_price(full_sl_price)
-        sl_side = "SELL" if self.direction == 1 else "BUY"
-        self.order_mgr.place_stop_market(self.symbol_for_api, sl_side, self.full_amount, full_sl_price, reduce_only=True)
-        # 2. 跟踪单平仓 (激活价0.3 ATR, 回调0.15 ATR)
         trail_activation = self.base_price + (self.direction * self.cfg['trail_activation'] * self.atr_val)
         trail_activation = self.precision_mgr.format_price(trail_activation)
         callback_distance = self.cfg['trail_callback'] * self.atr_val
@@ -643,16 +826,57 @@ class OrderBasedStrategyManager:
         callback_rate = max(0.1, min(5.0, callback_rate))
         callback_rate = _N(callback_rate, 2)
         close_side = "SELL" if self.direction == 1 else "BUY"
-        self.order_mgr.place_trailing_stop(
-            self.symbol_for_api,
-            close_side,
-            self.full_amount,
-            callback_rate,
-            trail_activation,
-            reduce_only=True
-        )
-        # 3. 挂限价止盈单
-        self._place_tp_orders(close_side)
+        legs = [{'name': "trail", 'label': "跟踪止盈单", 'type': "TRAILING_STOP_MARKET", 'side': close_side,
+                 'quantity': self.full_amount, 'callback_rate': callback_rate,
+                 'activation_price': trail_activation, 'reduce_only': True}]
+        return legs + self._tp_legs(close_side, position)
+
+    def _place_orders_after_full_position(self, position=None):
+        """
+        步骤4: 满仓后的挂单动作
+        - 挂新止损单 (-0.3 ATR, 满仓)
+        - 挂跟踪单平仓 (激活价0.28 ATR, 回调0.15 ATR, 满仓)
+        - 挂3个限价止盈单
+        - 新单提交后撤销底仓止损等原有挂单
+        position: 当前持仓数量 (重启补挂时止盈可能已部分成交), 为None时按满仓
+        """
+        full_sl_price = self.base_price - (self.direction * self.cfg['full_sl_atr'] * self.atr_val)
+        full_sl_price = self.precision_mgr.format_price(full_sl_price)
+        sl_side = "SELL" if self.direction == 1 else "BUY"
+        # 止损、跟踪单和限价止盈单一次批量提交, 之后才撤旧单, 加仓成交后没有无保护窗口
+        legs = [{'name': "fsl", 'label': "满仓止损单", 'type': "STOP_MARKET", 'side': sl_side,
+                 'quantity': self.full_amount, 'stop_price': full_sl_price, 'reduce_only': True}]
+        self._sync_orders(legs + self._exit_legs(position))
+
+    def pending_levels(self, native=True):
+        """
+        待触发价位 (供 AdaptivePoller 按距离计算下次检查间隔)
+        native: 是否包含交易所条件单的价位 (入场/加仓/止损/跟踪激活);
+                事件驱动模式下条件单成交有推送, 只需保护性止损触发价这一程序内按最新价判断的价位
+        """
+        levels = []
+        if self.state == "WAIT_ENTRY":
+            if native and self.entry_mode in (2, 4):
+                levels.append(self.entry_limit_price)
+        elif self.state == "ENTRY_DONE":
+            if native:
+                levels.append(self.base_price + self.direction * self.cfg['add_trigger'] * self.atr_val)
+                levels.append(self.base_price - self.direction * self.cfg['sl_atr'] * self.atr_val)
+        elif self.state == "WAIT_EXIT":
+            if not self.protective_sl_placed:
+                levels.append(self.base_price + self.direction * self.cfg['protective_sl_trigger'] * self.atr_val)
+            if native:
+                sl_atr = self.cfg['protective_sl_offset'] if self.protective_sl_placed else self.cfg['full_sl_atr']
+                levels.append(self.base_price - self.direction * sl_atr * self.atr_val)
+                levels.append(self.base_price + self.direction * self.cfg['trail_activation'] * self.atr_val)
+        return levels
+
+    def status_model(self):
+        """状态栏展示的字段 (StatusRenderer 据此判断是否需要重建状态文本)"""
+        if self.state == "WAIT_CONFIRM":
+            return (self.state, tuple(sorted(self.pending_confirm_info.items())))
+        return (self.state, self.symbol, self.direction, tuple(self.entry_config.values()),
+                self.atr_val, self.full_amount, self.base_price, self.last_position_amount)
 
     def get_status_info(self):
         """获取状态信息"""
@@ -689,6 +913,145 @@ class OrderBasedStrategyManager:
         lines.append("=" * 50)
         return "\n".join(lines)
 
+# ============================================================
+# 多币种组合托管
+# ============================================================
+class PortfolioHost:
+    """
+    一个机器人同时托管多个币种: 每个币种一个独立的 OrderBasedStrategyManager
+    - 每轮按计价币种各调用一次 GetPositions (如 USDT.swap)，再加一次 GetTickers，
+      并发提交，请求数不随运行中的交易数量增长
+    - 界面命令按币种路由；确认/取消作用于最近一次发起、等待确认的币种
+    """
+    def __init__(self, exchange, config, symbols):
+        self.ex = exchange
+        self.notifier = ext.NotificationManager(exchange)
+        self.managers = {symbol: OrderBasedStrategyManager(exchange, config,
+                                                           ext.StateJournal(f"state_{symbol}") if PERSIST_STATE else None,
+                                                           self.notifier)
+                         for symbol in symbols}
+        self.pending_symbol = ""  # 等待确认的币种
+        self.prices = {}  # 最近一次共享行情的最新价
+
+    def restore(self):
+        """启动时逐个币种恢复持久化的交易, 返回恢复的币种列表"""
+        restored = []
+        for symbol, manager in self.managers.items():
+            try:
+                if manager.restore():
+                    restored.append(symbol)
+            except Exception as e:
+                Log(f"❌ [{symbol}] 状态恢复错误: {e}", "#FF0000")
+        return restored
+
+    def active_managers(self):
+        """已进入交易流程(需要检查仓位)的实例"""
+        return [m for m in self.managers.values() if m.state != "IDLE" and m.state != "WAIT_CONFIRM"]
+
+    @property
+    def need_reconcile(self):
+        return any(m.need_reconcile for m in self.managers.values())
+
+    @property
+    def pending(self):
+        manager = self.managers.get(self.pending_symbol)
+        return manager if manager and manager.state == "WAIT_CONFIRM" else None
+
+    def start_entry(self, symbol, *args):
+        manager = self.managers[symbol]
+        if self.pending and self.pending is not manager:
+            Log(f"⚠️ {self.pending_symbol} 等待确认中，请先确认或取消", "#FF9900")
+            return False
+        if manager.start_entry(symbol, *args):
+            self.pending_symbol = symbol
+            return True
+        return False
+
+    def confirm_entry(self):
+        manager = self.pending
+        if not manager:
+            Log("⚠️ 没有等待确认的开仓", "#FF9900")
+            return False
+        return manager.confirm_entry()
+
+    def cancel_entry(self):
+        manager = self.pending
+        if not manager:
+            Log("⚠️ 没有等待确认的开仓", "#FF9900")
+            return False
+        return manager.cancel_entry()
+
+    def reset(self, symbol=""):
+        """重置指定币种, symbol为空时重置全部运行中的实例"""
+        targets = [self.managers[symbol]] if symbol else [m for m in self.managers.values() if m.state != "IDLE"]
+        for manager in targets:
+            manager._reset()
+
+    def check_all(self):
+        """共享一次持仓/行情查询, 推进所有运行中实例的状态机"""
+        active = self.active_managers()
+        if not active:
+            return
+        quotes = sorted({m.symbol.split("_")[1] for m in active})
+        position_goes = [(quote, self.ex.Go("GetPositions", f"{quote}.swap")) for quote in quotes]
+        tickers_go = self.ex.Go("GetTickers")
+        positions = {}
+        failed_quotes = set()
+        for quote, handle in position_goes:
+            try:
+                ret, _ = handle.wait()
+            except Exception:
+                ret = None
+            if ret is None:
+                failed_quotes.add(quote)
+                continue
+            for p in ret:
+                if p['Amount'] > 0:
+                    positions[(p['Symbol'].split(".")[0], p['Type'])] = (p['Amount'], p['Price'])
+        try:
+            tickers, _ = tickers_go.wait()
+        except Exception:
+            tickers = None
+        prices = {t['Symbol'].split(".")[0]: t['Last'] for t in tickers or []}
+        self.prices = prices
+        for manager in active:
+            try:
+                if manager.symbol.split("_")[1] in failed_quotes:
+                    # 共享查询失败时该实例自行查询
+                    manager.check_position_and_update_state()
+                    continue
+                position_type = PD_LONG if manager.direction == 1 else PD_SHORT
+                position = positions.get((manager.symbol, position_type), (0, 0))
+                manager.check_position_and_update_state(position, prices.get(manager.symbol, 0))
+            except Exception as e:
+                Log(f"❌ [{manager.symbol}] 状态更新错误: {e}", "#FF0000")
+
+    def next_interval(self, poller, native=True, default=None):
+        """按各运行中交易的最新价与待触发价位的距离, 计算下一次检查的间隔(毫秒)"""
+        targets = [(self.prices.get(m.symbol, 0), m.pending_levels(native), m.atr_val) for m in self.active_managers()]
+        if not targets:
+            return poller.interval([], POLL_IDLE if default is None else default)
+        return poller.interval(targets, default)
+
+    def on_stream_event(self, event):
+        for manager in self.active_managers():
+            manager.on_stream_event(event)
+
+    def status_model(self):
+        """与 get_status_info 对应的展示字段"""
+        if self.pending:
+            return (self.pending_symbol, self.pending.status_model())
+        return tuple(m.status_model() for m in self.managers.values() if m.state != "IDLE")
+
+    def get_status_info(self):
+        """等待确认时显示确认信息, 否则显示所有运行中实例的状态"""
+        if self.pending:
+            return "\n".join(self.pending.get_confirm_info())
+        running = [m for m in self.managers.values() if m.state != "IDLE"]
+        if not running:
+            return next(iter(self.managers.values())).get_status_info()
+        return "\n".join(m.get_status_info() for m in running)
+
 # ============================================================
 # 主程序
 # ============================================================
@@ -700,8 +1063,31 @@ def main():
     Log("🚀 基于挂单的策略启动", "#00FF00")
     exchange.SetContractType("swap")
 
-    # 初始化策略管理器 (直接使用ext对象中的工具类)
-    strategy = OrderBasedStrategyManager(exchange, STRATEGY_CONFIG)
+    # 性能统计: 未开启时直接使用原始对象, 没有额外开销
+    profiler = ext.Profiler() if PROFILE else None
+    ex = profiler.wrap(exchange) if profiler else exchange
+    log_status = profiler.timed("LogStatus", LogStatus) if profiler else LogStatus
+    get_command = profiler.timed("GetCommand", GetCommand) if profiler else GetCommand
+    sleep = profiler.timed("Sleep", Sleep) if profiler else Sleep
+
+    # 初始化组合托管: 每个币种一个策略管理器 (直接使用ext对象中的工具类)
+    host = PortfolioHost(ex, STRATEGY_CONFIG, MY_SYMBOLS)
+    if profiler:
+        profiler.instrument(host, ("check_all",), "PortfolioHost.")
+        for manager in host.managers.values():
+            profiler.instrument(manager, PROFILED_METHODS, "Manager.")
+    # 预热全部交易对精度和常用币种的ATR缓存, 开仓确认时无需再请求行情元数据
+    # ATR预热为低优先级请求, 由调度器在请求权重充足时执行
+    scheduler = ext.RequestScheduler.get_default()
+    retry = ext.RetryPolicy.get_default()
+    ext.PrecisionManager.prefetch(ex)
+    scheduler.defer("atr_prefetch", ext.ATRCalculator.prefetch, ex, MY_SYMBOLS, STRATEGY_CONFIG['atr_period'],
+                    costs={'weight': 5 * len(MY_SYMBOLS)})
+    # 恢复重启前运行中的交易 (与实时仓位和挂单对账)
+    if PERSIST_STATE:
+        restored = host.restore()
+        if restored:
+            Log(f"♻️ 已恢复 {len(restored)} 个交易: {', '.join(restored)}", "#00FF00")
     # UI按钮配置
     btn_trade = {
         "type": "button",
@@ -719,55 +1105,119 @@ def main():
     }
     btn_confirm = {"type": "button", "cmd": "ConfirmEntry", "name": "✅ 确认开仓"}
     btn_cancel = {"type": "button", "cmd": "CancelEntry", "name": "❌ 取消"}
-    btn_reset = {"type": "button", "cmd": "ResetStrategy", "name": "🔄 重置策略"}
+    btn_reset = {
+        "type": "button",
+        "cmd": "ResetStrategy",
+        "name": "🔄 重置策略",
+        "group": [
+            {"name": "symbol", "type": "selected", "defValue": 0, "options": ["全部"] + MY_SYMBOLS, "description": "重置币种"}
+        ]
+    }
     btn_info = {"type": "button", "cmd": "ShowInfo", "name": "📊 查看状态"}
-    ui_layout = (
-        f'`{json.dumps(btn_trade, ensure_ascii=False)}`\n' +
-        f'`{json.dumps(btn_confirm, ensure_ascii=False)}`\n' +
-        f'`{json.dumps(btn_cancel, ensure_ascii=False)}`\n' +
-        f'`{json.dumps(btn_reset, ensure_ascii=False)}`\n' +
-        f'`{json.dumps(btn_info, ensure_ascii=False)}`'
-    )
-    status_display = "等待操作..."
-    # 主循环
-    while True:
-        try:
-            # 定期检查仓位变化
-            strategy.check_position_and_update_state()
-            # UI渲染
-            if strategy.state == "WAIT_CONFIRM":
-                confirm_info = strategy.get_confirm_info()
-                status_display = "\n".join(confirm_info)
-            else:
-                status_display = strategy.get_status_info()
-            LogStatus(f"{ui_layout}\n\n最后更新: {_D()}\n\n{status_display}")
-            # 处理命令
-            cmd = GetCommand()
-            if cmd:
-                try:
-                    if cmd.startswith("TradeCmd:"):
-                        data = json.loads(cmd.split(":", 1)[1])
-                        symbol = MY_SYMBOLS[int(data['symbol'])]
-                        direction = "buy" if int(data['direction']) == 0 else "sell"
-                        mode = int(data['mode']) + 1
-                        volatility_mode = int(data.get('volatility', 0))  # 0=小波动, 1=中波动, 2=大波动
-                        max_loss = float(data['max_loss'])
-                        atr_percentage = float(data.get('atr_percentage', 0))  # 0表示使用默认周期
-                        limit_price = float(data.get('limit_price', 0))
-                        strategy.start_entry(symbol, direction, max_loss, mode, limit_price, volatility_mode, atr_percentage)
-                    elif cmd == "ConfirmEntry":
-                        strategy.confirm_entry()
-                    elif cmd == "CancelEntry":
-                        strategy.cancel_entry()
-                    elif cmd == "ResetStrategy":
-                        strategy._reset()
-                    elif cmd == "ShowInfo":
-                        status_display = strategy.get_status_info()
-                except Exception as e:
-                    Log(f"❌ 指令处理错误: {e}", "#FF0000")
-        except Exception as e:
-            Log(f"❌ 主循环错误: {e}", "#FF0000")
-        Sleep(2000)  # 每2秒循环一次
+    # 按钮布局只序列化一次, 状态内容变化或到达心跳间隔时才推送状态栏
+    renderer = ext.StatusRenderer([btn_trade, btn_confirm, btn_cancel, btn_reset, btn_info], UI_HEARTBEAT, log_status)
+    # 事件源: 用户数据流(或本地回放)，不可用时回退到轮询
+    stream = None
+    if STREAM_REPLAY_FILE:
+        stream = ext.ReplayEventSource(STREAM_REPLAY_FILE)
+    elif USE_USER_STREAM:
+        stream = ext.UserDataStream(ex)
+        if not stream.connect():
+            Log("⚠️ 用户数据流不可用，回退到轮询模式", "#FF9900")
+            stream = None
+    # 自适应检查间隔: 接近触发价时加快, 远离时放慢
+    poller = ext.AdaptivePoller(POLL_FLOOR, POLL_CEILING, POLL_NEAR_ATR, POLL_FAR_ATR, POLL_IDLE)
+    if stream:
+        poll = profiler.timed("stream.poll", stream.poll) if profiler else stream.poll
+
+    def wait(ms):
+        """任务之间的等待: 事件模式下等待推送, 到达后立即推进状态机; 收到成交时立即对账"""
+        if not stream:
+            sleep(ms)
+            return
+        for event in poll(ms):
+            try:
+                host.on_stream_event(event)
+            except Exception as e:
+                Log(f"❌ 事件处理错误: {e}", "#FF0000")
+        host.notifier.flush()
+        if host.need_reconcile:
+            loop.trigger("check")
+
+    def check_interval():
+        """轮询模式按距触发价的距离; 事件模式按对账间隔, 临近保护性止损触发价时缩短"""
+        if stream:
+            return host.next_interval(poller, native=False, default=RECONCILE_INTERVAL)
+        return host.next_interval(poller)
+
+    def check():
+        # 执行延后的低优先级请求
+        scheduler.run_deferred()
+        host.check_all()
+        host.notifier.flush()
+        loop.trigger("ui")
+        if profiler:
+            profiler.end_loop()
+
+    def render():
+        renderer.render(host.status_model(), host.get_status_info)
+
+    def handle_command(cmd):
+        if cmd.startswith("TradeCmd:"):
+            data = json.loads(cmd.split(":", 1)[1])
+            symbol = MY_SYMBOLS[int(data['symbol'])]
+            direction = "buy" if int(data['direction']) == 0 else "sell"
+            mode = int(data['mode']) + 1
+            volatility_mode = int(data.get('volatility', 0))  # 0=小波动, 1=中波动, 2=大波动
+            max_loss = float(data['max_loss'])
+            atr_percentage = float(data.get('atr_percentage', 0))  # 0表示使用默认周期
+            limit_price = float(data.get('limit_price', 0))
+            host.start_entry(symbol, direction, max_loss, mode, limit_price, volatility_mode, atr_percentage)
+        elif cmd == "ConfirmEntry":
+            # 确认后立即检查一次仓位 (市价入场可直接推进到底仓建立)
+            if host.confirm_entry():
+                loop.trigger("check")
+        elif cmd == "CancelEntry":
+            host.cancel_entry()
+        elif cmd.startswith("ResetStrategy"):
+            data = json.loads(cmd.split(":", 1)[1]) if ":" in cmd else {}
+            index = int(data.get('symbol', 0))
+            host.reset(MY_SYMBOLS[index - 1] if index > 0 else "")
+        elif cmd == "ShowInfo":
+            # 各操作实际付出的等待 (重试退避 + 限频排队)
+            for line in retry.report():
+                Log(f"⏱️ {line}")
+            Log(f"⏱️ 限频排队: 请求{scheduler.stats['requests']}次 等待{scheduler.stats['waited_ms']}ms")
+            if profiler:
+                for line in profiler.report():
+                    Log(f"📈 {line}")
+                profiler.dump(PROFILE_FILE)
+            Log(f"⏲️ {poller.report()}")
+            Log(f"🖥️ {renderer.report()}")
+            Log(f"📨 {host.notifier.report()}")
+            renderer.invalidate()
+            triggers = ext.TriggerTracker.get_default()
+            for line in triggers.report():
+                Log(f"🎯 {line}")
+
+    def commands():
+        """读取并执行全部排队的界面命令, 执行后立即刷新状态栏"""
+        cmd = get_command()
+        while cmd:
+            try:
+                handle_command(cmd)
+            except Exception as e:
+                Log(f"❌ 指令处理错误: {e}", "#FF0000")
+            loop.trigger("ui")
+            cmd = get_command()
+        host.notifier.flush()
+
+    # 主循环: 命令、仓位检查、界面刷新各按自己的间隔调度, 命令最先执行
+    loop = ext.LoopScheduler(wait)
+    loop.every("commands", COMMAND_INTERVAL, commands)
+    loop.every("check", check_interval, check)
+    loop.every("ui", UI_INTERVAL, render)
+    loop.run()
 
 # 启动主程序
 if __name__ == "__main__":
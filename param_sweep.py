@@ -0,0 +1,200 @@
+"""
+STRATEGY_CONFIG 参数扫描
+在进程池中并行回测网格/随机参数组合, 按期望值和最大回撤排序
+- K线在主进程加载一次, 以 array 列存储; fork 出的工作进程直接继承这块只读内存,
+  不做序列化复制 (非fork平台退化为每个工作进程自行加载一次)
+- 每个工作进程缓存编译后的策略代码, 单个组合只返回汇总统计, 进程间通信量极小
+
+命令行:
+    python param_sweep.py --klines BTC_USDT_1m.csv --grid --out sweep.csv
+    python param_sweep.py --klines BTC_USDT_1m.csv --random 20000 --space space.json
+"""
+import argparse
+import copy
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from backtest import Backtester, PrevDaySignal
+from fmz_simulator import MarketSpec, load_klines
+
+# 默认扫描空间: 列表=候选值, 二元组=(下限, 上限)均匀随机 (仅随机模式)
+# tp_scale 为虚拟参数: 三档止盈阶梯的ATR倍数整体缩放
+DEFAULT_SPACE = {
+    'sl_atr': [0.4, 0.5, 0.6, 0.8],
+    'add_trigger': [0.05, 0.1, 0.15],
+    'protective_sl_trigger': [0.15, 0.2, 0.3],
+    'protective_sl_offset': [0.1, 0.2],
+    'full_sl_atr': [0.2, 0.3, 0.4],
+    'trail_activation': [0.2, 0.28, 0.4],
+    'trail_callback': [0.1, 0.15, 0.2],
+    'tp_scale': [0.8, 1.0, 1.2],
+}
+LADDER_KEYS = ('volatility_small', 'volatility_medium', 'volatility_large')
+
+# 工作进程共享的只读数据 (fork前在主进程赋值)
+_KLINES = None
+_JOB = None
+
+
+def grid_configs(space):
+    """网格组合 (只取列表形式的候选值)"""
+    keys = [k for k, v in space.items() if isinstance(v, list)]
+    for values in itertools.product(*(space[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+
+def random_configs(space, count, seed=0):
+    """随机组合: 列表随机取值, 二元组在区间内均匀取值(保留3位小数)"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        params = {}
+        for k, v in space.items():
+            if isinstance(v, list):
+                params[k] = rng.choice(v)
+            else:
+                params[k] = round(rng.uniform(v[0], v[1]), 3)
+        yield params
+
+
+def expand_params(params, base_config):
+    """把扫描参数展开为策略配置覆盖项 (处理 tp_scale 虚拟参数)"""
+    overrides = {k: v for k, v in params.items() if k != 'tp_scale'}
+    scale = params.get('tp_scale')
+    if scale is not None:
+        for key in LADDER_KEYS:
+            ladder = overrides.get(key, base_config.get(key))
+            if ladder:
+                overrides[key] = [{'atr': tp['atr'] * scale, 'pct': tp['pct']} for tp in ladder]
+    return overrides
+
+
+def _init_worker(klines_path, job):
+    """非fork平台: 每个工作进程自行加载K线"""
+    global _KLINES, _JOB
+    if _KLINES is None:
+        _KLINES = load_klines(klines_path)
+    _JOB = job
+
+
+def _run_one(item):
+    """工作进程: 回测单个参数组合, 只返回汇总统计"""
+    idx, params = item
+    job = _JOB
+    spec = MarketSpec(job['price_precision'], job['amount_precision'], job['min_qty'])
+    signal = PrevDaySignal(job['max_loss'], job['entry_mode'], job['volatility_mode'])
+    try:
+        bt = Backtester(job['strategy'], job['symbol'], _KLINES, spec, signal=signal)
+        bt.cfg.update(expand_params(params, bt.cfg))
+        summary = bt.run().summary()
+        summary['error'] = ""
+    except Exception as e:
+        summary = {'trades': 0, 'expectancy': float('-inf'), 'max_drawdown': float('inf'), 'error': str(e)}
+    return idx, params, summary
+
+
+def mark_pareto(rows):
+    """标记 (期望值越高越好, 回撤越低越好) 的帕累托前沿; rows需已按期望值降序"""
+    best_dd = float('inf')
+    for row in rows:
+        row['pareto'] = row['max_drawdown'] < best_dd
+        if row['pareto']:
+            best_dd = row['max_drawdown']
+
+
+def run_sweep(klines_path, configs, job, workers=None, progress_every=100):
+    """
+    并行扫描, 返回按 (期望值降序, 回撤升序) 排序的结果列表
+    configs: 参数dict的可迭代对象
+    job: 回测公共参数 (strategy/symbol/精度/max_loss/入场模式等)
+    """
+    global _KLINES, _JOB
+    workers = workers or os.cpu_count()
+    methods = multiprocessing.get_all_start_methods()
+    if 'fork' in methods:
+        # fork前加载: 子进程共享父进程的K线内存页
+        _KLINES = load_klines(klines_path)
+        _JOB = job
+        pool = multiprocessing.get_context('fork').Pool(workers)
+    else:
+        pool = multiprocessing.get_context().Pool(workers, _init_worker, (klines_path, job))
+    rows = []
+    started = time.time()
+    with pool:
+        for n, (idx, params, summary) in enumerate(pool.imap_unordered(_run_one, enumerate(configs), chunksize=4), 1):
+            row = dict(params)
+            row.update(summary)
+            row['config_id'] = idx
+            rows.append(row)
+            if progress_every and n % progress_every == 0:
+                rate = n / (time.time() - started)
+                print(f"已完成 {n} 组, {rate:.1f} 组/秒")
+    rows.sort(key=lambda r: (-r['expectancy'], r['max_drawdown']))
+    mark_pareto(rows)
+    return rows
+
+
+def write_results(rows, path):
+    """写出扫描结果CSV (阶梯等列表参数以JSON写出)"""
+    if not rows:
+        return
+    fields = []
+    for row in rows:
+        for k in row:
+            if k not in fields:
+                fields.append(k)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: json.dumps(v) if isinstance(v, (list, dict)) else v for k, v in row.items()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="STRATEGY_CONFIG 并行参数扫描")
+    parser.add_argument("--klines", required=True)
+    parser.add_argument("--symbol", default="BTC_USDT")
+    parser.add_argument("--strategy", default="order_strategy_main.py")
+    parser.add_argument("--price-precision", type=int, default=1)
+    parser.add_argument("--amount-precision", type=int, default=3)
+    parser.add_argument("--min-qty", type=float, default=0.001)
+    parser.add_argument("--max-loss", type=float, default=50)
+    parser.add_argument("--mode", type=int, default=1)
+    parser.add_argument("--volatility", type=int, default=1)
+    parser.add_argument("--space", default="", help="扫描空间JSON文件 (默认 DEFAULT_SPACE)")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--grid", action="store_true", help="网格扫描")
+    group.add_argument("--random", type=int, default=0, help="随机扫描组合数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--out", default="sweep_results.csv")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    space = copy.deepcopy(DEFAULT_SPACE)
+    if args.space:
+        with open(args.space, 'r') as f:
+            # JSON中区间写作 {"lo": 下限, "hi": 上限}
+            space = {k: (v['lo'], v['hi']) if isinstance(v, dict) else v for k, v in json.load(f).items()}
+    configs = grid_configs(space) if args.grid else random_configs(space, args.random, args.seed)
+    job = {
+        'strategy': args.strategy, 'symbol': args.symbol,
+        'price_precision': args.price_precision, 'amount_precision': args.amount_precision,
+        'min_qty': args.min_qty, 'max_loss': args.max_loss,
+        'entry_mode': args.mode, 'volatility_mode': args.volatility,
+    }
+    rows = run_sweep(args.klines, configs, job, args.workers or None)
+    write_results(rows, args.out)
+    print(f"共 {len(rows)} 组, 结果已写入 {args.out}")
+    for row in rows[:args.top]:
+        params = {k: row[k] for k in space if k in row}
+        print(f"期望={row['expectancy']:.2f} R={row.get('expectancy_r', 0):.3f} 回撤={row['max_drawdown']:.2f} "
+              f"笔数={row['trades']} {'★' if row['pareto'] else ' '} {params}")
+
+
+if __name__ == "__main__":
+    main()
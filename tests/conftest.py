@@ -0,0 +1,57 @@
+"""
+测试公共夹具
+策略文件在 fmz_simulator 的模拟环境中加载, 不访问网络
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from fmz_simulator import MarketSpec, Simulator  # noqa: E402
+
+START = 1700000000000
+MAIN_STRATEGY = os.path.join(ROOT, "order_strategy_main.py")
+PRICES = {"BTC_USDT": 30000, "ETH_USDT": 2000}
+
+
+@pytest.fixture
+def sim():
+    """BTC/ETH两个交易对的模拟环境, 时钟位于START"""
+    s = Simulator({"BTC_USDT": MarketSpec(1, 3), "ETH_USDT": MarketSpec(2, 2)}, start_time=START)
+    for symbol, price in PRICES.items():
+        s.step(symbol, START, price)
+    return s
+
+
+@pytest.fixture
+def main_ns(sim):
+    """order_strategy_main.py 的模块命名空间 (不执行main)"""
+    return sim.load_strategy(MAIN_STRATEGY)
+
+
+def logged(sim, text):
+    """模拟器日志中包含text的行"""
+    return [line for _, line in sim.logs if text in line]
+
+
+def open_trade(sim, host, symbol, direction="buy", price=None):
+    """发起并确认一笔市价入场 (ATR按价格的1%), 推进到底仓建立 (ENTRY_DONE)"""
+    price = price or PRICES[symbol]
+    assert host.start_entry(symbol, direction, 50, 1, 0, 1, 1)
+    assert host.confirm_entry()
+    sim.step(symbol, sim.now + 1000, price)
+    host.check_all()
+    manager = host.managers[symbol]
+    assert manager.state == "ENTRY_DONE"
+    return manager
+
+
+def open_orders(sim, symbol):
+    """交易对上未完成挂单的订单腿名称 (客户端订单ID的最后一段)"""
+    market = sim.exchange.markets[symbol]
+    legs = [o['client_id'] for o in market.orders] + [a['client_id'] for a in market.algo_orders]
+    return sorted(cid.split("-")[-1] for cid in legs)
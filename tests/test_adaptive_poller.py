@@ -0,0 +1,39 @@
+"""AdaptivePoller: 检查间隔随最新价到待触发价位的距离变化"""
+from conftest import open_orders, open_trade
+
+
+def test_interval_interpolates_between_floor_and_ceiling(sim):
+    poller = sim.load_template().AdaptivePoller(floor=500, ceiling=5000, near_atr=0.05, far_atr=1.0, idle=2000)
+    assert poller.interval([(100.0, [100.5], 10.0)]) == 500       # 0.05 ATR
+    assert poller.interval([(100.0, [120.0], 10.0)]) == 5000      # 2 ATR
+    assert poller.interval([(100.0, [105.25], 10.0)]) == 2750     # 0.525 ATR, 中点
+    # 多个交易取最近的价位, 无效价格/价位忽略
+    assert poller.interval([(100.0, [120.0], 10.0), (50.0, [50.2, 0], 4.0)]) == 500
+    assert poller.interval([(0, [100.0], 10.0)]) == 2000
+    assert poller.interval([], default=800) == 800
+
+
+def test_protective_trigger_level_is_reachable(sim, main_ns):
+    """临近保护性止损触发价时间隔收紧到下限, 最新价越过触发价后的检查即挂出保护性止损"""
+    host = main_ns['PortfolioHost'](sim.exchange, main_ns['STRATEGY_CONFIG'], ["BTC_USDT"])
+    poller = sim.load_template().AdaptivePoller(500, 5000, 0.05, 1.0, 2000)
+    manager = open_trade(sim, host, "BTC_USDT")
+    # 满仓: 底仓30000, ATR=300, 加仓触发30030, 保护性止损触发30060
+    sim.step("BTC_USDT", sim.now + 1000, 30030)
+    host.check_all()
+    assert manager.state == "WAIT_EXIT"
+    trigger = manager.base_price + manager.cfg['protective_sl_trigger'] * manager.atr_val
+
+    sim.step("BTC_USDT", sim.now + 1000, trigger - 10)
+    host.check_all()
+    assert not manager.protective_sl_placed
+    assert manager.pending_levels(native=False) == [trigger]
+    assert host.next_interval(poller, native=False) == 500
+
+    sim.step("BTC_USDT", sim.now + 1000, trigger + 5)
+    host.check_all()
+    assert manager.protective_sl_placed
+    assert "psl" in open_orders(sim, "BTC_USDT") and "fsl" not in open_orders(sim, "BTC_USDT")
+    # 触发价已处理, 事件驱动模式下不再有待触发价位
+    assert manager.pending_levels(native=False) == []
+    assert host.next_interval(poller, native=False, default=3000) == 3000
@@ -0,0 +1,73 @@
+"""ATRService: 增量缓存的ATR与 TA.ATR 一致 (模板类库和 order_based_strategy.py 中的副本)"""
+import os
+
+import pytest
+
+from conftest import ROOT
+from fmz_simulator import DAY_MS, MarketSpec, Simulator, _TA
+
+T0 = 1702598400000  # UTC日切
+# 30根高低价/跳空各不相同的日线
+HISTORY = [{'Time': T0 - (30 - i) * DAY_MS, 'Open': 100 + i, 'High': 104 + i + i % 7, 'Low': 97 + i - i % 5,
+            'Close': 100 + i + (i % 3 - 1) * 2, 'Volume': 0} for i in range(30)]
+
+
+@pytest.fixture(params=["template", "order_based_strategy"])
+def env(request):
+    sim = Simulator({"BTC_USDT": MarketSpec(2, 3, history=HISTORY)}, start_time=T0 + 3600000, log_level=0)
+    sim.step("BTC_USDT", sim.now, 131)
+    if request.param == "template":
+        service_cls = sim.load_template().ATRService
+    else:
+        service_cls = sim.load_strategy(os.path.join(ROOT, "order_based_strategy.py"))['ATRService']
+    return sim, service_cls
+
+
+@pytest.fixture(params=["numpy", "pure"])
+def numpy_mode(request, env, monkeypatch):
+    _, service_cls = env
+    if request.param == "numpy":
+        monkeypatch.setitem(service_cls._true_range.__globals__, 'np', pytest.importorskip("numpy"))
+    else:
+        monkeypatch.setitem(service_cls._true_range.__globals__, 'np', None)
+    return request.param
+
+
+def expected(sim, period):
+    """TA.ATR 在全部日线 (最后一根为今日未收盘) 上的倒数第二个值, 即昨日收盘的ATR"""
+    return _TA.ATR(sim.exchange.markets["BTC_USDT"].daily, period)[-2]
+
+
+def test_cold_incremental_and_cached_match_ta_atr(env, numpy_mode):
+    sim, service_cls = env
+    service = service_cls(sim.exchange)
+    records = []
+    get_records = sim.exchange.GetRecords
+    sim.exchange.GetRecords = lambda *args: records.append(sim.now) or get_records(*args)
+
+    # 冷启动: 从全部已收盘日线重建
+    assert service.get_atr("BTC_USDT", 20) == pytest.approx(expected(sim, 20), rel=1e-12)
+    assert len(records) == 1
+    # 同一UTC日内命中缓存, 不请求K线
+    sim.step("BTC_USDT", sim.now + 3600000, 140)
+    assert service.get_atr("BTC_USDT", 20) == pytest.approx(expected(sim, 20), rel=1e-12)
+    assert len(records) == 1
+    # 日切后只追加新收盘的日线
+    count = service.states["BTC_USDT:20"]['count']
+    for day in (1, 2, 3):
+        sim.step("BTC_USDT", T0 + day * DAY_MS + 1000, 128 + day)
+        assert service.get_atr("BTC_USDT", 20) == pytest.approx(expected(sim, 20), rel=1e-12)
+        assert service.states["BTC_USDT:20"]['count'] == count + day
+    assert len(records) == 4
+    # 包含今日未收盘K线时与 TA.ATR 的最后一个值一致
+    today = _TA.ATR(sim.exchange.markets["BTC_USDT"].daily, 20)[-1]
+    assert service.get_atr("BTC_USDT", 20, exclude_today=False) == pytest.approx(today, rel=1e-12)
+
+
+def test_prefetch_restores_contract_type_and_currency(env):
+    sim, service_cls = env
+    sim.exchange.SetContractType("quarter")
+    sim.exchange.SetCurrency("BTC_USDT")
+    service_cls(sim.exchange).prefetch(["BTC_USDT"], 20)
+    assert sim.exchange.GetContractType() == "quarter"
+    assert sim.exchange.GetCurrency() == "BTC_USDT"
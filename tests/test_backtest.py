@@ -0,0 +1,69 @@
+"""Backtester: 合成K线驱动主策略状态机, 检查逐笔交易报告"""
+import pytest
+
+from backtest import Backtester, ScheduledEntries
+from fmz_simulator import DAY_MS, KlineSeries, MarketSpec
+
+from conftest import MAIN_STRATEGY, logged
+
+T0 = 1702598400000  # UTC日切
+# 回测前25根日线, 真实波幅恒为300 -> ATR(20)=300
+HISTORY = [{'Time': T0 - (25 - i) * DAY_MS, 'Open': 30000, 'High': 30150, 'Low': 29850, 'Close': 30000, 'Volume': 0}
+           for i in range(25)]
+
+
+def run(bars, direction, entries=None):
+    klines = KlineSeries()
+    for i, (o, h, l, c) in enumerate(bars):
+        klines.append(T0 + i * 60000, o, h, l, c)
+    entries = entries or [(T0, 50)]
+    signal = ScheduledEntries([(t, {'direction': direction, 'max_loss': max_loss, 'entry_mode': 1, 'volatility_mode': 1})
+                               for t, max_loss in entries])
+    bt = Backtester(MAIN_STRATEGY, "BTC_USDT", klines, MarketSpec(1, 3, 0.001, history=HISTORY), signal=signal, log_level=1)
+    return bt, bt.run()
+
+
+def test_winning_long_runs_through_protective_stop_and_take_profits():
+    # 入场30000 -> 加仓30030 -> 保护性止损触发30060 -> 止盈阶梯/跟踪激活 -> 回落触发跟踪止盈
+    bars = [(30000, 30000, 30000, 30000), (30000, 30040, 30000, 30040), (30040, 30070, 30040, 30070),
+            (30070, 30220, 30070, 30220), (30220, 30220, 30100, 30100), (30100, 30100, 30100, 30100)]
+    bt, result = run(bars, "buy")
+    assert bt.strategy.state == "IDLE"
+    assert logged(bt.sim, "保护性止损体系已建立")
+    [trade] = result.trades
+    assert trade['direction'] == "long"
+    assert trade['entry_price'] == 30000
+    assert trade['max_position'] == pytest.approx(0.415)
+    assert trade['exit_kinds'] == "LIMIT+TRAILING_STOP_MARKET"
+    assert 30105 < trade['exit_price'] < 30220
+    assert trade['net_pnl'] == pytest.approx(trade['gross_pnl'] - trade['fees'])
+    assert trade['net_pnl'] > 0
+    summary = result.summary()
+    assert summary['trades'] == 1 and summary['win_rate'] == 1.0
+    assert summary['net_pnl'] == pytest.approx(trade['net_pnl'])
+
+
+def test_losing_short_stops_out_at_base_stop():
+    bars = [(30000, 30000, 30000, 30000), (30000, 30200, 30000, 30200), (30200, 30200, 30200, 30200)]
+    bt, result = run(bars, "sell")
+    [trade] = result.trades
+    assert trade['direction'] == "short"
+    assert trade['max_position'] == pytest.approx(0.166)   # 只有底仓
+    assert trade['exit_kinds'] == "STOP_MARKET"
+    assert trade['exit_price'] == pytest.approx(30180)     # +0.6 ATR
+    assert trade['net_pnl'] < 0
+    assert trade['r_multiple'] == pytest.approx(trade['net_pnl'] / 50)
+    assert result.summary()['max_drawdown'] == pytest.approx(-trade['net_pnl'])
+
+
+def test_r_multiple_uses_each_trades_own_max_loss():
+    # 第1笔 max_loss=50 在30180止损; 第2笔 max_loss=100 在30200入场, 30380止损
+    bars = [(30000, 30000, 30000, 30000), (30000, 30200, 30000, 30200), (30200, 30200, 30200, 30200),
+            (30200, 30200, 30200, 30200), (30200, 30400, 30200, 30400), (30400, 30400, 30400, 30400)]
+    bt, result = run(bars, "sell", [(T0, 50), (T0 + 3 * 60000, 100)])
+    first, second = result.trades
+    assert (first['max_loss'], second['max_loss']) == (50, 100)
+    assert second['max_position'] == pytest.approx(2 * first['max_position'], rel=0.01)
+    assert first['r_multiple'] == pytest.approx(first['net_pnl'] / 50)
+    assert second['r_multiple'] == pytest.approx(second['net_pnl'] / 100)
+    assert result.summary()['expectancy_r'] == pytest.approx((first['r_multiple'] + second['r_multiple']) / 2)
@@ -0,0 +1,54 @@
+"""DepthPricer: 按模拟器合成盘口给触发单定价"""
+import pytest
+
+from conftest import START, logged
+from fmz_simulator import MarketSpec, Simulator
+
+
+@pytest.fixture
+def env():
+    """BTC最新价30000, tick 0.5, 盘口每档0.1张"""
+    sim = Simulator({"BTC_USDT": MarketSpec(1, 3, tick_size=0.5)}, start_time=START, depth_qty=0.1)
+    sim.step("BTC_USDT", START, 30000)
+    ext = sim.load_template()
+    precision = ext.PrecisionManager(sim.exchange)
+    assert precision.set_precision("BTC_USDT")
+    return sim, ext, ext.DepthPricer(sim.exchange, precision), precision
+
+
+def test_price_walks_the_book_until_the_quantity_is_covered(env):
+    _, _, pricer, _ = env
+    # 0.25张需要吃3档: 买单到卖3 (30001.5), 卖单到买3 (29998.5)
+    assert pricer.price("BUY", 0.25, 30000, 0.001) == 30001.5
+    assert pricer.price("SELL", 0.25, 30000, 0.001) == 29998.5
+    assert pricer.price("BUY", 0.1, 30000, 0.001) == 30000.5
+
+
+def test_price_is_capped_at_the_slippage_limit_on_tick(env):
+    _, _, pricer, _ = env
+    # 1.5张需要吃15档 (30007.5), 上限 30000 * 1.0002 = 30006 -> 封顶
+    assert pricer.price("BUY", 1.5, 30000, 0.0002) == 30006
+    # 上限不在tick上时向内取整: 买单 30003.69 -> 30003.5, 卖单 29996.31 -> 29996.5
+    assert pricer.price("BUY", 1.5, 30000, 0.000123) == 30003.5
+    assert pricer.price("SELL", 1.5, 30000, 0.000123) == 29996.5
+
+
+def test_thin_book_or_depth_error_prices_at_the_cap(env):
+    sim, _, pricer, _ = env
+    # 20档共2张, 不足以吃满3张
+    assert pricer.price("BUY", 3, 30000, 0.001) == 30030
+
+    def broken(*args):
+        raise Exception("GetDepth timeout")
+    sim.exchange.GetDepth = broken
+    assert pricer.price("SELL", 0.1, 30000, 0.001) == 29970
+    assert logged(sim, "获取盘口深度失败, 按滑点上限定价: GetDepth timeout")
+
+
+def test_depth_priced_limit_fills_immediately(env):
+    sim, ext, pricer, precision = env
+    order_mgr = ext.OrderManager(sim.exchange, precision)
+    price = pricer.price("BUY", 0.25, 30000, 0.001)
+    assert order_mgr.place_limit("BUY", 0.25, price, client_id="t1-add", symbol_api="BTCUSDT")
+    market = sim.exchange.markets["BTC_USDT"]
+    assert market.orders == [] and market.position == 0.25
@@ -0,0 +1,93 @@
+"""LimitOrderStrategyManager: 程序内触发单 (加仓/入场跟踪/跟踪止盈)"""
+import os
+
+import pytest
+
+from conftest import ROOT, open_orders
+
+LIMIT_STRATEGY = os.path.join(ROOT, "order_strategy_limit.py")
+
+
+@pytest.fixture
+def strategy(sim):
+    ns = sim.load_strategy(LIMIT_STRATEGY)
+    return ns['LimitOrderStrategyManager'](sim.exchange, ns['STRATEGY_CONFIG'])
+
+
+@pytest.fixture
+def tickers(sim):
+    """记录 GetTicker 调用, 每次调用耗时50ms (模拟一次REST往返)"""
+    calls = []
+    get_ticker = sim.exchange.GetTicker
+
+    def timed(*args):
+        calls.append(sim.now)
+        sim.sleep(50)
+        return get_ticker(*args)
+
+    sim.exchange.GetTicker = timed
+    return calls
+
+
+def enter(sim, strategy, entry_mode=1):
+    """做多BTC (ATR按价格的1%=300), 模式1推进到底仓建立"""
+    assert strategy.start_entry("BTC_USDT", "buy", 50, entry_mode, 0, 1, 1)
+    assert strategy.confirm_entry()
+    sim.step("BTC_USDT", sim.now + 1000, 30000)
+    strategy.check_position_and_update_state()
+
+
+def test_trigger_ack_is_stamped_when_the_order_returns(sim, strategy, tickers):
+    enter(sim, strategy)
+    assert strategy.state == "ENTRY_DONE"
+    del tickers[:]
+    # 价格流越过加仓触发价 (30030): 检测、提交、确认都不再请求行情
+    sim.step("BTC_USDT", sim.now + 1000, 30035)
+    strategy.on_price(30035, sim.now)
+    [rec] = strategy.triggers.records[-1:]
+    assert rec['kind'] == "add" and rec['ok']
+    assert tickers == []
+    assert rec['ack_time'] == rec['submit_time'] == rec['detect_time']
+    assert rec['ack_price'] == 30035
+    assert strategy.add_position_monitor['triggered']
+
+
+def test_each_check_reads_the_ticker_once(sim, strategy, tickers):
+    """模式3: 确认开仓和每轮检查只通过行情快照 (exchange.Go 并发) 获取一次行情, 触发下单路径不再单独请求"""
+    batched = []
+    go = sim.exchange.Go
+    sim.exchange.Go = lambda method, *args: batched.append(method) or go(method, *args)
+    assert strategy.start_entry("BTC_USDT", "buy", 50, 3, 0, 1, 1)
+    del tickers[:]
+    assert strategy.confirm_entry()
+    assert len(tickers) == batched.count("GetTicker") == 1
+    assert strategy.entry_tracking['price_extreme'] == 30000
+    for price in (29950, 29990):   # 最低29950, 回调0.12 ATR (36) 到29986触发入场
+        del tickers[:], batched[:]
+        sim.step("BTC_USDT", sim.now + 1000, price)
+        strategy.check_position_and_update_state()
+        assert len(tickers) == batched.count("GetTicker") == 1
+    assert strategy.entry_tracking['limit_order_placed']
+    assert strategy.triggers.records[-1]['ack_price'] == 29990
+
+
+def test_full_position_cancels_chased_legs_before_the_bulk_cancel(sim, strategy):
+    """加仓单部分成交后进入满仓挂单: 批量撤单撤掉的剩余加仓数量不再被追单重挂"""
+    enter(sim, strategy)
+    market = sim.exchange.markets["BTC_USDT"]
+    # 价格流越过加仓触发价 (30030), 成交价已跳到加仓限价 (30095) 之上、止盈1 (30105) 之下: 加仓单挂在盘口
+    sim.step("BTC_USDT", sim.now + 1000, 30100)
+    strategy.on_price(30035, sim.now)
+    [add] = [o for o in market.orders if o['client_id'].endswith("-add")]
+    assert "add" in strategy.chaser.orders
+    # 加仓单部分成交 (仓位增加), 剩余数量仍挂单
+    sim.exchange._fill(market, "BUY", 0.05, add['price'], "LIMIT", maker=True, tag=add['client_id'])
+    strategy.check_position_and_update_state()
+    assert strategy.state == "WAIT_EXIT"
+    assert strategy.chaser.orders == {}
+    assert open_orders(sim, "BTC_USDT") == ["fsl", "tp1", "tp2", "tp3"]
+    # 超过追单时间后也不重挂剩余的加仓数量
+    sim.step("BTC_USDT", sim.now + strategy.cfg['chase_timeout'] + 1000, 30100)
+    strategy.check_position_and_update_state()
+    assert not [f for f in sim.exchange.fills if "-add." in f['tag']]
+    assert not [leg for leg in open_orders(sim, "BTC_USDT") if leg.startswith("add")]
@@ -0,0 +1,82 @@
+"""LoopScheduler: 命令在100ms内被处理, 不等待仓位检查间隔"""
+import pytest
+
+from conftest import logged
+
+
+@pytest.fixture
+def ext(sim):
+    return sim.load_template()
+
+
+def run_until(sim, loop, end):
+    while sim.now < end:
+        loop.run_once()
+
+
+def test_command_is_handled_within_100ms_while_a_long_check_is_pending(sim, ext, main_ns):
+    assert main_ns['COMMAND_INTERVAL'] <= 100
+    handled, checks = [], []
+    pushed_at = sim.now + 2345   # 两次检查之间操作员点击按钮
+
+    def wait(ms):
+        before = sim.now
+        sim.sleep(ms)
+        if before < pushed_at <= sim.now:
+            sim.push_command("ConfirmEntry")
+
+    def commands():
+        cmd = sim._get_command()
+        if cmd:
+            handled.append((cmd, sim.now))
+
+    loop = ext.LoopScheduler(wait)
+    loop.every("commands", main_ns['COMMAND_INTERVAL'], commands)
+    loop.every("check", 5000, lambda: checks.append(sim.now))
+    start = sim.now
+    run_until(sim, loop, start + 5000)
+    [(cmd, t)] = handled
+    assert cmd == "ConfirmEntry" and 0 <= t - pushed_at <= 100
+    assert checks == [start]   # 仓位检查仍按自己的5秒间隔
+    run_until(sim, loop, start + 5001)
+    assert checks == [start, start + 5000]
+
+
+def test_trigger_runs_a_task_on_the_next_pass(sim, ext):
+    waits, checks = [], []
+
+    def wait(ms):
+        waits.append(ms)
+        sim.sleep(ms)
+
+    loop = ext.LoopScheduler(wait)
+    loop.every("commands", 100, lambda: None)
+    loop.every("check", 5000, lambda: checks.append(sim.now))
+    loop.run_once()
+    loop.trigger("check")   # 如确认开仓或收到成交推送
+    loop.run_once()
+    assert len(checks) == 2 and checks[1] - checks[0] == waits[0] == 100
+
+
+def test_adaptive_interval_and_errors_do_not_stop_other_tasks(sim, ext):
+    intervals = iter([300, 50])
+    runs = []
+
+    def broken():
+        raise Exception("GetPosition timeout")
+
+    def bad_interval():
+        raise Exception("ATR missing")
+
+    loop = ext.LoopScheduler(sim.sleep)
+    loop.every("check", lambda: next(intervals), lambda: runs.append(("check", sim.now)))
+    loop.every("broken", 200, broken)
+    loop.every("ui", bad_interval, lambda: runs.append(("ui", sim.now)))
+    start = sim.now
+    for _ in range(4):   # 0, 200 (broken), 300, 350
+        loop.run_once()
+    # 间隔函数每次执行后重新计算: 300ms 后再 50ms; 间隔计算出错时按1000ms
+    assert runs == [("check", start), ("ui", start), ("check", start + 300), ("check", start + 350)]
+    assert len(logged(sim, "任务 broken 错误: GetPosition timeout")) == 2
+    assert logged(sim, "任务 ui 间隔计算错误: ATR missing")
+    assert [t['due'] for t in loop.tasks if t['name'] == "ui"] == [start + 1000]
@@ -0,0 +1,66 @@
+"""MarketInfoStore: 一次 GetMarkets 快照索引全部交易对, 拉取失败时退避"""
+import pytest
+
+
+class FlakyMarkets:
+    """GetMarkets 按 results 依次返回或抛出"""
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = 0
+
+    def GetMarkets(self):
+        self.calls += 1
+        ret = self.results.pop(0)
+        if isinstance(ret, Exception):
+            raise ret
+        return ret
+
+
+SNAPSHOT = {
+    "BTC_USDT.swap": {'PricePrecision': 1, 'AmountPrecision': 3, 'MinQty': 0.001, 'TickSize': 0.1},
+    "BTC_USDT": {'PricePrecision': 2, 'AmountPrecision': 5, 'MinQty': 0.00001, 'TickSize': 0.01},
+}
+
+
+@pytest.fixture
+def ext(sim):
+    return sim.load_template()
+
+
+def test_snapshot_indexes_swap_markets_once(sim, ext):
+    ex = FlakyMarkets([SNAPSHOT])
+    store = ext.MarketInfoStore(ex)
+    assert store.get("BTC_USDT") == {'price_precision': 1, 'amount_precision': 3, 'min_amount': 0.001, 'tick_size': 0.1}
+    # 未命中的交易对在 MISS_REFRESH_INTERVAL 内不重复拉取
+    assert store.get("ETH_USDT") is None
+    assert store.get("BTC_USDT")['tick_size'] == 0.1
+    assert ex.calls == 1
+
+
+def test_failed_refresh_backs_off_before_retrying(sim, ext):
+    ex = FlakyMarkets([Exception("timeout"), Exception("timeout"), {}, SNAPSHOT])
+    store = ext.MarketInfoStore(ex)
+    assert store.get("BTC_USDT") is None
+    # 失败后交易路径上的查询不再请求, 直到退避结束 (5s, 10s, 20s...)
+    for _ in range(10):
+        assert store.get("BTC_USDT") is None
+    assert ex.calls == 1
+    sim.sleep(store.RETRY_INTERVAL)
+    assert store.get("BTC_USDT") is None
+    assert ex.calls == 2
+    sim.sleep(store.RETRY_INTERVAL)
+    assert store.get("BTC_USDT") is None and ex.calls == 2
+    sim.sleep(store.RETRY_INTERVAL)
+    assert store.get("BTC_USDT") is None      # 空快照同样视为失败
+    assert ex.calls == 3 and store.failures == 3
+    sim.sleep(4 * store.RETRY_INTERVAL)
+    assert store.get("BTC_USDT")['price_precision'] == 1
+    assert ex.calls == 4 and store.failures == 0
+
+
+def test_backoff_is_capped(sim, ext):
+    ex = FlakyMarkets([Exception("timeout")] * 10)
+    store = ext.MarketInfoStore(ex)
+    for _ in range(8):
+        store.refresh()
+    assert store.retry_at - sim.now == store.MISS_REFRESH_INTERVAL
@@ -0,0 +1,87 @@
+"""NotificationManager: 队列、按标题合并、只在主线程输出日志"""
+import os
+import time
+
+import pytest
+
+from conftest import ROOT, logged
+
+
+@pytest.fixture
+def notifier(sim):
+    n = sim.load_template().NotificationManager(sim.exchange)
+    n.ASYNC = True  # 模拟器默认同步发送
+    return n
+
+
+def pushes(sim):
+    return [line for _, line in sim.logs if line.endswith(" @")]
+
+
+def test_messages_wait_for_flush_and_merge_per_title(sim, notifier):
+    notifier.send_notification("0.25 @ 30030", "✅ 加仓成功 - BTC_USDT")
+    notifier.send_notification("0.5 @ 2002", "✅ 加仓成功 - ETH_USDT")
+    notifier.send_notification("0.166 @ 30000", "✅ 加仓成功 - BTC_USDT")
+    assert pushes(sim) == []   # 下单路径上只入队
+    notifier.flush()
+    assert pushes(sim) == ["✅ 加仓成功 - BTC_USDT (2条): 0.25 @ 30030\n\n0.166 @ 30000 @",
+                           "✅ 加仓成功 - ETH_USDT: 0.5 @ 2002 @"]
+    assert notifier.stats['sent'] == 3 and notifier.stats['merged'] == 1
+    assert not notifier.queue
+
+
+def test_single_message_is_sent_on_the_next_flush(sim, notifier):
+    notifier.send_notification("止损触发", "🛑 底仓止损触发 - BTC_USDT")
+    notifier.flush()
+    assert pushes(sim) == ["🛑 底仓止损触发 - BTC_USDT: 止损触发 @"]
+    assert notifier.stats['delay_max'] == 0
+
+
+def test_failed_send_is_retried_on_a_later_flush(sim, notifier, monkeypatch):
+    ns = type(notifier).flush.__globals__
+    failures = [Exception("push rate limited")]
+
+    def flaky_log(*args):
+        if args[-1] == "@" and failures:
+            raise failures.pop()
+        sim.log(*args)
+
+    monkeypatch.setitem(ns, 'Log', flaky_log)
+    notifier.send_notification("平仓完成", "✅ 平仓完成 - BTC_USDT")
+    notifier.flush()
+    assert pushes(sim) == [] and logged(sim, "通知发送失败")
+    notifier.flush()   # 未到重试时间
+    assert pushes(sim) == []
+    sim.sleep(notifier.RETRY_DELAY)
+    notifier.flush()
+    assert pushes(sim) == ["✅ 平仓完成 - BTC_USDT: 平仓完成 @"]
+    assert notifier.stats['failed'] == 0 and not notifier.queue
+
+
+def test_background_sender_reports_through_the_main_loop(sim):
+    """order_based_strategy.py: 单条消息立即发送, 后台线程不调用Log, 结果由 flush() 输出"""
+    ns = sim.load_strategy(os.path.join(ROOT, "order_based_strategy.py"))
+    notifier = ns['NotificationManager'](sim.exchange)
+    notifier.ASYNC = True
+    started = time.time()
+    notifier.send_notification("✅ 加仓成功 - BTC_USDT", "0.25 @ 30030")
+    while notifier.stats['sent'] < 1 and time.time() - started < 2:
+        time.sleep(0.01)
+    assert notifier.stats['sent'] == 1
+    assert time.time() - started < notifier.COALESCE_WINDOW / 1000
+    assert not logged(sim, "通知已发送")
+    notifier.flush()
+    assert logged(sim, "APP通知已发送: ✅ 加仓成功 - BTC_USDT")
+    assert logged(sim, "邮件通知已发送: ✅ 加仓成功 - BTC_USDT")
+
+
+def test_background_sender_merges_per_title(sim):
+    ns = sim.load_strategy(os.path.join(ROOT, "order_based_strategy.py"))
+    notifier = ns['NotificationManager'](sim.exchange)
+    notifier._send([("✅ 加仓成功 - BTC_USDT", "a", 0), ("✅ 加仓成功 - ETH_USDT", "b", 0),
+                    ("✅ 加仓成功 - BTC_USDT", "c", 0)])
+    # 每组一条APP推送 (标题\n内容) 和一封邮件 (标题 内容)
+    assert sim.exchange.notifications == [
+        "✅ 加仓成功 - BTC_USDT (2条)\na\n\nc", "✅ 加仓成功 - BTC_USDT (2条) a\n\nc",
+        "✅ 加仓成功 - ETH_USDT\nb", "✅ 加仓成功 - ETH_USDT b"]
+    assert notifier.stats['merged'] == 1
@@ -0,0 +1,144 @@
+"""OrderManager: 经币安API提交的订单参数"""
+import pytest
+from conftest import START
+from fmz_simulator import MarketSpec, Simulator
+
+
+def test_small_quantity_and_price_are_sent_as_fixed_point():
+    """1e-05 的数量和价格按精度输出定点小数, 不使用科学计数法"""
+    sim = Simulator({"PEPE_USDT": MarketSpec(6, 5, min_qty=0.00001)}, start_time=START, log_level=0)
+    sim.step("PEPE_USDT", START, 0.000012)
+    ext = sim.load_template()
+    precision = ext.PrecisionManager(sim.exchange)
+    assert precision.set_precision("PEPE_USDT")
+    order_mgr = ext.OrderManager(sim.exchange, precision)
+    market = sim.exchange.markets["PEPE_USDT"]
+
+    order, _ = order_mgr._order_fields("PEPEUSDT", "BUY", 0.00001, 0.00001, False, "c1")
+    assert (order['quantity'], order['price']) == ("0.00001", "0.000010")
+
+    ret = order_mgr.place_limit("BUY", 0.00001, 0.00001, client_id="t1-entry", symbol_api="PEPEUSDT")
+    assert ret and ret['status'] == "NEW"
+    assert [(o['qty'], o['price']) for o in market.orders] == [(0.00001, 0.00001)]
+
+    assert order_mgr.place_market("BUY", 0.00001, client_id="t1-base", symbol_api="PEPEUSDT")
+    assert market.position == 0.00001
+
+    assert order_mgr.place_stop_market("PEPEUSDT", "SELL", 0.00001, 0.000011, True, "t1-sl")
+    assert [(a['qty'], a['trigger']) for a in market.algo_orders] == [(0.00001, 0.000011)]
+
+
+def test_simulator_rejects_scientific_notation(sim):
+    """模拟器与币安一致: 数值参数不接受科学计数法"""
+    for params in ("symbol=BTCUSDT&side=BUY&type=MARKET&quantity=1e-05",
+                   "symbol=BTCUSDT&side=BUY&type=LIMIT&timeInForce=GTC&quantity=0.001&price=1e-05"):
+        with pytest.raises(Exception, match='"code":-1100'):
+            sim.exchange.IO("api", "POST", "/fapi/v1/order", params)
+    assert sim.exchange.markets["BTC_USDT"].position == 0
+
+
+def _cancel_calls(sim):
+    calls = []
+    io = sim.exchange.IO
+
+    def counted(kind, *args):
+        if kind == "api" and args[0] == "DELETE":
+            calls.append(args[1])
+        return io(kind, *args)
+
+    sim.exchange.IO = counted
+    return calls
+
+
+def _resting_orders(sim, ext):
+    """BTC多仓0.1, 挂一张限价止盈和一张止损条件单"""
+    order_mgr = ext.OrderManager(sim.exchange, ext.PrecisionManager(sim.exchange))
+    assert order_mgr.place_market("BUY", 0.1, symbol_api="BTCUSDT")
+    assert order_mgr.place_limit("SELL", 0.1, 30500, True, symbol_api="BTCUSDT")
+    assert order_mgr.place_stop_market("BTCUSDT", "SELL", 0.1, 29500, True)
+    return order_mgr
+
+
+def test_cancel_all_sends_each_bulk_cancel_once(sim):
+    ext = sim.load_template()
+    order_mgr = _resting_orders(sim, ext)
+    calls = _cancel_calls(sim)
+    assert order_mgr.cancel_all_orders("BTC_USDT", "BTCUSDT")
+    assert sorted(calls) == ["/fapi/v1/algoOpenOrders", "/fapi/v1/allOpenOrders"]
+    market = sim.exchange.markets["BTC_USDT"]
+    assert market.orders == [] and market.algo_orders == []
+
+
+def test_cancel_all_reissues_only_after_the_poll_budget(sim):
+    ext = sim.load_template()
+    order_mgr = _resting_orders(sim, ext)
+    calls = _cancel_calls(sim)
+    # 条件单批量撤单未生效: 轮询预算用完后才重新撤单一次
+    routes = dict(sim.exchange.API_ROUTES)
+    routes[("DELETE", "/fapi/v1/algoOpenOrders")] = lambda ex, params: {'code': 200}
+    sim.exchange.API_ROUTES = routes
+    started = sim.now
+    assert not order_mgr.cancel_all_orders("BTC_USDT", "BTCUSDT")
+    assert len(calls) == 4
+    assert sim.now - started >= ext.RetryPolicy.POLICIES['cancel_confirm'][2]
+    assert sim.logs[-1][1].startswith("⚠️ 撤单未确认完成, 剩余挂单 FMZ:0 Algo:1")
+
+
+# ---------- 批量挂单 ----------
+def _api_log(sim):
+    """记录经 exchange.IO (含 exchange.Go 并发) 发出的币安请求"""
+    calls = []
+    io = sim.exchange.IO
+
+    def logged_io(kind, *args):
+        if kind == "api":
+            calls.append((args[0], args[1]))
+        return io(kind, *args)
+
+    sim.exchange.IO = logged_io
+    return calls
+
+
+def _exit_legs(tp_count):
+    legs = [{'name': "sl", 'type': "STOP_MARKET", 'side': "SELL", 'quantity': 0.7, 'stop_price': 29500,
+             'reduce_only': True, 'client_id': "t1-sl"},
+            {'name': "trail", 'type': "TRAILING_STOP_MARKET", 'side': "SELL", 'quantity': 0.7, 'callback_rate': 1,
+             'activation_price': 30600, 'reduce_only': True, 'client_id': "t1-trail"}]
+    legs += [{'name': f"tp{i}", 'type': "LIMIT", 'side': "SELL", 'quantity': 0.1, 'price': 30100 + i * 10,
+              'reduce_only': True, 'client_id': f"t1-tp{i}"} for i in range(1, tp_count + 1)]
+    return legs
+
+
+def test_batch_sends_limits_in_groups_of_five_and_algos_concurrently(sim):
+    ext = sim.load_template()
+    order_mgr = ext.OrderManager(sim.exchange, ext.PrecisionManager(sim.exchange))
+    assert order_mgr.place_market("BUY", 0.7, symbol_api="BTCUSDT")
+    calls = _api_log(sim)
+    results = order_mgr.place_batch("BTCUSDT", _exit_legs(7))
+    assert all(results.values()) and len(results) == 9
+    # 7个限价单分两批 (5+2), 两个条件单各一个并发请求, 无查询和单独重发
+    assert sorted(calls) == [("POST", "/fapi/v1/algoOrder")] * 2 + [("POST", "/fapi/v1/batchOrders")] * 2
+    market = sim.exchange.markets["BTC_USDT"]
+    assert sorted(o['client_id'] for o in market.orders) == [f"t1-tp{i}" for i in range(1, 8)]
+    assert sorted(a['client_id'] for a in market.algo_orders) == ["t1-sl", "t1-trail"]
+
+
+def test_batch_reports_each_leg_and_recovers_a_lost_response(sim):
+    ext = sim.load_template()
+    order_mgr = ext.OrderManager(sim.exchange, ext.PrecisionManager(sim.exchange))
+    assert order_mgr.place_market("BUY", 0.7, symbol_api="BTCUSDT")
+    legs = _exit_legs(2)
+    legs.append({'name': "bad", 'type': "LIMIT", 'side': "BUY", 'quantity': 0.1, 'price': 29000,
+                 'reduce_only': True, 'client_id': "t1-bad"})   # 多仓时买入 reduce_only: 交易所拒绝
+    calls = _api_log(sim)
+    sim.exchange.drop_responses = 1   # 第一个POST (止损条件单) 已执行但响应丢失
+    results = order_mgr.place_batch("BTCUSDT", legs)
+    assert results['bad'] is None
+    assert all(results[name] for name in ("sl", "trail", "tp1", "tp2"))
+    # 丢失响应的止损单先按客户端ID查询确认已下单, 不重复提交; 被拒绝的订单不重试
+    assert calls.count(("GET", "/fapi/v1/algoOrder")) == 1
+    assert calls.count(("POST", "/fapi/v1/algoOrder")) == 2
+    assert calls.count(("POST", "/fapi/v1/batchOrders")) == 1 and ("POST", "/fapi/v1/order") not in calls
+    market = sim.exchange.markets["BTC_USDT"]
+    assert sorted(a['client_id'] for a in market.algo_orders) == ["t1-sl", "t1-trail"]
+    assert sorted(o['client_id'] for o in market.orders) == ["t1-tp1", "t1-tp2"]
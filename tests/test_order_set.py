@@ -0,0 +1,50 @@
+"""OrderSet: 挂单只按差异替换, 已成交的订单腿不重挂"""
+from conftest import open_orders, open_trade
+
+
+def _full_position(sim, main_ns):
+    host = main_ns['PortfolioHost'](sim.exchange, main_ns['STRATEGY_CONFIG'], ["BTC_USDT"])
+    manager = open_trade(sim, host, "BTC_USDT")
+    sim.step("BTC_USDT", sim.now + 1000, 30030)
+    host.check_all()
+    assert manager.state == "WAIT_EXIT"
+    return host, manager
+
+
+def test_filled_take_profit_is_not_placed_again(sim, main_ns):
+    host, manager = _full_position(sim, main_ns)
+    market = sim.exchange.markets["BTC_USDT"]
+    assert open_orders(sim, "BTC_USDT") == ["fsl", "tp1", "tp2", "tp3", "trail"]
+    ladder = {o['client_id'].split("-")[-1]: o['qty'] for o in market.orders}
+    # 一步越过止盈1 (30105) 和保护性止损触发价 (30060)
+    sim.step("BTC_USDT", sim.now + 1000, 30110)
+    assert market.position == round(manager.last_position_amount - ladder['tp1'], 3)
+    host.check_all()
+    assert manager.protective_sl_placed
+    assert open_orders(sim, "BTC_USDT") == ["psl", "tp2", "tp3", "trail"]
+    # 止盈2/3 参数不变保持原单, 止盈1 只成交一次
+    assert {o['client_id'].split("-")[-1]: o['qty'] for o in market.orders} == {'tp2': ladder['tp2'], 'tp3': ladder['tp3']}
+    tp_fills = [f['tag'].split("-")[-1] for f in sim.exchange.fills if "-tp" in f['tag']]
+    assert tp_fills == ["tp1"]
+    assert "tp1" in manager.order_set.done
+
+
+def test_partially_filled_level_keeps_only_its_remainder(sim, main_ns):
+    host, manager = _full_position(sim, main_ns)
+    close_side = "SELL"
+    full = manager.last_position_amount
+    legs = {leg['name']: leg['quantity'] for leg in manager._tp_legs(close_side)}
+    # 止盈1全部成交, 止盈2成交0.05
+    remaining = {leg['name']: leg['quantity'] for leg in manager._tp_legs(close_side, full - legs['tp1'] - 0.05)}
+    assert remaining == {'tp2': round(legs['tp2'] - 0.05, 3), 'tp3': legs['tp3']}
+    assert manager._tp_legs(close_side, full) == manager._tp_legs(close_side)
+
+
+def test_unchanged_legs_are_left_alone(sim, main_ns):
+    host, manager = _full_position(sim, main_ns)
+    calls = sim.exchange.api_calls
+    before = sorted(a['algoId'] for a in sim.exchange.markets["BTC_USDT"].algo_orders)
+    manager._place_orders_after_full_position()
+    assert sorted(a['algoId'] for a in sim.exchange.markets["BTC_USDT"].algo_orders) == before
+    # 只查询挂单, 不下单也不撤单
+    assert sim.exchange.api_calls - calls <= 2
@@ -0,0 +1,46 @@
+"""PortfolioHost: 多个币种共用一个 exchange 对象时, 订单始终提交到各自的交易对"""
+import pytest
+
+from conftest import open_orders, open_trade
+
+
+@pytest.fixture
+def host(sim, main_ns):
+    return main_ns['PortfolioHost'](sim.exchange, main_ns['STRATEGY_CONFIG'], ["BTC_USDT", "ETH_USDT"])
+
+
+def _fills(sim):
+    return [(f['symbol'], f['tag'].split("-")[-1]) for f in sim.exchange.fills]
+
+
+@pytest.mark.parametrize("mode, limit_price", [(1, 0), (2, 2001)])
+def test_entry_goes_to_its_own_symbol_after_another_check(sim, host, mode, limit_price):
+    btc = open_trade(sim, host, "BTC_USDT")
+    assert host.start_entry("ETH_USDT", "buy", 50, mode, limit_price, 1, 1)
+    # BTC的仓位检查把 exchange 的当前交易对切换为 BTC_USDT
+    host.check_all()
+    assert sim.exchange.GetCurrency() == "BTC_USDT"
+    assert host.confirm_entry()
+    eth = host.managers["ETH_USDT"]
+    assert eth.state == "WAIT_ENTRY"
+    markets = sim.exchange.markets
+    assert markets["BTC_USDT"].position == pytest.approx(btc.last_position_amount)
+    assert markets["ETH_USDT"].position == pytest.approx(eth.precision_mgr.format_amount(eth.full_amount * 0.4))
+    assert _fills(sim) == [("BTC_USDT", "entry"), ("ETH_USDT", "entry")]
+
+
+def test_each_symbol_keeps_its_own_order_set(sim, host):
+    open_trade(sim, host, "BTC_USDT")
+    open_trade(sim, host, "ETH_USDT")
+    assert open_orders(sim, "BTC_USDT") == ["add", "sl"]
+    assert open_orders(sim, "ETH_USDT") == ["add", "sl"]
+    # 两个币种先后满仓: 各自替换挂单, 撤单不会作用到另一个交易对
+    sim.step("BTC_USDT", sim.now + 1000, 30030)
+    sim.step("ETH_USDT", sim.now + 1000, 2002)
+    host.check_all()
+    assert {m.state for m in host.managers.values()} == {"WAIT_EXIT"}
+    for symbol in ("BTC_USDT", "ETH_USDT"):
+        assert open_orders(sim, symbol) == ["fsl", "tp1", "tp2", "tp3", "trail"]
+    host.reset("ETH_USDT")
+    assert open_orders(sim, "ETH_USDT") == []
+    assert open_orders(sim, "BTC_USDT") == ["fsl", "tp1", "tp2", "tp3", "trail"]
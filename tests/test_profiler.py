@@ -0,0 +1,68 @@
+"""LatencyHistogram / Profiler: 对数分桶与分位数"""
+import time
+
+import pytest
+
+
+@pytest.fixture
+def ext(sim):
+    return sim.load_template()
+
+
+@pytest.fixture
+def hist(ext):
+    return ext.Profiler().hist("test")
+
+
+def test_percentiles_of_a_known_distribution(hist):
+    # 90次100us, 9次1000us, 1次10000us (纳秒>>10 为us)
+    for us, n in ((100, 90), (1000, 9), (10000, 1)):
+        for _ in range(n):
+            hist.record(us << 10)
+    assert hist.count == 100
+    assert hist.total == 90 * 100 + 9 * 1000 + 10000
+    # 分位数取所在桶的上界: 100 -> [96, 112), 1000 -> [896, 1024), 10000 -> [8192, 10240)
+    assert hist.percentile(0.5) == 112
+    assert hist.percentile(0.9) == 112
+    assert hist.percentile(0.95) == 1024
+    assert hist.percentile(0.99) == 1024
+    assert hist.percentile(0.999) == 10240
+
+
+def test_percentile_error_stays_within_one_bucket(hist):
+    samples = list(range(1, 5001))
+    for us in samples:
+        hist.record(us << 10)
+    for q in (0.5, 0.95, 0.99):
+        exact = samples[int(q * len(samples)) - 1]
+        assert exact <= hist.percentile(q) <= exact * 1.25
+    hist.record(1 << 40)   # 超出范围计入最后一桶
+    assert hist.buckets[-1] == 1
+
+
+def test_wrappers_record_through_the_histogram(ext, monkeypatch):
+    """timed / timed_io / Go 句柄的耗时与直接 record() 落在相同的桶"""
+    ticks = iter(range(0, 10 ** 9, 300 << 10))   # 每次取时钟前进300us
+    monkeypatch.setattr(time, "perf_counter_ns", lambda: next(ticks))
+    profiler = ext.Profiler()
+
+    class Exchange:
+        def GetTicker(self):
+            return {'Last': 1}
+
+        def IO(self, kind, *args):
+            return {}
+
+        def Go(self, method, *args):
+            return type("Handle", (), {'wait': lambda self, *a: ({}, True)})()
+
+    ex = profiler.wrap(Exchange())
+    ex.GetTicker()
+    ex.IO("api", "GET", "/fapi/v1/order", "")
+    ex.Go("GetTicker").wait()
+    expected = profiler.hist("expected")
+    expected.record(300 << 10)
+    for name in ("GetTicker", "IO GET /fapi/v1/order", "Go GetTicker"):
+        assert profiler.hists[name].buckets == expected.buckets
+    [row] = [r for r in profiler.summary() if r['name'] == "GetTicker"]
+    assert row['p50_ms'] == row['p99_ms'] == expected.percentile(0.5) / 1000
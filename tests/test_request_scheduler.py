@@ -0,0 +1,187 @@
+"""RequestScheduler / TokenBucket / RetryPolicy: 注入假时钟, 不实际等待"""
+import pytest
+
+
+class FakeClock:
+    """假时钟: sleep 只推进时间并记录每次等待"""
+    def __init__(self, now=0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, ms):
+        self.sleeps.append(ms)
+        self.now += ms
+
+
+class FakeExchange:
+    """IO 按 responses 依次返回或抛出, 记录每次调用"""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def IO(self, *args):
+        self.calls.append(args)
+        ret = self.responses.pop(0)
+        if isinstance(ret, Exception):
+            raise ret
+        return ret
+
+
+@pytest.fixture
+def ext(sim):
+    return sim.load_template()
+
+
+@pytest.fixture
+def clock():
+    return FakeClock(1000)
+
+
+def test_token_bucket_refills_linearly_up_to_capacity(ext, clock):
+    scheduler = ext.RequestScheduler({'weight': (100, 10000)}, clock, clock.sleep)
+    bucket = scheduler.buckets['weight']    # 每毫秒补0.01个
+    bucket.tokens = 0
+    bucket.refill(3500)
+    assert bucket.tokens == pytest.approx(25)
+    assert bucket.wait_time(10, 0) == 0
+    assert bucket.wait_time(30, 0) == pytest.approx(500)
+    assert bucket.wait_time(10, 20) == pytest.approx(500)   # 扣除后需保留20个
+    bucket.refill(3000)                                     # 时钟回退不补充
+    assert bucket.tokens == pytest.approx(25)
+    bucket.refill(60000)
+    assert bucket.tokens == 100
+
+
+def test_protect_requests_use_the_reserve_before_normal_and_low(ext, clock):
+    scheduler = ext.RequestScheduler({'weight': (100, 10000)}, clock, clock.sleep)
+    costs = {'weight': 10}
+    # 额度降到预留线 (20%) 附近
+    scheduler.buckets['weight'].tokens = 25
+    assert scheduler.acquire(costs, scheduler.PROTECT) == 0
+    assert clock.sleeps == []
+    # 剩15: 保护请求仍可立即执行, 普通请求要等额度补到30 (预留20 + 消耗10)
+    assert scheduler._wait_time(costs, scheduler.PROTECT, clock()) == 0
+    assert scheduler._wait_time(costs, scheduler.NORMAL, clock()) == pytest.approx(1500)
+    assert scheduler._wait_time(costs, scheduler.LOW, clock()) == pytest.approx(4500)
+    waited = scheduler.acquire(costs, scheduler.NORMAL)
+    assert waited == sum(clock.sleeps) and 1500 <= waited <= 1502
+    assert scheduler.stats == {'requests': 2, 'waited_ms': waited, 'throttled': 0, 'merged': 0}
+
+
+def test_low_priority_work_is_deferred_until_budget_recovers(ext, clock):
+    scheduler = ext.RequestScheduler({'weight': (100, 10000)}, clock, clock.sleep)
+    runs = []
+    scheduler.buckets['weight'].tokens = 40
+    scheduler.defer("atr", runs.append, 1, costs={'weight': 5})
+    scheduler.defer("atr", runs.append, 2, costs={'weight': 5})   # 合并为最新一次
+    scheduler.run_deferred()
+    assert runs == [] and scheduler.stats['merged'] == 1
+    clock.now += 1500    # 补到55, 扣5后仍不低于50%
+    scheduler.run_deferred()
+    assert runs == [2] and not scheduler.deferred
+    assert clock.sleeps == []
+
+
+def test_throttle_pauses_everything_but_protect(ext, clock):
+    scheduler = ext.RequestScheduler({'weight': (100, 10000)}, clock, clock.sleep)
+    scheduler.throttled()
+    assert scheduler.acquire({'weight': 1}, scheduler.PROTECT) == 0
+    waited = scheduler.acquire({'weight': 1}, scheduler.NORMAL)
+    assert scheduler.PENALTY <= waited <= scheduler.PENALTY + 1
+    assert scheduler.stats['throttled'] == 1
+
+
+def test_circuit_breaker_opens_cools_down_and_half_opens(ext):
+    breaker = ext.RetryPolicy().breaker("/fapi/v1/algoOrder")   # 连续5次失败断开, 冷却10秒
+    for t in range(0, 40, 10):
+        assert not breaker.failure(t)
+    assert breaker.failure(40)             # 第5次连续失败断开
+    assert not breaker.allow(5000)
+    assert breaker.allow(10040)            # 冷却结束, 放行一次试探
+    assert breaker.failure(10050)          # 试探失败: 重新断开
+    assert not breaker.allow(15000) and breaker.trips == 2
+    assert breaker.allow(20050)
+    breaker.success()
+    assert breaker.allow(20051) and breaker.failures == 0
+
+
+def test_retry_backoff_grows_to_cap_and_respects_deadline(ext, clock):
+    retry = ext.RetryPolicy({'op': (100, 400, 1000, 10)}, clock, clock.sleep, rng=lambda: 1.0)
+    assert [retry.backoff('op', i) for i in range(1, 5)] == [100, 200, 400, 400]
+    retry.rng = lambda: 0.0
+    assert retry.backoff('op', 3) == 200   # 抖动部分为0时只等一半
+    retry.rng = lambda: 1.0
+    tries = list(retry.attempts('op'))
+    # 101 + 201 + 401 = 703ms, 剩余297ms被截断为最后一次等待
+    assert clock.sleeps == [101, 201, 401, 298]
+    assert tries == [0, 1, 2, 3, 4]
+    assert retry.stats['op'] == {'runs': 1, 'attempts': 5, 'waited_ms': 1001, 'gave_up': 1}
+
+
+def test_open_breaker_blocks_normal_orders_but_not_protective(ext, clock):
+    overloaded = Exception('{"code":-1008,"msg":"Server is currently overloaded"}')
+    ex = FakeExchange([overloaded] * 5 + [{'algoId': 1}, {'algoId': 2}])
+    scheduler = ext.RequestScheduler(clock=clock, sleep=clock.sleep)
+    retry = ext.RetryPolicy(clock=clock, sleep=clock.sleep, rng=lambda: 0.5)
+    order_mgr = ext.OrderManager(ex, ext.PrecisionManager(ex), scheduler, retry)
+    breaker = retry.breaker(order_mgr.algo_endpoint)
+
+    # 过载可重发: 4次尝试按退避间隔进行, 未到阈值
+    assert order_mgr.place_stop_market("BTCUSDT", "BUY", 0.1, 30030, client_id="t1-add") is None
+    assert len(ex.calls) == 4 and breaker.failures == 4
+    assert clock.sleeps == [19, 38, 76]
+    # 第5次失败断开熔断, 非保护订单不再重试
+    assert order_mgr.place_stop_market("BTCUSDT", "BUY", 0.1, 30030, client_id="t1-add.2") is None
+    assert len(ex.calls) == 5 and breaker.trips == 1
+    # 冷却期内: 非保护订单直接拒绝, 不请求交易所; 保护性止损照常提交
+    assert order_mgr.place_stop_market("BTCUSDT", "BUY", 0.1, 30030, client_id="t1-add.3") is None
+    assert len(ex.calls) == 5
+    assert order_mgr.place_stop_market("BTCUSDT", "SELL", 0.1, 29910, True, "t1-sl") == {'algoId': 1}
+    assert breaker.failures == 0
+    # 保护单成功后熔断恢复
+    clock.now += 1
+    assert order_mgr.place_stop_market("BTCUSDT", "BUY", 0.1, 30030, client_id="t1-add.4") == {'algoId': 2}
+
+
+def test_timed_out_submit_is_found_by_client_id_instead_of_resent(ext, sim):
+    """下单响应超时: 退避后按客户端ID查询, 查到即视为已下单, 交易所上只有一张订单"""
+    retry = ext.RetryPolicy(rng=lambda: 1.0)   # 使用模拟器时钟 (UnixNano/Sleep)
+    order_mgr = ext.OrderManager(sim.exchange, ext.PrecisionManager(sim.exchange), retry=retry)
+    sim.exchange.drop_responses = 1
+    started = sim.now
+    ret = order_mgr.place_limit("BUY", 0.1, 29000, client_id="t1-entry", symbol_api="BTCUSDT")
+    assert ret and ret['clientOrderId'] == "t1-entry"
+    assert [o['client_id'] for o in sim.exchange.markets["BTC_USDT"].orders] == ["t1-entry"]
+    assert sim.now - started == retry.backoff('submit', 1) + 1
+    assert retry.stats['submit'] == {'runs': 1, 'attempts': 2, 'waited_ms': 26, 'gave_up': 0}
+    assert retry.breaker(order_mgr.ORDER_ENDPOINT).failures == 0
+
+
+def test_rejected_order_is_not_retried_and_does_not_trip_the_breaker(ext, clock):
+    rejected = Exception('{"code":-2019,"msg":"Margin is insufficient."}')
+    ex = FakeExchange([rejected] * 6)
+    retry = ext.RetryPolicy(clock=clock, sleep=clock.sleep)
+    order_mgr = ext.OrderManager(ex, ext.PrecisionManager(ex), ext.RequestScheduler(clock=clock, sleep=clock.sleep),
+                                 retry)
+    for i in range(6):
+        assert order_mgr.place_limit("BUY", 0.1, 29000, client_id=f"t1-entry.{i}", symbol_api="BTCUSDT") is None
+    assert len(ex.calls) == 6 and clock.sleeps == []
+    breaker = retry.breaker(order_mgr.ORDER_ENDPOINT)
+    assert breaker.failures == 0 and breaker.trips == 0
+
+
+def test_unknown_status_is_queried_again_before_any_resend(ext, clock):
+    """超时后查询也失败: 状态未知时只重复查询, 确认不存在后才重发"""
+    timeout = Exception("Post request timeout")
+    not_found = Exception('{"code":-2013,"msg":"Order does not exist."}')
+    ex = FakeExchange([timeout, Exception("GET timeout"), not_found, {'orderId': 7, 'clientOrderId': "t1-add"}])
+    retry = ext.RetryPolicy(clock=clock, sleep=clock.sleep, rng=lambda: 0.0)
+    order_mgr = ext.OrderManager(ex, ext.PrecisionManager(ex), ext.RequestScheduler(clock=clock, sleep=clock.sleep),
+                                 retry)
+    assert order_mgr.place_limit("BUY", 0.1, 29000, client_id="t1-add", symbol_api="BTCUSDT")['orderId'] == 7
+    assert [call[1] for call in ex.calls] == ["POST", "GET", "GET", "POST"]
+    assert clock.sleeps == [13, 26]   # 每次重试前按 submit 策略退避 (抖动为0时等一半)
+    assert retry.stats['submit']['attempts'] == 3
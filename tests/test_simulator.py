@@ -0,0 +1,137 @@
+"""fmz_simulator 撮合引擎: 条件单触发、reduce_only裁剪、丢弃响应"""
+from urllib.parse import urlencode
+
+import pytest
+
+from conftest import START
+from fmz_simulator import MarketSpec, Simulator
+
+
+def api(sim, method, endpoint, **params):
+    return sim.exchange.IO("api", method, endpoint, urlencode(params))
+
+
+def order(sim, side, quantity, price=None, reduce_only=False, client_id="", symbol="BTCUSDT"):
+    params = {'symbol': symbol, 'side': side, 'quantity': quantity}
+    if price is None:
+        params['type'] = "MARKET"
+    else:
+        params.update(type="LIMIT", timeInForce="GTC", price=price)
+    if reduce_only:
+        params['reduceOnly'] = "true"
+    if client_id:
+        params['newClientOrderId'] = client_id
+    return api(sim, "POST", "/fapi/v1/order", **params)
+
+
+def algo(sim, side, quantity, client_id, **params):
+    return api(sim, "POST", "/fapi/v1/algoOrder", symbol="BTCUSDT", side=side, quantity=quantity,
+               reduceOnly="true", clientAlgoId=client_id, **params)
+
+
+def prices(sim, *path):
+    for price in path:
+        sim.step("BTC_USDT", sim.now + 1000, price)
+
+
+def fills(sim, tag):
+    return [(f['qty'], f['price']) for f in sim.exchange.fills if f['tag'] == tag]
+
+
+@pytest.fixture
+def long_btc(sim):
+    """BTC多仓1张 @30000"""
+    order(sim, "BUY", "1")
+    return sim.exchange.markets["BTC_USDT"]
+
+
+# ---------- TRAILING_STOP_MARKET ----------
+def test_trailing_stop_waits_for_activation_then_tracks_the_high(sim, long_btc):
+    algo(sim, "SELL", "1", "trail", type="TRAILING_STOP_MARKET", activatePrice="30300", callbackRate="1")
+    [a] = long_btc.algo_orders
+    prices(sim, 29500, 30200)           # 激活前回调幅度再大也不触发
+    assert not a['active'] and long_btc.algo_orders
+    prices(sim, 30300, 30600)           # 触达激活价后跟踪最高价
+    assert a['active'] and a['extreme'] == 30600
+    prices(sim, 30295)                  # 30600 * 0.99 = 30294
+    assert long_btc.algo_orders and not fills(sim, "trail")
+    prices(sim, 30290)
+    assert fills(sim, "trail") == [(1, 30290)]
+    assert long_btc.position == 0 and a['status'] == "FINISHED"
+    assert api(sim, "GET", "/fapi/v1/algoOrder", clientAlgoId="trail")['algoStatus'] == "FINISHED"
+
+
+def test_trailing_stop_without_activation_price_tracks_from_placement(sim):
+    order(sim, "SELL", "1")
+    algo(sim, "BUY", "1", "trail", type="TRAILING_STOP_MARKET", callbackRate="2")
+    market = sim.exchange.markets["BTC_USDT"]
+    [a] = market.algo_orders
+    assert a['active'] and a['extreme'] == 30000   # 下单时按当前价立即激活
+    prices(sim, 29000, 29570)                     # 29000 * 1.02 = 29580
+    assert market.algo_orders
+    prices(sim, 29580)
+    assert fills(sim, "trail") == [(1, 29580)] and market.position == 0
+
+
+# ---------- STOP_MARKET (CONTRACT_PRICE) ----------
+def test_stop_market_triggers_on_last_price(sim, long_btc):
+    algo(sim, "SELL", "1", "sl", type="STOP_MARKET", triggerPrice="29500", workingType="CONTRACT_PRICE")
+    prices(sim, 29600, 29501)
+    assert long_btc.algo_orders
+    prices(sim, 29400)                  # 按采样价成交, 不按触发价
+    assert fills(sim, "sl") == [(1, 29400)]
+    assert long_btc.position == 0
+
+
+def test_stop_market_fills_at_trigger_only_when_price_moved_through_it():
+    sim = Simulator({"BTC_USDT": MarketSpec(1, 3)}, start_time=START, log_level=0, fill_at_trigger=True)
+    sim.step("BTC_USDT", START, 30000)
+    order(sim, "BUY", "2")
+    algo(sim, "SELL", "1", "sl1", type="STOP_MARKET", triggerPrice="29500")
+    prices(sim, 29400)                  # 两个采样点之间连续经过触发价: 按触发价成交
+    assert fills(sim, "sl1") == [(1, 29500)]
+    algo(sim, "SELL", "1", "sl2", type="STOP_MARKET", triggerPrice="29600")
+    assert fills(sim, "sl2") == [(1, 29400)]   # 挂单时已越过触发价: 按当前价成交
+    assert sim.exchange.markets["BTC_USDT"].position == 0
+
+
+# ---------- reduce_only ----------
+def test_reduce_only_limit_is_clipped_to_the_position(sim, long_btc):
+    order(sim, "SELL", "3", price="30500", reduce_only=True, client_id="tp")
+    prices(sim, 30500)
+    assert fills(sim, "tp") == [(1, 30500)]
+    assert long_btc.position == 0
+    ret = api(sim, "GET", "/fapi/v1/order", symbol="BTCUSDT", origClientOrderId="tp")
+    assert (ret['status'], ret['origQty'], ret['executedQty']) == ("FILLED", "3.0", "1.0")
+
+
+def test_reduce_only_without_position_left_is_canceled_unfilled(sim, long_btc):
+    order(sim, "SELL", "1", price="30500", reduce_only=True, client_id="tp1")
+    order(sim, "SELL", "1", price="30400", reduce_only=True, client_id="tp2")
+    prices(sim, 30500)                  # 按挂单顺序撮合: tp1 平掉全部仓位, tp2 无仓位可减
+    assert fills(sim, "tp1") == [(1, 30500)] and fills(sim, "tp2") == []
+    assert api(sim, "GET", "/fapi/v1/order", symbol="BTCUSDT", origClientOrderId="tp2")['status'] == "CANCELED"
+    assert long_btc.position == 0 and long_btc.orders == []
+    with pytest.raises(Exception, match='"code":-2022'):
+        order(sim, "SELL", "1", reduce_only=True)
+
+
+# ---------- drop_responses ----------
+def test_dropped_response_still_executes_the_request(sim):
+    sim.exchange.drop_responses = 1
+    with pytest.raises(Exception, match="Post request timeout"):
+        order(sim, "BUY", "0.5", client_id="entry")
+    market = sim.exchange.markets["BTC_USDT"]
+    assert market.position == 0.5
+    # 只丢弃POST响应: 查询照常返回, 可按客户端订单ID确认已成交
+    assert api(sim, "GET", "/fapi/v1/order", symbol="BTCUSDT", origClientOrderId="entry")['status'] == "FILLED"
+    assert sim.exchange.drop_responses == 0
+    assert order(sim, "BUY", "0.5", client_id="add")['status'] == "FILLED"
+    assert market.position == 1
+    # 重发同一客户端订单ID的限价单: 挂单中时交易所拒绝
+    sim.exchange.drop_responses = 1
+    with pytest.raises(Exception, match="Post request timeout"):
+        order(sim, "BUY", "0.5", price="29000", client_id="dip")
+    with pytest.raises(Exception, match='"code":-4116'):
+        order(sim, "BUY", "0.5", price="29000", client_id="dip")
+    assert len(market.orders) == 1
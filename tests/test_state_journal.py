@@ -0,0 +1,89 @@
+"""StateJournal: 机器人重启后恢复交易, 按实时仓位和挂单对账"""
+import pytest
+
+from conftest import MAIN_STRATEGY, logged, open_orders, open_trade
+
+
+def new_host(sim):
+    """重启: 重新载入策略文件 (_G 存储保留在模拟器中)"""
+    ns = sim.load_strategy(MAIN_STRATEGY)
+    return ns['PortfolioHost'](sim.exchange, ns['STRATEGY_CONFIG'], ["BTC_USDT", "ETH_USDT"])
+
+
+@pytest.fixture
+def trade(sim):
+    """BTC做多底仓已建立 (ENTRY_DONE): 挂止损和加仓条件单"""
+    manager = open_trade(sim, new_host(sim), "BTC_USDT")
+    assert open_orders(sim, "BTC_USDT") == ["add", "sl"]
+    return manager
+
+
+def _posts(sim):
+    calls = []
+    io = sim.exchange.IO
+
+    def logged_io(kind, *args):
+        if kind == "api" and args[0] == "POST":
+            calls.append(args[1])
+        return io(kind, *args)
+
+    sim.exchange.IO = logged_io
+    return calls
+
+
+def test_journal_skips_unchanged_writes_and_survives_corruption(sim):
+    ext = sim.load_template()
+    journal = ext.StateJournal("journal_BTC_USDT")
+    assert journal.save({'state': "ENTRY_DONE", 'base_price': 30000})
+    assert not journal.save({'base_price': 30000, 'state': "ENTRY_DONE"})
+    assert ext.StateJournal("journal_BTC_USDT").load() == {'state': "ENTRY_DONE", 'base_price': 30000}
+    sim.store["journal_BTC_USDT"] = "{truncated"
+    assert ext.StateJournal("journal_BTC_USDT").load() is None
+    assert logged(sim, "状态读取失败 [journal_BTC_USDT]")
+
+
+def test_restart_with_intact_orders_resumes_without_placing_anything(sim, trade):
+    posts = _posts(sim)
+    host = new_host(sim)
+    assert host.restore() == ["BTC_USDT"]
+    manager = host.managers["BTC_USDT"]
+    assert (manager.state, manager.trade_id, manager.base_price) == ("ENTRY_DONE", trade.trade_id, trade.base_price)
+    assert posts == []
+    assert open_orders(sim, "BTC_USDT") == ["add", "sl"]
+    # 恢复后继续按原计划推进: 价格越过加仓价进入满仓阶段
+    sim.step("BTC_USDT", sim.now + 1000, 30040)
+    host.check_all()
+    assert manager.state == "WAIT_EXIT"
+
+
+def test_restart_replaces_lost_protection_orders(sim, trade):
+    market = sim.exchange.markets["BTC_USDT"]
+    market.algo_orders.clear()
+    host = new_host(sim)
+    assert host.restore() == ["BTC_USDT"]
+    assert host.managers["BTC_USDT"].state == "ENTRY_DONE"
+    # 同一订单腿重新挂单时追加序号, 不与交易所上已结束的订单冲突
+    assert open_orders(sim, "BTC_USDT") == ["add.2", "sl.2"]
+    assert logged(sim, "持仓无保护挂单，按ENTRY_DONE阶段重新挂单")
+
+
+def test_trade_stopped_out_while_offline_is_closed_on_restart(sim, trade):
+    sim.step("BTC_USDT", sim.now + 1000, 29000)   # 离线期间触发止损
+    assert sim.exchange.markets["BTC_USDT"].position == 0
+    host = new_host(sim)
+    assert host.restore() == []
+    assert host.managers["BTC_USDT"].state == "IDLE"
+    assert open_orders(sim, "BTC_USDT") == []     # 残留的加仓条件单已撤销
+    assert logged(sim, "底仓止损触发，全部平仓")
+    assert new_host(sim).restore() == []           # 已记录为空闲, 再次重启不恢复
+
+
+def test_add_filled_while_offline_advances_to_full_position(sim, trade):
+    sim.step("BTC_USDT", sim.now + 1000, 30040)   # 离线期间加仓条件单成交
+    host = new_host(sim)
+    assert host.restore() == ["BTC_USDT"]
+    manager = host.managers["BTC_USDT"]
+    assert manager.state == "WAIT_EXIT"
+    assert manager.last_position_amount == sim.exchange.markets["BTC_USDT"].position
+    assert open_orders(sim, "BTC_USDT") == ["fsl", "tp1", "tp2", "tp3", "trail"]
+    assert logged(sim, "加仓完成")
@@ -0,0 +1,75 @@
+"""StatusRenderer: 只在状态栏内容变化或到达心跳间隔时推送"""
+import pytest
+
+
+@pytest.fixture
+def pushes():
+    return []
+
+
+@pytest.fixture
+def renderer(sim, pushes):
+    ext = sim.load_template()
+    buttons = [{"type": "button", "cmd": "ShowInfo", "name": "📊 查看状态"}]
+    return ext.StatusRenderer(buttons, 10000, pushes.append)
+
+
+def counted(build):
+    """记录状态文本重建次数"""
+    def wrapped():
+        wrapped.calls += 1
+        return build()
+    wrapped.calls = 0
+    return wrapped
+
+
+def test_unchanged_model_is_pushed_only_on_heartbeat(sim, renderer, pushes):
+    build = counted(lambda: "当前状态: 空闲")
+    assert renderer.render(("IDLE",), build)
+    assert pushes[0].startswith('`{"type": "button", "cmd": "ShowInfo", "name": "📊 查看状态"}`\n\n最后更新: ')
+    assert pushes[0].endswith("\n\n当前状态: 空闲")
+    for _ in range(5):
+        sim.sleep(1000)
+        assert not renderer.render(("IDLE",), build)
+    sim.sleep(5000)
+    # 心跳: 只刷新最后更新时间, 不重建状态文本
+    assert renderer.render(("IDLE",), build)
+    assert build.calls == 1 and len(pushes) == 2 and pushes[0] != pushes[1]
+    assert renderer.stats == {'pushed': 2, 'skipped': 5}
+
+
+def test_changed_model_or_invalidate_rebuilds_immediately(sim, renderer, pushes):
+    build = counted(lambda: f"状态 {len(pushes)}")
+    renderer.render(("IDLE",), build)
+    sim.sleep(100)
+    assert renderer.render(("WAIT_CONFIRM",), build)
+    assert build.calls == 2 and pushes[-1].endswith("状态 1")
+    sim.sleep(100)
+    renderer.invalidate()   # 如点击查看状态
+    assert renderer.render(("WAIT_CONFIRM",), build)
+    assert build.calls == 3 and len(pushes) == 3
+
+
+def test_strategy_status_is_pushed_on_state_changes_not_on_price_ticks(sim, main_ns, renderer, pushes):
+    host = main_ns['PortfolioHost'](sim.exchange, main_ns['STRATEGY_CONFIG'], ["BTC_USDT", "ETH_USDT"])
+
+    def render():
+        return renderer.render(host.status_model(), host.get_status_info)
+
+    assert render()
+    assert host.start_entry("BTC_USDT", "buy", 50, 1, 0, 1, 1)
+    assert render() and "确认" in pushes[-1]
+    assert host.confirm_entry()
+    sim.step("BTC_USDT", sim.now + 1000, 30000)
+    host.check_all()
+    assert render() and "当前状态: ENTRY_DONE" in pushes[-1]
+    # 价格波动但仓位和挂单阶段不变: 不推送
+    for price in (30010, 29990, 30020):
+        sim.step("BTC_USDT", sim.now + 1000, price)
+        host.check_all()
+        assert not render()
+    # 加仓成交: 状态变化立即推送
+    sim.step("BTC_USDT", sim.now + 1000, 30040)
+    host.check_all()
+    assert render() and "当前状态: WAIT_EXIT" in pushes[-1]
+    assert renderer.stats == {'pushed': 4, 'skipped': 3}
@@ -0,0 +1,128 @@
+"""用户数据流模式: ReplayEventSource 回放录制的事件, 驱动 OrderBasedStrategyManager 状态机"""
+import json
+
+import pytest
+
+from conftest import logged
+
+SYMBOL_API = "BTCUSDT"
+
+
+def account_update(amount, entry_price, symbol=SYMBOL_API):
+    return {'e': "ACCOUNT_UPDATE", 'a': {'m': "ORDER", 'B': [],
+                                         'P': [{'s': symbol, 'pa': str(amount), 'ep': str(entry_price), 'ps': "BOTH"}]}}
+
+
+def order_update(client_id, order_type, side, qty, price, status="FILLED", symbol=SYMBOL_API, stop_price=0):
+    return {'e': "ORDER_TRADE_UPDATE", 'o': {'s': symbol, 'c': client_id, 'S': side, 'o': order_type, 'X': status,
+                                             'l': str(qty), 'L': str(price), 'ap': str(price), 'sp': str(stop_price)}}
+
+
+@pytest.fixture
+def manager(sim, main_ns):
+    """市价入场已确认, 等待底仓建立 (ATR=300, 满仓0.416, 底仓0.166)"""
+    m = main_ns['OrderBasedStrategyManager'](sim.exchange, main_ns['STRATEGY_CONFIG'])
+    assert m.start_entry("BTC_USDT", "buy", 50, 1, 0, 1, 1)
+    assert m.confirm_entry()
+    assert m.state == "WAIT_ENTRY"
+    return m
+
+
+def replay(sim, manager, source):
+    """逐批回放, 返回每批事件处理后的状态"""
+    states = []
+    while source.pos < len(source.events):
+        for event in source.poll(1000):
+            manager.on_stream_event(event)
+        states.append(manager.state)
+    return states
+
+
+def record(tmp_path, events):
+    """按 UserDataStream 的 record_file 格式写出 (每行一个JSON, 一批事件写成一行列表)"""
+    path = tmp_path / "user_stream.jsonl"
+    path.write_text("".join(json.dumps(e) + "\n" for e in events))
+    return str(path)
+
+
+def test_replayed_trade_walks_through_all_states(sim, main_ns, manager, tmp_path):
+    trade = manager.trade_id
+    events = [
+        order_update(f"{trade}-entry", "MARKET", "BUY", 0.166, 30000),
+        account_update(0.166, 30000),
+        order_update(f"{trade}-add", "STOP_MARKET", "BUY", 0.249, 30031, stop_price=30030),
+        account_update(0.415, 30018),
+        # 止盈1成交: 仓位减少, 仍在 WAIT_EXIT
+        [order_update(f"{trade}-tp1", "LIMIT", "SELL", 0.104, 30105), account_update(0.311, 30018)],
+        account_update(0, 0),
+    ]
+    source = main_ns['ext'].ReplayEventSource(record(tmp_path, events))
+    assert replay(sim, manager, source) == ["WAIT_ENTRY", "ENTRY_DONE", "ENTRY_DONE", "WAIT_EXIT", "WAIT_EXIT", "IDLE"]
+    assert logged(sim, "底仓建立 0.1660")
+    assert logged(sim, "加仓完成 0.4150")
+    assert logged(sim, "全部平仓，策略完成")
+    assert logged(sim, "策略已重置")
+    # 原生条件单的成交记录成交滑点
+    assert [(r['kind'], r['trigger_price']) for r in manager.triggers.records] == [("add", 30030)]
+    # 回放结束后 poll 按超时等待
+    now = sim.now
+    assert source.poll(500) == [] and sim.now == now + 500
+
+
+def test_fill_marks_reconcile_and_other_symbols_are_ignored(sim, main_ns, manager):
+    trade = manager.trade_id
+    source = main_ns['ext'].ReplayEventSource([
+        order_update("x-entry", "MARKET", "BUY", 1, 2000, symbol="ETHUSDT"),
+        account_update(1, 2000, symbol="ETHUSDT"),
+        order_update(f"{trade}-entry", "MARKET", "BUY", 0.1, 30000, status="PARTIALLY_FILLED"),
+    ])
+    for event in source.poll(0) + source.poll(0):
+        manager.on_stream_event(event)
+    assert manager.state == "WAIT_ENTRY" and not manager.need_reconcile
+    for event in source.poll(0):
+        manager.on_stream_event(event)
+    assert manager.need_reconcile
+
+
+def test_flat_position_after_entry_resets(sim, main_ns, manager):
+    source = main_ns['ext'].ReplayEventSource([account_update(0.166, 30000), account_update(0, 0)])
+    assert replay(sim, manager, source) == ["ENTRY_DONE", "IDLE"]
+    assert logged(sim, "底仓止损触发，全部平仓")
+    # 撤单后挂单已清空, 状态字段复位
+    market = sim.exchange.markets["BTC_USDT"]
+    assert not market.orders and not market.algo_orders
+    assert manager.symbol == "" and manager.last_position_amount == 0
+
+
+def test_opposite_side_position_counts_as_flat(sim, main_ns, manager):
+    source = main_ns['ext'].ReplayEventSource([account_update(0.166, 30000), account_update(-0.2, 30000)])
+    assert replay(sim, manager, source) == ["ENTRY_DONE", "IDLE"]
+
+
+class FakeConn:
+    def read(self, timeout):
+        return None
+
+    def close(self):
+        pass
+
+
+def test_keepalive_and_reconnect_follow_the_platform_clock(sim, monkeypatch):
+    """listenKey续期和24小时前重连按 UnixNano 计时, 模拟时钟推进即可确定性触发"""
+    ext = sim.load_template()
+    monkeypatch.setitem(ext.UserDataStream.__init__.__globals__, 'Dial', lambda url: FakeConn())
+    calls = []
+    io = sim.exchange.IO
+    sim.exchange.IO = lambda kind, *args: calls.append(args[0]) or io(kind, *args)
+    stream = ext.UserDataStream(sim.exchange)
+    assert stream.connect() and stream.connected_at == sim.now
+    sim.sleep(stream.KEEPALIVE_INTERVAL - 1000)
+    stream.poll(0)
+    assert calls == ["POST"]
+    sim.sleep(1000)
+    stream.poll(0)
+    assert calls == ["POST", "PUT"] and stream.last_keepalive == sim.now
+    sim.sleep(stream.RECONNECT_INTERVAL)
+    stream.poll(0)
+    assert calls[-1] == "POST" and stream.connected_at == sim.now
+    assert logged(sim, "用户数据流重连")
@@ -1,16 +1,48 @@
 """
 FMZ交易工具模板类库
-包含：通知管理、订单管理、精度管理、ATR计算
+包含：通知管理(异步队列合并发送)、订单管理、精度管理、ATR计算(增量缓存)、用户数据流、行情流、主循环任务调度、状态栏渲染、行情快照(自适应检查间隔)、性能统计、状态持久化
 """
 import json
+import math
+import random
+import time
+import zlib
+from collections import deque
+from urllib.parse import quote, urlencode
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # ============================================================
 # 1. 通知管理类
 # ============================================================
 class NotificationManager:
-    """管理邮件和APP推送通知"""
+    """
+    管理邮件和APP推送通知
+    FMZ通过 Log(消息, "@") 推送, Log只在主线程调用: send_notification() 只把消息放入有界队列后立即返回,
+    主循环在每个任务之后调用 flush() 发送, 下单路径不等待推送:
+    - 队列满时丢弃最早的消息 (计入 dropped)
+    - flush() 按标题 (含币种) 合并: 同一标题的多条合并为一条, 不同币种/事件分别发送; 只有一条时原样发送
+    - 发送失败时保留在队列中, 按退避间隔在之后的 flush() 重试, MAX_RETRIES 次仍失败计入 failed
+    - stats 记录入队/发送/合并/丢弃/失败次数和入队到发出的延迟
+    ASYNC=False 时在调用处同步发送 (模拟器中关闭, 日志顺序可复现)
+    """
+    ASYNC = True
+    MAX_QUEUE = 100          # 队列上限(条)
+    MAX_RETRIES = 3
+    RETRY_DELAY = 1000       # 首次重试等待(毫秒), 之后翻倍
+
     def __init__(self, exchange_obj=None):
         self.ex = exchange_obj
+        self.queue = deque()  # [标题, 内容, 入队时间, 已失败次数, 下次可发送时间]
+        self.stats = {'queued': 0, 'sent': 0, 'merged': 0, 'dropped': 0, 'failed': 0,
+                      'delay_total': 0, 'delay_max': 0}
+
+    @staticmethod
+    def _now():
+        return UnixNano() / 1000000
 
     def send_notification(self, message, title=""):
         """
@@ -24,31 +56,93 @@ class NotificationManager:
         notify.send_notification("交易信号触发！")
         notify.send_notification("多单开仓成功", "交易提醒")
         """
-        try:
-            # 使用 @ 符号发送通知，FMZ会自动同时发送邮件和APP推送
-            if title:
-                full_message = f"{title}: {message}"
+        item = [title, message, self._now(), 0, 0]
+        if len(self.queue) >= self.MAX_QUEUE:
+            self.queue.popleft()
+            self.stats['dropped'] += 1
+        self.queue.append(item)
+        self.stats['queued'] += 1
+        if not self.ASYNC:
+            self.flush()
+
+    def flush(self):
+        """发送队列中已到发送时间的消息, 同一标题合并为一条 (主循环调用)"""
+        if not self.queue:
+            return
+        now = self._now()
+        groups = {}
+        waiting = deque()
+        for item in self.queue:
+            if item[4] > now:
+                waiting.append(item)
             else:
-                full_message = message
+                groups.setdefault(item[0], []).append(item)
+        self.queue = waiting
+        for title, batch in groups.items():
+            if not self._deliver(title, batch):
+                self._retry_later(batch, now)
+
+    def _retry_later(self, batch, now):
+        """发送失败的消息放回队列, 按退避间隔重试"""
+        for item in batch:
+            item[3] += 1
+            if item[3] >= self.MAX_RETRIES:
+                self.stats['failed'] += 1
+                continue
+            item[4] = now + self.RETRY_DELAY * 2 ** (item[3] - 1)
+            self.queue.append(item)
 
+    def _deliver(self, title, batch):
+        """发送同一标题的一批消息 (多条时合并为一条)"""
+        if len(batch) == 1:
+            message = batch[0][1]
+        else:
+            title = f"{title} ({len(batch)}条)"
+            message = "\n\n".join(item[1] for item in batch)
+        full_message = f"{title}: {message}" if title else message
+        try:
+            # 使用 @ 符号发送通知，FMZ会自动同时发送邮件和APP推送
             Log(full_message, "@")
-            
         except Exception as e:
             Log(f"⚠️ 通知发送失败: {e}", "#FF9900")
+            return False
+        self.stats['merged'] += len(batch) - 1
+        now = self._now()
+        for item in batch:
+            self.stats['delay_total'] += now - item[2]
+            self.stats['delay_max'] = max(self.stats['delay_max'], now - item[2])
+        self.stats['sent'] += len(batch)
+        return True
+
+    def report(self):
+        st = self.stats
+        avg = st['delay_total'] / st['sent'] if st['sent'] else 0
+        return (f"通知: 入队{st['queued']} 发送{st['sent']} 合并{st['merged']} 丢弃{st['dropped']} 失败{st['failed']}"
+                f" 待发{len(self.queue)} | 延迟 平均{avg:.0f}ms 最大{st['delay_max']:.0f}ms")
 
 # ============================================================
 # 2. 精度管理类
 # ============================================================
-class PrecisionManager:
-    """管理交易精度"""
+class MarketInfoStore:
+    """
+    交易对元数据 (价格/数量精度、最小下单量、最小价格变动)
+    一次 GetMarkets 快照索引全部永续合约，查询为内存字典命中
+    - 快照过期(TTL)或查询未命中时才重新拉取
+    - 拉取失败后退避: 首次等待 RETRY_INTERVAL, 连续失败时翻倍, 上限 MISS_REFRESH_INTERVAL,
+      退避期内查询只使用已有数据, 不在交易路径上反复请求
+    - 数据有变化时才写入 CACHE_FILE
+    """
     CACHE_FILE = "precision_cache.json"
+    TTL = 6 * 3600 * 1000          # 快照有效期(毫秒)
+    MISS_REFRESH_INTERVAL = 60000  # 未命中时两次拉取的最小间隔(毫秒)
+    RETRY_INTERVAL = 5000          # 拉取失败后的首次重试间隔(毫秒)
 
-    def __init__(self, exchange):
-        self.ex = exchange
-        self.price_precision = 2
-        self.amount_precision = 4
-        self.min_amount = 0.00001
-        self.tick_size = 0.01
+    def __init__(self, exchange_obj):
+        self.ex = exchange_obj
+        self.markets = self.load_cache()
+        self.updated = 0
+        self.failures = 0   # 连续拉取失败次数
+        self.retry_at = 0   # 拉取失败后允许再次拉取的时间
 
     def load_cache(self):
         """加载缓存"""
@@ -58,52 +152,96 @@ class PrecisionManager:
         except:
             return {}
 
-    def save_cache(self, cache):
+    def save_cache(self):
         """保存缓存"""
         try:
             with open(self.CACHE_FILE, 'w') as f:
-                json.dump(cache, f, indent=2)
+                json.dump(self.markets, f, indent=2)
         except:
             pass
 
-    def set_precision(self, symbol):
-        """设置精度"""
-        cache = self.load_cache()
-        # 检查缓存
-        if symbol in cache:
-            data = cache[symbol]
-            self.price_precision = int(data['price_precision'])
-            self.amount_precision = int(data['amount_precision'])
-            self.min_amount = float(data['min_amount'])
-            self.tick_size = float(data['tick_size'])
-            Log(f"💾 [{symbol}] 从缓存加载精度")
-            return True
-        # 从交易所获取
+    def _failed(self):
+        """记录拉取失败, 按连续失败次数退避"""
+        self.failures += 1
+        delay = min(self.MISS_REFRESH_INTERVAL, self.RETRY_INTERVAL * 2 ** (self.failures - 1))
+        self.retry_at = UnixNano() / 1000000 + delay
+
+    def refresh(self):
+        """拉取 GetMarkets 快照并重建索引"""
         try:
-            markets = _C(self.ex.GetMarkets)
-            lookup_symbol = f"{symbol}.swap"
-            target = markets.get(lookup_symbol)
-            if target:
-                self.price_precision = int(target['PricePrecision'])
-                self.amount_precision = int(target['AmountPrecision'])
-                self.min_amount = float(target['MinQty'])
-                self.tick_size = float(target['TickSize'])
-                # 保存缓存
-                cache[symbol] = {
-                    'price_precision': self.price_precision,
-                    'amount_precision': self.amount_precision,
-                    'min_amount': self.min_amount,
-                    'tick_size': self.tick_size
-                }
-                self.save_cache(cache)
-                Log(f"✅ [{symbol}] 精度获取成功")
-                return True
-            else:
-                Log(f"❌ 无法获取 {lookup_symbol} 精度")
-                return False
+            snapshot = _C(self.ex.GetMarkets)
         except Exception as e:
             Log(f"❌ 精度获取失败: {e}")
+            self._failed()
             return False
+        if not snapshot:
+            self._failed()
+            return False
+        self.updated = UnixNano() / 1000000
+        self.failures = 0
+        markets = dict(self.markets)
+        for key, target in snapshot.items():
+            if not key.endswith(".swap"):
+                continue
+            markets[key[:-5]] = {
+                'price_precision': int(target['PricePrecision']),
+                'amount_precision': int(target['AmountPrecision']),
+                'min_amount': float(target['MinQty']),
+                'tick_size': float(target['TickSize'])
+            }
+        if markets != self.markets:
+            self.markets = markets
+            self.save_cache()
+        return True
+
+    def get(self, symbol):
+        """查询交易对元数据, 不存在返回None"""
+        now = UnixNano() / 1000000
+        elapsed = now - self.updated
+        if now >= self.retry_at and (elapsed >= self.TTL or
+                                     (symbol not in self.markets and elapsed >= self.MISS_REFRESH_INTERVAL)):
+            self.refresh()
+        return self.markets.get(symbol)
+
+
+class PrecisionManager:
+    """管理交易精度"""
+    shared_store = None
+
+    def __init__(self, exchange):
+        self.ex = exchange
+        self.store = PrecisionManager.get_store(exchange)
+        self.price_precision = 2
+        self.amount_precision = 4
+        self.min_amount = 0.00001
+        self.tick_size = 0.01
+
+    @staticmethod
+    def get_store(exchange):
+        """同一交易所对象共享一个 MarketInfoStore"""
+        store = PrecisionManager.shared_store
+        if store is None or store.ex is not exchange:
+            store = PrecisionManager.shared_store = MarketInfoStore(exchange)
+        return store
+
+    @staticmethod
+    def prefetch(exchange):
+        """启动时拉取全部交易对元数据"""
+        store = PrecisionManager.get_store(exchange)
+        if store.refresh():
+            Log(f"✅ 已加载 {len(store.markets)} 个交易对精度")
+
+    def set_precision(self, symbol):
+        """设置精度"""
+        data = self.store.get(symbol)
+        if not data:
+            Log(f"❌ 无法获取 {symbol}.swap 精度")
+            return False
+        self.price_precision = data['price_precision']
+        self.amount_precision = data['amount_precision']
+        self.min_amount = data['min_amount']
+        self.tick_size = data['tick_size']
+        return True
 
     def format_price(self, price):
         """格式化价格"""
@@ -113,73 +251,388 @@ class PrecisionManager:
         """格式化数量"""
         return _N(amount, self.amount_precision)
 
+    def price_str(self, price):
+        """API参数用的价格字符串: 按价格精度截断后输出定点小数 (str(1e-05) 为科学计数法, 币安不接受)"""
+        return f"{self.format_price(price):.{self.price_precision}f}"
+
+    def amount_str(self, amount):
+        """API参数用的数量字符串 (定点小数, 按数量精度)"""
+        return f"{amount:.{self.amount_precision}f}"
+
 # ============================================================
 # 3. 订单管理类
 # ============================================================
+class TokenBucket:
+    """令牌桶: capacity 个令牌在 interval 毫秒内匀速补满"""
+    def __init__(self, capacity, interval, now):
+        self.capacity = float(capacity)
+        self.rate = float(capacity) / interval  # 每毫秒补充的令牌数
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, cost, floor):
+        """令牌数扣除cost后不低于floor所需的等待时间(毫秒)"""
+        deficit = cost + floor - self.tokens
+        return 0 if deficit <= 0 else deficit / self.rate
+
+
+class RequestScheduler:
+    """
+    币安请求权重调度 (令牌桶)
+    - 按限额类别分别计量: weight=IP请求权重(每分钟), orders=下单数(每10秒)
+    - 优先级: PROTECT(止损/保护单/撤单) > NORMAL(开仓/查询) > LOW(预热/展示等可延后的请求)
+      NORMAL 不使用为 PROTECT 预留的额度, LOW 只在额度充足时执行
+    - defer() 提交的低优先级请求按 key 合并, 由 run_deferred() 在额度充足时执行
+    - 收到限频错误(-1003/429)后暂停非保护请求
+    - clock/sleep 可注入 (假时钟测试); 多个机器人共用一个API Key时按比例调低 limits
+    """
+    PROTECT = 0
+    NORMAL = 1
+    LOW = 2
+    # 类别: (额度, 周期毫秒)
+    DEFAULT_LIMITS = {
+        'weight': (2400, 60000),
+        'orders': (300, 10000),
+    }
+    RESERVE = 0.2        # 为保护请求预留的额度比例
+    LOW_THRESHOLD = 0.5  # 低优先级请求要求的剩余额度比例
+    PENALTY = 10000      # 限频错误后暂停非保护请求的时间(毫秒)
+    # (方法, 端点): 各类别消耗, 未列出的请求按 weight=1 计
+    ENDPOINT_COSTS = {
+        ("POST", "/fapi/v1/order"): {'weight': 0, 'orders': 1},
+        ("POST", "/fapi/v1/algoOrder"): {'weight': 0, 'orders': 1},
+        ("POST", "/fapi/v1/batchOrders"): {'weight': 5, 'orders': 1},
+        ("DELETE", "/fapi/v1/allOpenOrders"): {'weight': 1},
+        ("DELETE", "/fapi/v1/algoOpenOrders"): {'weight': 1},
+        ("GET", "/fapi/v1/openAlgoOrders"): {'weight': 1},
+        ("GET", "/fapi/v1/openOrders"): {'weight': 1},
+        ("GET", "/fapi/v2/positionRisk"): {'weight': 5},
+        ("GET", "/fapi/v1/klines"): {'weight': 5},
+        ("GET", "/fapi/v1/exchangeInfo"): {'weight': 1},
+    }
+    default = None
+
+    def __init__(self, limits=None, clock=None, sleep=None):
+        self.clock = clock or (lambda: UnixNano() / 1000000)
+        self.sleep = sleep or Sleep
+        now = self.clock()
+        limits = limits or self.DEFAULT_LIMITS
+        self.buckets = {name: TokenBucket(cap, interval, now) for name, (cap, interval) in limits.items()}
+        self.paused_until = 0
+        self.deferred = {}  # key -> (func, args), 同key只保留最新一次
+        self.stats = {'requests': 0, 'waited_ms': 0, 'throttled': 0, 'merged': 0}
+
+    @staticmethod
+    def get_default():
+        """同一机器人内的所有 OrderManager 共享一个调度器"""
+        if RequestScheduler.default is None:
+            RequestScheduler.default = RequestScheduler()
+        return RequestScheduler.default
+
+    def cost(self, method, endpoint, count=1):
+        """请求消耗; count 为批量请求中的订单数"""
+        costs = dict(self.ENDPOINT_COSTS.get((method, endpoint), {'weight': 1}))
+        if 'orders' in costs:
+            costs['orders'] = count
+        return costs
+
+    def _wait_time(self, costs, priority, now):
+        wait = 0
+        if priority != self.PROTECT and now < self.paused_until:
+            wait = self.paused_until - now
+        for name, cost in costs.items():
+            bucket = self.buckets.get(name)
+            if bucket is None or cost <= 0:
+                continue
+            bucket.refill(now)
+            if priority == self.PROTECT:
+                floor = 0
+            elif priority == self.NORMAL:
+                floor = bucket.capacity * self.RESERVE
+            else:
+                floor = bucket.capacity * self.LOW_THRESHOLD
+            wait = max(wait, bucket.wait_time(cost, floor))
+        return wait
+
+    def acquire(self, costs, priority=NORMAL):
+        """
+        等待额度并扣减, 返回等待时间(毫秒)
+        costs: {类别: 消耗}, 通常由 cost() 计算
+        """
+        waited = 0
+        while True:
+            now = self.clock()
+            wait = self._wait_time(costs, priority, now)
+            if wait <= 0:
+                break
+            self.sleep(int(wait) + 1)
+            waited += int(wait) + 1
+        for name, cost in costs.items():
+            if name in self.buckets:
+                self.buckets[name].tokens -= cost
+        self.stats['requests'] += 1
+        if waited:
+            self.stats['waited_ms'] += waited
+        return waited
+
+    def throttled(self):
+        """收到限频错误: 暂停非保护请求"""
+        self.paused_until = self.clock() + self.PENALTY
+        self.stats['throttled'] += 1
+        Log(f"⚠️ 触发交易所限频，非保护请求暂停{self.PENALTY // 1000}秒", "#FF9900")
+
+    def defer(self, key, func, *args, costs=None):
+        """提交低优先级请求, 同key的未执行请求被合并为最新一次; costs 为执行时计入的消耗"""
+        if key in self.deferred:
+            self.stats['merged'] += 1
+        self.deferred[key] = (func, args, costs or {'weight': 1})
+
+    def run_deferred(self):
+        """额度充足时执行延后的低优先级请求 (每轮主循环调用)"""
+        for key in list(self.deferred):
+            func, args, costs = self.deferred[key]
+            if self._wait_time(costs, self.LOW, self.clock()) > 0:
+                return
+            del self.deferred[key]
+            self.acquire(costs, self.LOW)
+            try:
+                func(*args)
+            except Exception as e:
+                Log(f"⚠️ 延后请求执行失败 [{key}]: {e}", "#FF9900")
+
+
+class CircuitBreaker:
+    """
+    熔断器: 连续失败 threshold 次后断开, cooldown 毫秒内直接拒绝请求,
+    冷却结束后放行一次试探请求 (半开), 成功则恢复, 失败则重新断开
+    """
+    def __init__(self, threshold=5, cooldown=10000):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0
+        self.trips = 0
+
+    def allow(self, now):
+        return self.failures < self.threshold or now >= self.open_until
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self, now):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            # 首次断开或半开试探失败
+            self.open_until = now + self.cooldown
+            self.trips += 1
+            return True
+        return False
+
+
+class RetryPolicy:
+    """
+    重试与等待策略
+    - attempts(op) 按操作配置产出尝试序号, 两次尝试之间指数退避并加抖动,
+      超过截止时间或次数后结束 (调用方成功时直接跳出循环)
+    - breaker(endpoint) 返回该端点的熔断器, 持续失败的端点暂停请求
+    - stats 按操作统计尝试次数、等待时间和放弃次数, 用于度量并削减实际付出的等待
+    - clock/sleep/rng 可注入 (假时钟测试)
+    """
+    # 操作: (首次退避, 退避上限, 截止时间, 最多尝试次数), 时间单位毫秒
+    POLICIES = {
+        'submit': (25, 500, 3000, 4),           # 下单重试
+        'cancel_confirm': (50, 400, 2000, 20),  # 撤单后确认挂单已清空
+        'close_confirm': (100, 800, 3000, 10),  # 强制平仓后确认仓位已清空
+    }
+    JITTER = 0.5  # 退避时间中随机部分的比例
+    default = None
+
+    def __init__(self, policies=None, clock=None, sleep=None, rng=None):
+        self.policies = dict(self.POLICIES, **(policies or {}))
+        self.clock = clock or (lambda: UnixNano() / 1000000)
+        self.sleep = sleep or Sleep
+        self.rng = rng or random.random
+        self.breakers = {}
+        self.stats = {}
+
+    @staticmethod
+    def get_default():
+        """同一机器人内共享一个重试策略 (熔断状态和统计按端点/操作汇总)"""
+        if RetryPolicy.default is None:
+            RetryPolicy.default = RetryPolicy()
+        return RetryPolicy.default
+
+    def _stat(self, op):
+        if op not in self.stats:
+            self.stats[op] = {'runs': 0, 'attempts': 0, 'waited_ms': 0, 'gave_up': 0}
+        return self.stats[op]
+
+    def backoff(self, op, retry):
+        """第 retry 次重试前的等待时间: 指数增长至上限, 其中 JITTER 比例随机"""
+        base, cap = self.policies[op][:2]
+        delay = min(cap, base * 2 ** (retry - 1))
+        return delay * (1 - self.JITTER) + delay * self.JITTER * self.rng()
+
+    def attempts(self, op):
+        """生成器: 产出尝试序号 0, 1, 2...; 重试前等待, 超时或次数用完后结束"""
+        deadline, count = self.policies[op][2:]
+        stat = self._stat(op)
+        stat['runs'] += 1
+        start = self.clock()
+        for i in range(count):
+            if i:
+                remaining = start + deadline - self.clock()
+                if remaining <= 0:
+                    break
+                wait = int(min(self.backoff(op, i), remaining)) + 1
+                self.sleep(wait)
+                stat['waited_ms'] += wait
+            stat['attempts'] += 1
+            yield i
+        stat['gave_up'] += 1
+
+    def breaker(self, endpoint):
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker()
+        return self.breakers[endpoint]
+
+    def report(self):
+        """各操作的等待统计, 供状态栏展示"""
+        lines = []
+        for op, st in self.stats.items():
+            avg = st['waited_ms'] / st['runs'] if st['runs'] else 0
+            lines.append(f"{op}: {st['runs']}次 尝试{st['attempts']} 等待{st['waited_ms']}ms "
+                         f"(平均{avg:.0f}ms) 放弃{st['gave_up']}")
+        tripped = [f"{ep}({b.trips})" for ep, b in self.breakers.items() if b.trips]
+        if tripped:
+            lines.append("熔断: " + ", ".join(tripped))
+        return lines
+
+
 class OrderManager:
-    """封装订单管理 - 市价单/限价单用FMZ平台,止损单/跟踪单用币安API"""
-    def __init__(self, exchange_obj, precision_mgr):
+    """
+    封装订单管理 - 全部订单经币安API提交, 止损单/跟踪单走 Algo Service 端点
+    每个订单带确定性的客户端订单ID (交易ID + 订单腿), 请求结果不确定时
+    先按ID查询再重发, 因此重试可以立即进行且不会重复成交
+    """
+    ORDER_ENDPOINT = "/fapi/v1/order"
+    BATCH_ENDPOINT = "/fapi/v1/batchOrders"
+    BATCH_LIMIT = 5  # 币安批量下单每次最多5个订单
+    CANCEL_ALL_ENDPOINT = "/fapi/v1/allOpenOrders"
+    CANCEL_ALGO_ENDPOINT = "/fapi/v1/algoOpenOrders"
+    OPEN_ALGO_ENDPOINT = "/fapi/v1/openAlgoOrders"
+    # 结果不确定的错误: 交易所可能已接受订单, 重发前必须先查询
+    AMBIGUOUS_CODES = (-1000, -1001, -1006, -1007)
+    # 请求被明确拒绝但可以重发的错误 (限频/过载)
+    RETRY_CODES = (-1003, -1008, -1015)
+    DUPLICATE_CODE = -4116  # ClientOrderId is duplicated
+    NOT_FOUND_CODE = -2013  # Order does not exist
+
+    def __init__(self, exchange_obj, precision_mgr, scheduler=None, retry=None):
         self.ex = exchange_obj
         self.precision = precision_mgr
         self.algo_endpoint = "/fapi/v1/algoOrder"  # 新的条件单端点
+        self.scheduler = scheduler or RequestScheduler.get_default()
+        self.retry = retry or RetryPolicy.get_default()
+        # 调用方未指定客户端订单ID时, 按本实例的会话ID + 序号生成
+        self.session_id = self.new_trade_id("")
+        self.seq = 0
 
-    def place_market(self, side, quantity):
+    @staticmethod
+    def new_trade_id(symbol_api):
         """
-        下市价单 - 使用FMZ平台方法
-        side: "BUY" 或 "SELL"
+        生成交易ID: 毫秒时间戳(36进制) + 币种哈希, 同一账户内不重复
+        与订单腿名称组合后不超过币安客户端订单ID的36字符限制
         """
-        try:
-            if side == "BUY":
-                order = self.ex.Buy(-1, quantity)  # -1表示市价
-            else:
-                order = self.ex.Sell(-1, quantity)
-            if order:
-                Log(f"✅ 开仓 {side} {quantity} (市价)")
-                return order
-            else:
-                Log(f"❌ 市价单失败", "#FF0000")
-                return None
-        except Exception as e:
-            Log(f"❌ 市价单异常: {e}", "#FF0000")
-            return None
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+        n = int(UnixNano() / 1000000) * 1296 + zlib.crc32(symbol_api.encode()) % 1296
+        out = ""
+        while n:
+            n, r = divmod(n, 36)
+            out = digits[r] + out
+        return "t" + out
+
+    @staticmethod
+    def client_order_id(trade_id, leg):
+        """客户端订单ID = 交易ID + 订单腿 (如 sl / add / tp1)"""
+        return f"{trade_id}-{leg}"
+
+    def _client_id(self, client_id):
+        if client_id:
+            return client_id
+        self.seq += 1
+        return self.client_order_id(self.session_id, f"o{self.seq}")
 
-    def place_limit(self, side, quantity, price, reduce_only=False):
+    def _acquire(self, method, endpoint, priority, count=1):
+        """按请求权重排队"""
+        self.scheduler.acquire(self.scheduler.cost(method, endpoint, count), priority)
+
+    def _symbol_api(self, symbol_api=""):
         """
-        下限价单 - 使用FMZ平台方法
-        reduce_only: 仅平仓模式
+        订单的交易对 (币安API格式, 如 BTCUSDT)
+        未指定时取 exchange 的当前交易对; 多币种共用一个 exchange 时当前交易对会被其他实例切换, 调用方应显式传入
         """
-        try:
-            formatted_price = self.precision.format_price(price)
-            if side == "BUY":
-                if reduce_only:
-                    order = self.ex.Buy(formatted_price, quantity, "reduce_only")
-                else:
-                    order = self.ex.Buy(formatted_price, quantity)
-            else:
-                if reduce_only:
-                    order = self.ex.Sell(formatted_price, quantity, "reduce_only")
-                else:
-                    order = self.ex.Sell(formatted_price, quantity)
-            if order:
-                action = "止盈" if reduce_only else "开仓"
-                Log(f"✅ {action} {side} {quantity} @ {formatted_price}")
-                return order
-            else:
-                Log(f"❌ 限价单失败", "#FF0000")
-                return None
-        except Exception as e:
-            Log(f"❌ 限价单异常: {e}", "#FF0000")
-            return None
+        return symbol_api or self.ex.GetCurrency().replace("_", "")
+
+    def _order_fields(self, symbol_api, side, quantity, price, reduce_only, client_id):
+        """构造市价/限价单字段 (price=-1 为市价), 返回 (字段dict, 日志描述)"""
+        quantity = self.precision.amount_str(quantity)
+        order = {'symbol': symbol_api, 'side': side, 'quantity': quantity, 'newClientOrderId': client_id}
+        if price == -1:
+            order['type'] = "MARKET"
+            desc = f"{side} {quantity} (市价)"
+        else:
+            formatted_price = self.precision.price_str(price)
+            order.update({'type': "LIMIT", 'timeInForce': "GTC", 'price': formatted_price})
+            desc = f"{side} {quantity} @ {formatted_price}"
+        if reduce_only:
+            order['reduceOnly'] = "true"
+        action = "止盈" if reduce_only else "开仓"
+        return order, f"{action} {desc}"
 
-    def place_stop_market(self, symbol_api, side, quantity, stop_price, reduce_only=False):
+    def place_market(self, side, quantity, priority=RequestScheduler.NORMAL, client_id="", symbol_api=""):
         """
-        止损市价单 - 使用新的 Algo Service 端点
-        symbol_api: 币安API格式的币种名(如 BTCUSDT)
+        下市价单
         side: "BUY" 或 "SELL"
-        stop_price: 触发价格
-        reduce_only: 是否仅平仓
+        priority: 请求优先级, 强制平仓使用 RequestScheduler.PROTECT
+        client_id: 客户端订单ID, 由交易ID和订单腿生成 (client_order_id)
+        symbol_api: 币安API格式的币种名, 为空时使用当前交易对
+        """
+        symbol_api = self._symbol_api(symbol_api)
+        order, desc = self._order_fields(symbol_api, side, quantity, -1, False, self._client_id(client_id))
+        ret = self._submit(self.ORDER_ENDPOINT, urlencode(order), symbol_api, order['newClientOrderId'], priority)
+        if ret:
+            Log(f"✅ {desc}")
+        else:
+            Log(f"❌ 市价单失败", "#FF0000")
+        return ret
+
+    def place_limit(self, side, quantity, price, reduce_only=False, client_id="", symbol_api=""):
         """
-        formatted_stop = self.precision.format_price(stop_price)
+        下限价单
+        reduce_only: 仅平仓模式
+        client_id: 客户端订单ID
+        symbol_api: 币安API格式的币种名, 为空时使用当前交易对
+        """
+        symbol_api = self._symbol_api(symbol_api)
+        order, desc = self._order_fields(symbol_api, side, quantity, price, reduce_only, self._client_id(client_id))
+        ret = self._submit(self.ORDER_ENDPOINT, urlencode(order), symbol_api, order['newClientOrderId'],
+                           self._order_priority(reduce_only))
+        if ret:
+            Log(f"✅ {desc}")
+        else:
+            Log(f"❌ 限价单失败", "#FF0000")
+        return ret
+
+    def _stop_market_params(self, symbol_api, side, quantity, stop_price, reduce_only=False, client_id=""):
+        """构造 STOP_MARKET 条件单参数, 返回 (参数, 日志描述)"""
+        formatted_stop = self.precision.price_str(stop_price)
+        quantity = self.precision.amount_str(quantity)
         params = (
             f"algoType=CONDITIONAL"
             f"&symbol={symbol_api}"
@@ -188,22 +641,17 @@ class OrderManager:
             f"&quantity={quantity}"
             f"&triggerPrice={formatted_stop}"
             f"&workingType=CONTRACT_PRICE"
+            f"&clientAlgoId={client_id}"
         )
         if reduce_only:
             params += "&reduceOnly=true"
         action = "止损" if reduce_only else "加仓"
-        Log(f"✅ {action}单 {side} {quantity} @ {formatted_stop}")
-        return self._api_request(self.algo_endpoint, params, "POST")
+        return params, f"{action}单 {side} {quantity} @ {formatted_stop}"
 
-    def place_trailing_stop(self, symbol_api, side, quantity, callback_rate, activation_price=0, reduce_only=False):
-        """
-        跟踪止损单 - 使用新的 Algo Service 端点
-        symbol_api: 币安API格式的币种名
-        side: "BUY" 或 "SELL"
-        callback_rate: 回调率百分比(如 1.5 表示1.5%)
-        activation_price: 激活价格(可选,0表示立即激活)
-        reduce_only: 是否仅平仓
-        """
+    def _trailing_stop_params(self, symbol_api, side, quantity, callback_rate, activation_price=0, reduce_only=False,
+                              client_id=""):
+        """构造 TRAILING_STOP_MARKET 条件单参数, 返回 (参数, 日志描述)"""
+        quantity = self.precision.amount_str(quantity)
         params = (
             f"algoType=CONDITIONAL"
             f"&symbol={symbol_api}"
@@ -211,20 +659,230 @@ class OrderManager:
             f"&type=TRAILING_STOP_MARKET"
             f"&quantity={quantity}"
             f"&callbackRate={callback_rate}"
+            f"&clientAlgoId={client_id}"
         )
         if activation_price > 0:
-            formatted_activation = self.precision.format_price(activation_price)
+            formatted_activation = self.precision.price_str(activation_price)
             params += f"&activatePrice={formatted_activation}"
-        else:
-            formatted_activation = 0
         if reduce_only:
             params += "&reduceOnly=true"
         action = "跟踪止盈" if reduce_only else "跟踪开仓"
         if activation_price > 0:
-            Log(f"✅ {action} {side} {quantity} 激活价={formatted_activation} 回调={callback_rate}%")
+            return params, f"{action} {side} {quantity} 激活价={formatted_activation} 回调={callback_rate}%"
+        return params, f"{action} {side} {quantity} 回调={callback_rate}%"
+
+    def place_stop_market(self, symbol_api, side, quantity, stop_price, reduce_only=False, client_id=""):
+        """
+        止损市价单 - 使用新的 Algo Service 端点
+        symbol_api: 币安API格式的币种名(如 BTCUSDT)
+        side: "BUY" 或 "SELL"
+        stop_price: 触发价格
+        reduce_only: 是否仅平仓
+        client_id: 客户端订单ID (clientAlgoId)
+        """
+        client_id = self._client_id(client_id)
+        params, desc = self._stop_market_params(symbol_api, side, quantity, stop_price, reduce_only, client_id)
+        Log(f"✅ {desc}")
+        return self._submit(self.algo_endpoint, params, symbol_api, client_id, self._order_priority(reduce_only))
+
+    def place_trailing_stop(self, symbol_api, side, quantity, callback_rate, activation_price=0, reduce_only=False,
+                            client_id=""):
+        """
+        跟踪止损单 - 使用新的 Algo Service 端点
+        symbol_api: 币安API格式的币种名
+        side: "BUY" 或 "SELL"
+        callback_rate: 回调率百分比(如 1.5 表示1.5%)
+        activation_price: 激活价格(可选,0表示立即激活)
+        reduce_only: 是否仅平仓
+        client_id: 客户端订单ID (clientAlgoId)
+        """
+        client_id = self._client_id(client_id)
+        params, desc = self._trailing_stop_params(symbol_api, side, quantity, callback_rate, activation_price,
+                                                  reduce_only, client_id)
+        Log(f"✅ {desc}")
+        return self._submit(self.algo_endpoint, params, symbol_api, client_id, self._order_priority(reduce_only))
+
+    @staticmethod
+    def _order_priority(reduce_only):
+        """平仓/止损类订单优先于开仓类订单"""
+        return RequestScheduler.PROTECT if reduce_only else RequestScheduler.NORMAL
+
+    def place_batch(self, symbol_api, legs):
+        """
+        批量挂单 - 一组订单在约一次往返内全部提交
+        限价单按每组5个走 /fapi/v1/batchOrders, 条件单通过 exchange.Go 并发提交
+        legs: [{'name': 'sl', 'type': 'STOP_MARKET', 'side': 'SELL', 'quantity': 0.1,
+                'stop_price': 100, 'reduce_only': True, 'label': '止损', 'client_id': '...'}, ...]
+              type 为 STOP_MARKET (stop_price) / TRAILING_STOP_MARKET (callback_rate, activation_price)
+              / LIMIT (price); label 为日志中的名称, 默认同 name; client_id 为客户端订单ID
+        请求失败或结果不确定的订单先按客户端ID查询, 确认未下单后再单独重发
+        返回 {name: 下单结果或None}, 每个订单单独记录成功/失败
+        """
+        results = {}
+        pending = []
+        limits = []
+        for leg in legs:
+            client_id = self._client_id(leg.get('client_id'))
+            reduce_only = leg.get('reduce_only', False)
+            if leg['type'] == "LIMIT":
+                limits.append((leg, self._order_fields(symbol_api, leg['side'], leg['quantity'], leg['price'],
+                                                       reduce_only, client_id)))
+                continue
+            if leg['type'] == "STOP_MARKET":
+                params, desc = self._stop_market_params(symbol_api, leg['side'], leg['quantity'],
+                                                        leg['stop_price'], reduce_only, client_id)
+            else:
+                params, desc = self._trailing_stop_params(symbol_api, leg['side'], leg['quantity'], leg['callback_rate'],
+                                                          leg.get('activation_price', 0), reduce_only, client_id)
+            self._acquire("POST", self.algo_endpoint, self._order_priority(reduce_only))
+            handle = self.ex.Go("IO", "api", "POST", self.algo_endpoint, params)
+            pending.append(([leg], [(params, desc, client_id)], self.algo_endpoint, handle))
+        for i in range(0, len(limits), self.BATCH_LIMIT):
+            chunk = limits[i:i + self.BATCH_LIMIT]
+            params = "batchOrders=" + quote(json.dumps([order for _, (order, _) in chunk], separators=(',', ':')))
+            priority = self._order_priority(all(leg.get('reduce_only') for leg, _ in chunk))
+            self._acquire("POST", self.BATCH_ENDPOINT, priority, len(chunk))
+            handle = self.ex.Go("IO", "api", "POST", self.BATCH_ENDPOINT, params)
+            pending.append(([leg for leg, _ in chunk],
+                            [(urlencode(order), desc, order['newClientOrderId']) for _, (order, desc) in chunk],
+                            self.ORDER_ENDPOINT, handle))
+        # 等待全部返回, 逐个订单记录结果
+        for chunk, orders, endpoint, handle in pending:
+            try:
+                ret, _ = handle.wait()
+            except Exception:
+                ret = None
+            items = ret if isinstance(ret, list) else [ret] * len(chunk)
+            for leg, (params, desc, client_id), item in zip(chunk, orders, items):
+                placed = item if item and ('orderId' in item or 'algoId' in item) else None
+                code = item.get('code') if isinstance(item, dict) else None
+                if not placed and (not item or code in self.AMBIGUOUS_CODES):
+                    # 并发/批量请求失败或结果不确定: 先查询, 未下单再单独重发
+                    placed = self._submit(endpoint, params, symbol_api, client_id,
+                                          self._order_priority(leg.get('reduce_only', False)), lookup_first=True)
+                results[leg['name']] = self._report_leg(leg, desc, placed, item)
+        return results
+
+    @staticmethod
+    def _error_code(error):
+        """从异常信息中解析币安错误码, 无错误码 (超时/断线等) 返回None"""
+        text = str(error)
+        pos = text.find('"code":')
+        if pos < 0:
+            return None
+        try:
+            return int(text[pos + 7:].split(",")[0].split("}")[0])
+        except ValueError:
+            return None
+
+    def _lookup(self, endpoint, symbol_api, client_id, priority):
+        """
+        按客户端订单ID查询订单
+        返回: 订单dict (已下单) / False (确认不存在) / None (查询失败, 状态未知)
+        """
+        if endpoint == self.algo_endpoint:
+            params = f"clientAlgoId={client_id}"
         else:
-            Log(f"✅ {action} {side} {quantity} 回调={callback_rate}%")
-        return self._api_request(self.algo_endpoint, params, "POST")
+            params = f"symbol={symbol_api}&origClientOrderId={client_id}"
+        try:
+            self._acquire("GET", endpoint, priority)
+            return self.ex.IO("api", "GET", endpoint, params) or None
+        except Exception as e:
+            if self._error_code(e) == self.NOT_FOUND_CODE:
+                return False
+            return None
+
+    def query_order(self, client_id, symbol_api=""):
+        """
+        按客户端订单ID查询普通订单 (symbol_api 为空时查询当前交易对)
+        返回: 订单dict (含 status/executedQty) / False (确认不存在) / None (查询失败)
+        """
+        return self._lookup(self.ORDER_ENDPOINT, self._symbol_api(symbol_api), client_id, RequestScheduler.NORMAL)
+
+    def cancel_by_client_id(self, client_id, reduce_only=False, symbol_api=""):
+        """
+        按客户端订单ID撤销普通订单 (symbol_api 为空时撤销当前交易对的订单)
+        返回: 撤单后的订单dict (含最终 executedQty) / None (撤单失败, 如订单已成交或不存在)
+        """
+        params = f"symbol={self._symbol_api(symbol_api)}&origClientOrderId={client_id}"
+        try:
+            self._acquire("DELETE", self.ORDER_ENDPOINT, self._order_priority(reduce_only))
+            return self.ex.IO("api", "DELETE", self.ORDER_ENDPOINT, params) or None
+        except Exception as e:
+            Log(f"⚠️ 撤单失败 {client_id}: {e}", "#FF9900")
+            return None
+
+    def cancel_algo_by_client_id(self, symbol_api, client_id):
+        """
+        按客户端订单ID撤销Algo条件单
+        返回: 撤单结果dict / None (撤单失败, 如已触发或不存在)
+        """
+        params = f"symbol={symbol_api}&clientAlgoId={client_id}"
+        try:
+            self._acquire("DELETE", self.algo_endpoint, RequestScheduler.PROTECT)
+            return self.ex.IO("api", "DELETE", self.algo_endpoint, params) or None
+        except Exception as e:
+            Log(f"⚠️ 撤单失败 {client_id}: {e}", "#FF9900")
+            return None
+
+    def _submit(self, endpoint, params, symbol_api, client_id, priority=RequestScheduler.NORMAL, lookup_first=False):
+        """
+        提交带客户端订单ID的订单 (普通单/条件单), 重试间隔和截止时间由 RetryPolicy 的 submit 策略决定
+        - 交易所明确拒绝: 不重试
+        - 限频/过载: 请求未被处理, 退避后重发
+        - 超时/断线/无返回: 结果不确定, 先按客户端ID查询, 查到即视为已下单, 确认不存在才重发
+        - 端点连续失败时熔断, 冷却期内非保护订单直接返回失败
+        lookup_first: 之前的提交结果已不确定 (并发/批量请求失败), 先查询再提交
+        """
+        breaker = self.retry.breaker(endpoint)
+        if priority != RequestScheduler.PROTECT and not breaker.allow(self.retry.clock()):
+            Log(f"⛔ {endpoint} 熔断中, 暂停下单 ({client_id})", "#FF0000")
+            return None
+        ambiguous = lookup_first
+        error = ""
+        for _ in self.retry.attempts("submit"):
+            if ambiguous:
+                found = self._lookup(endpoint, symbol_api, client_id, priority)
+                if found:
+                    breaker.success()
+                    Log(f"♻️ 订单已存在, 不重复提交: {client_id}")
+                    return found
+                if found is None:
+                    error = "订单状态查询失败"
+                    continue  # 状态未知时不能重发, 下一轮再查
+            try:
+                self._acquire("POST", endpoint, priority)
+                ret = self.ex.IO("api", "POST", endpoint, params)
+                if ret:
+                    breaker.success()
+                    return ret
+                error = "无返回"
+                ambiguous = True
+            except Exception as e:
+                error = e
+                code = self._error_code(e)
+                if code == -1003 or "429" in str(e):
+                    self.scheduler.throttled()
+                if code is not None and code not in self.AMBIGUOUS_CODES + self.RETRY_CODES + (self.DUPLICATE_CODE,):
+                    breaker.success()  # 交易所正常响应, 只是拒绝了该订单
+                    Log(f"❌ 下单被拒绝: {e}", "#FF0000")
+                    return None
+                ambiguous = code not in self.RETRY_CODES
+            if breaker.failure(self.retry.clock()):
+                Log(f"⛔ {endpoint} 连续失败, 熔断{breaker.cooldown // 1000}秒", "#FF0000")
+                if priority != RequestScheduler.PROTECT:
+                    break
+        Log(f"❌ 下单失败 ({client_id}): {error}", "#FF0000")
+        return None
+
+    def _report_leg(self, leg, desc, ret, detail=None):
+        """记录批量挂单中单个订单的结果"""
+        if ret:
+            Log(f"✅ {desc}")
+            return ret
+        reason = f": {detail.get('msg', detail)}" if isinstance(detail, dict) else ""
+        Log(f"⚠️ {leg.get('label', leg['name'])}挂单失败{reason}", "#FF9900")
+        return None
 
     def cancel_order(self, order_id):
         """
@@ -249,69 +907,502 @@ class OrderManager:
                 Log(f"❌ 撤单异常: {e}", "#FF0000")
                 return False
 
+    def _open_orders(self, symbol_fmz, symbol_api):
+        """并发查询普通挂单和Algo条件单, 查询失败的一项返回None"""
+        self._acquire("GET", "/fapi/v1/openOrders", RequestScheduler.PROTECT)
+        self._acquire("GET", self.OPEN_ALGO_ENDPOINT, RequestScheduler.PROTECT)
+        orders_go = self.ex.Go("GetOrders", f"{symbol_fmz}.swap")
+        algo_go = self.ex.Go("IO", "api", "GET", self.OPEN_ALGO_ENDPOINT, f"symbol={symbol_api}")
+        orders = algo_orders = None
+        try:
+            orders, _ = orders_go.wait()
+        except Exception:
+            pass
+        try:
+            algo_orders, _ = algo_go.wait()
+        except Exception:
+            pass
+        return orders, algo_orders
+
+    def open_client_ids(self, symbol_fmz, symbol_api):
+        """
+        当前挂单的客户端订单ID, 用于按交易ID对账
+        返回: {客户端订单ID: 是否Algo条件单}, 任一查询失败时返回None
+        """
+        orders, algo_orders = self._open_orders(symbol_fmz, symbol_api)
+        if orders is None or algo_orders is None:
+            return None
+        ids = {o.get('ClientOrderId') or (o.get('Info') or {}).get('clientOrderId', ""): False for o in orders}
+        ids.update({a.get('clientAlgoId', ""): True for a in algo_orders})
+        ids.pop("", None)
+        return ids
+
+    def _bulk_cancel(self, symbol_api):
+        """并发提交普通单(allOpenOrders)和条件单(algoOpenOrders)的批量撤单 (无挂单时交易所可能报错, 以查询结果为准)"""
+        params = f"symbol={symbol_api}"
+        self._acquire("DELETE", self.CANCEL_ALL_ENDPOINT, RequestScheduler.PROTECT)
+        self._acquire("DELETE", self.CANCEL_ALGO_ENDPOINT, RequestScheduler.PROTECT)
+        handles = [self.ex.Go("IO", "api", "DELETE", self.CANCEL_ALL_ENDPOINT, params),
+                   self.ex.Go("IO", "api", "DELETE", self.CANCEL_ALGO_ENDPOINT, params)]
+        for handle in handles:
+            try:
+                handle.wait()
+            except Exception:
+                pass
+
     def cancel_all_orders(self, symbol_fmz, symbol_api):
         """
         撤销所有挂单 - 包括FMZ平台订单和Algo条件单
+        两类批量撤单并发提交一次, 之后按 cancel_confirm 策略退避轮询直到挂单为空;
+        轮询次数用完仍有挂单时再提交一次批量撤单并查询
         symbol_fmz: FMZ格式的币种名 (如 BTC_USDT)
         symbol_api: 币安API格式的币种名 (如 BTCUSDT)
+        返回: 挂单已全部撤销时为True
         """
-        fmz_count = 0
-        algo_count = 0
-        # 1. 撤销FMZ平台的普通订单(市价单/限价单)
-        try:
-            self.ex.SetCurrency(symbol_fmz)
-            orders = _C(self.ex.GetOrders, f"{symbol_fmz}.swap")
-            if orders and len(orders) > 0:
-                for order in orders:
-                    result = self.ex.CancelOrder(order['Id'])
-                    if result:
-                        fmz_count += 1
-                    Sleep(200)
-        except Exception as e:
-            pass
-        Sleep(300)
-        # 2. 撤销Algo条件单(止损单/跟踪单)
+        self._bulk_cancel(symbol_api)
+        orders = algo_orders = None
+        for attempt in self.retry.attempts("cancel_confirm"):
+            orders, algo_orders = self._open_orders(symbol_fmz, symbol_api)
+            if orders is not None and algo_orders is not None and not orders and not algo_orders:
+                Log(f"✅ 撤单完成" + (f" (轮询{attempt + 1}次)" if attempt else ""))
+                return True
+        if orders or algo_orders:
+            # 撤单后仍有挂单 (撤单请求失败或期间有新挂单): 重新撤单一次
+            self._bulk_cancel(symbol_api)
+            orders, algo_orders = self._open_orders(symbol_fmz, symbol_api)
+            if orders is not None and algo_orders is not None and not orders and not algo_orders:
+                Log(f"✅ 撤单完成 (重新撤单后)")
+                return True
+        remaining = (f"FMZ:{len(orders) if orders is not None else '?'} "
+                     f"Algo:{len(algo_orders) if algo_orders is not None else '?'}")
+        Log(f"⚠️ 撤单未确认完成, 剩余挂单 {remaining}", "#FF9900")
+        return False
+
+    def wait_flat(self):
+        """
+        强制平仓后按 close_confirm 策略退避轮询当前交易对的仓位, 直到仓位清空
+        返回: 已确认清空时为True
+        """
+        for _ in self.retry.attempts("close_confirm"):
+            self._acquire("GET", "/fapi/v2/positionRisk", RequestScheduler.PROTECT)
+            try:
+                positions = self.ex.GetPosition()
+            except Exception:
+                continue
+            if positions is not None and not any(p['Amount'] > 0 for p in positions):
+                return True
+        Log("⚠️ 平仓未确认完成, 仓位仍未清空", "#FF9900")
+        return False
+
+
+class DepthPricer:
+    """
+    按盘口深度给程序内触发的限价单定价, 使订单一次成交而不是挂在盘口等待
+    沿对手盘累计数量, 取吃满下单数量所需的最差一档价格, 并以参考价的滑点上限封顶;
+    深度不足或获取失败时直接按上限定价 (仍为限价单, 成交价不会超过上限)
+    """
+    def __init__(self, exchange_obj, precision_mgr):
+        self.ex = exchange_obj
+        self.precision_mgr = precision_mgr
+
+    def _to_tick(self, price, up):
+        """按最小价格变动单位取整: 卖单向上、买单向下, 保证不超出滑点上限"""
+        tick = self.precision_mgr.tick_size
+        steps = price / tick
+        steps = math.ceil(steps - 1e-9) if up else math.floor(steps + 1e-9)
+        return self.precision_mgr.format_price(steps * tick)
+
+    def price(self, side, qty, ref_price, max_slippage):
+        """
+        side: BUY/SELL; qty: 下单数量; ref_price: 触发时的市场价
+        max_slippage: 相对参考价的最大滑点 (比例, 如0.002=0.2%)
+        返回: 限价单价格
+        """
+        is_buy = side == "BUY"
+        cap = ref_price * (1 + max_slippage) if is_buy else ref_price * (1 - max_slippage)
+        price = None
         try:
-            params = f"symbol={symbol_api}"
-            for i in range(3):
-                try:
-                    ret = self.ex.IO("api", "DELETE", "/fapi/v1/algoOpenOrders", params)
-                    if ret:
-                        algo_count = 1
-                        break
-                except Exception as e:
-                    error_msg = str(e)
-                    if "No open algo order" in error_msg or "-1200" in error_msg:
-                        break
-                    else:
-                        Sleep(500)
+            depth = self.ex.GetDepth()
+            filled = 0
+            for level in (depth['Asks'] if is_buy else depth['Bids']):
+                filled += level['Amount']
+                price = level['Price']
+                if filled >= qty:
+                    break
+            if filled < qty:
+                price = None
         except Exception as e:
-            pass
-        total = fmz_count + algo_count
-        if total > 0:
-            Log(f"✅ 撤单完成 (FMZ:{fmz_count} Algo:{algo_count})")
-        return True
+            Log(f"⚠️ 获取盘口深度失败, 按滑点上限定价: {e}", "#FF9900")
+        if price is None:
+            price = cap
+        price = min(price, cap) if is_buy else max(price, cap)
+        return self._to_tick(price, up=not is_buy)
+
+class OrderChaser:
+    """
+    程序内触发限价单的成交跟踪 (入场/加仓/跟踪止盈平仓)
+    poll() 按客户端订单ID查询跟踪中的订单:
+    - 已成交: 记录从首次下单到成交的耗时, 停止跟踪
+    - 超过 timeout 未成交: 撤单, 剩余数量按盘口重新定价再挂 (订单腿追加序号),
+      追单 max_chases 次后改为市价单
+    - 被撤销/过期/不存在: 剩余数量按同样规则重新下单
+    """
+    FINAL_STATUS = ("CANCELED", "EXPIRED", "REJECTED", "EXPIRED_IN_MATCH")
+    MAX_RECORDS = 200
+
+    def __init__(self, order_mgr, depth_pricer, new_client_id):
+        """new_client_id(leg): 返回订单腿的新客户端订单ID (同一订单腿再次下单时追加序号)"""
+        self.order_mgr = order_mgr
+        self.depth_pricer = depth_pricer
+        self.new_client_id = new_client_id
+        self.orders = {}   # 订单腿 -> 跟踪信息
+        self.records = []  # 已完成的订单腿: 成交耗时与追单次数
+
+    @staticmethod
+    def _now():
+        return UnixNano() / 1000000
+
+    def track(self, leg, client_id, side, qty, reduce_only=False):
+        """开始跟踪刚提交的限价单"""
+        now = self._now()
+        self.orders[leg] = {'client_id': client_id, 'side': side, 'qty': qty, 'filled': 0.0,
+                            'reduce_only': reduce_only, 'first_placed': now, 'placed': now,
+                            'chases': 0, 'market': False}
 
-    def _api_request(self, endpoint, params, method="POST"):
+    def clear(self):
+        """停止跟踪 (策略重置, 挂单已统一撤销)"""
+        self.orders = {}
+
+    def cancel(self, legs=None):
         """
-        通用API请求(用于止损单和跟踪单)
+        主动撤销订单腿 (默认全部跟踪中的订单) 并停止跟踪, 之后不再重挂
+        在批量撤单前调用, 避免 poll() 把被撤销的订单当作需要追单的剩余数量
         """
-        for i in range(3):
-            try:
-                ret = self.ex.IO("api", method, endpoint, params)
-                if ret:
-                    return ret
-            except Exception as e:
-                if i == 2:  # 最后一次才报错
-                    Log(f"❌ API请求失败: {e}", "#FF0000")
-                Sleep(500)
-        return None
+        for leg in list(self.orders) if legs is None else legs:
+            order = self.orders.get(leg)
+            if not order:
+                continue
+            canceled = self.order_mgr.cancel_by_client_id(order['client_id'], order['reduce_only'])
+            if canceled and canceled.get('status') == "FILLED":
+                self._finish(leg, order)
+                continue
+            del self.orders[leg]
+            Log(f"🚫 {leg} 已撤销, 停止追单")
+
+    def _finish(self, leg, order):
+        del self.orders[leg]
+        self.records.append({'leg': leg, 'ms': self._now() - order['first_placed'],
+                             'chases': order['chases'], 'market': order['market']})
+        if len(self.records) > self.MAX_RECORDS:
+            del self.records[0]
+        Log(f"✅ {leg} 已成交: 耗时{self.records[-1]['ms']:.0f}ms 追单{order['chases']}次"
+            + (" (市价)" if order['market'] else ""))
+
+    def poll(self, market_price, timeout, max_chases, max_slippage):
+        """
+        检查全部跟踪中的订单
+        market_price: 重新定价的参考价; timeout: 未成交的撤单重挂时间(毫秒)
+        max_chases: 限价重挂次数上限, 之后市价成交剩余数量; max_slippage: 重新定价的滑点上限
+        """
+        for leg, order in list(self.orders.items()):
+            ret = self.order_mgr.query_order(order['client_id'])
+            if ret is None:
+                continue  # 查询失败, 下轮再查
+            if ret:
+                executed = float(ret.get('executedQty', 0) or 0)
+                status = ret.get('status', "")
+                if status == "FILLED":
+                    self._finish(leg, order)
+                    continue
+                if status not in self.FINAL_STATUS:
+                    if self._now() - order['placed'] < timeout:
+                        continue
+                    # 超时未成交: 撤单后以撤单结果中的最终成交量为准
+                    canceled = self.order_mgr.cancel_by_client_id(order['client_id'], order['reduce_only'])
+                    if not canceled:
+                        continue  # 撤单失败 (可能刚好成交), 下轮查询确认
+                    executed = float(canceled.get('executedQty', executed) or 0)
+                    if canceled.get('status') == "FILLED":
+                        self._finish(leg, order)
+                        continue
+                order['filled'] += executed
+            remaining = self.order_mgr.precision.format_amount(order['qty'] - order['filled'])
+            if remaining < self.order_mgr.precision.min_amount:
+                self._finish(leg, order)
+                continue
+            self._replace(leg, order, remaining, market_price, max_chases, max_slippage)
+
+    def _replace(self, leg, order, remaining, market_price, max_chases, max_slippage):
+        """剩余数量重新下单: 未达追单上限时按盘口重新定价, 否则市价"""
+        client_id = self.new_client_id(leg)
+        if order['chases'] < max_chases:
+            price = self.depth_pricer.price(order['side'], remaining, market_price, max_slippage)
+            Log(f"🏃 {leg} 未成交, 第{order['chases'] + 1}次追单: {remaining} @ {price}", "#FFA500")
+            ret = self.order_mgr.place_limit(order['side'], remaining, price, order['reduce_only'], client_id)
+        else:
+            Log(f"🏃 {leg} 追单{order['chases']}次仍未成交, 改为市价: {remaining}", "#FF9900")
+            priority = RequestScheduler.PROTECT if order['reduce_only'] else RequestScheduler.NORMAL
+            ret = self.order_mgr.place_market(order['side'], remaining, priority, client_id)
+            order['market'] = True
+        order['chases'] += 1
+        order['client_id'] = client_id
+        order['placed'] = self._now()
+        if not ret:
+            Log(f"❌ {leg} 追单提交失败, 下轮重试", "#FF0000")
+
+    def report(self):
+        """按订单腿汇总成交耗时和追单次数"""
+        lines = []
+        for leg in sorted({r['leg'] for r in self.records}):
+            rows = [r for r in self.records if r['leg'] == leg]
+            times = sorted(r['ms'] for r in rows)
+            lines.append(f"{leg}: {len(rows)}笔 成交耗时 中位{times[len(times) // 2]:.0f}ms 最大{times[-1]:.0f}ms "
+                         f"追单{sum(r['chases'] for r in rows)}次 市价{sum(1 for r in rows if r['market'])}次")
+        return lines
+
+class OrderSet:
+    """
+    一笔交易挂单的期望集合与交易所挂单的差异同步
+    - live 按订单腿名称(sl / trail / tp1 ...)记录已挂订单的客户端订单ID和下单参数
+    - done 记录挂过但已不在交易所挂单中(已成交, 或在交易所侧撤销)的腿及其下单参数
+    - sync() 先按交易所当前挂单把已离开挂单的腿移入 done, 再与期望集合比较, 只提交差异:
+      从未挂过或参数(价格/数量)变化的腿先挂新单, 之后才撤销被替换的旧单和多余的挂单,
+      参数相同的腿保持不动 (已成交的腿不重挂), 替换过程中仓位始终有止损保护
+    - 交易所上本交易(客户端订单ID前缀)但不在模型中的挂单 (如重启前留下的) 视为多余挂单撤销
+    """
+    def __init__(self, order_mgr, new_client_id):
+        self.order_mgr = order_mgr
+        self.new_client_id = new_client_id  # 订单腿名称 -> 客户端订单ID
+        self.live = {}
+        self.done = {}
+
+    @staticmethod
+    def _params(leg):
+        """参与比较的下单参数 (不含日志名称和客户端订单ID)"""
+        return {k: v for k, v in leg.items() if k not in ('label', 'client_id')}
+
+    def clear(self):
+        """挂单已全部撤销 (cancel_all_orders 之后) 或交易结束"""
+        self.live = {}
+        self.done = {}
+
+    def _changed(self, name, leg):
+        """是否需要挂单: 从未挂过, 或与已挂(含已成交)的同名腿参数不同"""
+        params = self._params(leg)
+        if name in self.live:
+            return self.live[name]['params'] != params
+        return self.done.get(name) != params
+
+    def legs(self):
+        """当前模型中的挂单 (place_batch 格式)"""
+        return [dict(o['params']) for o in self.live.values()]
+
+    def place(self, symbol_api, legs):
+        """分配客户端订单ID后批量挂单, 成功的腿记入模型; 返回 place_batch 的结果"""
+        for leg in legs:
+            leg['client_id'] = self.new_client_id(leg['name'])
+        results = self.order_mgr.place_batch(symbol_api, legs)
+        for leg in legs:
+            if results.get(leg['name']):
+                self.live[leg['name']] = {'client_id': leg['client_id'], 'params': self._params(leg),
+                                          'algo': leg['type'] != "LIMIT"}
+                self.done.pop(leg['name'], None)
+        return results
+
+    def sync(self, symbol_fmz, symbol_api, prefix, legs):
+        """
+        将挂单同步到期望集合
+        prefix: 本交易客户端订单ID前缀; legs: 期望的全部挂单 (place_batch 格式, 不含client_id)
+        返回: (新挂单数, 撤单数)
+        """
+        open_ids = self.order_mgr.open_client_ids(symbol_fmz, symbol_api)
+        if open_ids is not None:
+            for name in [name for name, o in self.live.items() if o['client_id'] not in open_ids]:
+                self.done[name] = self.live.pop(name)['params']
+        desired = {leg['name']: leg for leg in legs}
+        to_place = [leg for name, leg in desired.items() if self._changed(name, leg)]
+        replaced = {name: self.live[name] for name in desired if name in self.live}
+        removed = {name: o for name, o in self.live.items() if name not in desired}
+        # 1. 先挂新单
+        results = self.place(symbol_api, to_place) if to_place else {}
+        # 2. 新单成功后撤销被替换的旧单 (新单失败时保留旧单), 再撤多余挂单
+        cancels = [o for name, o in replaced.items() if results.get(name)]
+        cancels += removed.values()
+        for name in removed:
+            del self.live[name]
+        known = {o['client_id'] for o in self.live.values()} | {o['client_id'] for o in cancels}
+        if open_ids:
+            cancels += [{'client_id': cid, 'algo': algo} for cid, algo in open_ids.items()
+                        if cid.startswith(prefix) and cid not in known]
+        for o in cancels:
+            if o['algo']:
+                self.order_mgr.cancel_algo_by_client_id(symbol_api, o['client_id'])
+            else:
+                self.order_mgr.cancel_by_client_id(o['client_id'], reduce_only=True, symbol_api=symbol_api)
+        return len(to_place), len(cancels)
+
 
 # ============================================================
 # 4. ATR计算工具
 # ============================================================
+class ATRService:
+    """
+    日线ATR增量缓存
+    每个 (币种, 周期) 只保存已收盘日线的递推状态 (最后K线时间/收盘价/ATR/计数)，
+    与 TA.ATR 使用相同递推: 前period根为TR累计均值, 之后按Wilder平滑
+    - 同一UTC日内重复查询直接返回缓存，不请求K线
+    - UTC日切换后只追加新收盘的日线，每根O(1)
+    - 状态写入 CACHE_FILE，重启后同样只补齐缺失的日线
+    """
+    CACHE_FILE = "atr_cache.json"
+    DAY_MS = 86400000
+
+    def __init__(self, exchange_obj):
+        self.ex = exchange_obj
+        self.states = self.load_cache()
+
+    def load_cache(self):
+        """加载缓存"""
+        try:
+            with open(self.CACHE_FILE, 'r') as f:
+                return json.load(f)
+        except:
+            return {}
+
+    def save_cache(self):
+        """保存缓存"""
+        try:
+            with open(self.CACHE_FILE, 'w') as f:
+                json.dump(self.states, f, indent=2)
+        except:
+            pass
+
+    @staticmethod
+    def _true_range(records):
+        """TR序列: 首根为 High-Low, 之后取三者最大值 (有numpy时向量化计算)"""
+        if np is not None:
+            high = np.array([r['High'] for r in records], dtype=float)
+            low = np.array([r['Low'] for r in records], dtype=float)
+            close = np.array([r['Close'] for r in records], dtype=float)
+            tr = high - low
+            prev_close = close[:-1]
+            tr[1:] = np.maximum(tr[1:], np.maximum(np.abs(high[1:] - prev_close), np.abs(prev_close - low[1:])))
+            return tr.tolist()
+        tr = []
+        prev_close = None
+        for r in records:
+            if prev_close is None:
+                tr.append(r['High'] - r['Low'])
+            else:
+                tr.append(max(r['High'] - r['Low'], abs(r['High'] - prev_close), abs(prev_close - r['Low'])))
+            prev_close = r['Close']
+        return tr
+
+    @staticmethod
+    def _step(state, tr, period):
+        """递推一根K线 (返回新ATR, 不修改state)"""
+        count = state['count']
+        if count < period:
+            return (state['sum'] + tr) / (count + 1)
+        return ((period - 1) * state['atr'] + tr) / period
+
+    def _append(self, state, bar, period):
+        """追加一根已收盘日线"""
+        tr = max(bar['High'] - bar['Low'], abs(bar['High'] - state['close']), abs(state['close'] - bar['Low']))
+        state['atr'] = self._step(state, tr, period)
+        state['sum'] += tr
+        state['count'] += 1
+        state['time'] = bar['Time']
+        state['close'] = bar['Close']
+
+    def _build(self, closed, period):
+        """从完整的已收盘日线重建状态"""
+        state = {'time': 0, 'close': 0.0, 'atr': 0.0, 'sum': 0.0, 'count': 0}
+        for tr in self._true_range(closed):
+            state['atr'] = self._step(state, tr, period)
+            state['sum'] += tr
+            state['count'] += 1
+        state['time'] = closed[-1]['Time']
+        state['close'] = closed[-1]['Close']
+        return state
+
+    def _fetch_records(self, symbol):
+        # 必须先设置合约类型，再设置币种
+        self.ex.SetContractType("swap")
+        self.ex.SetCurrency(symbol)
+        # 使用 _C() 包装 GetRecords，提供自动重试机制
+        return _C(self.ex.GetRecords, PERIOD_D1)
+
+    def _update(self, key, records, period, today_start):
+        """用新拉取的日线更新状态, 数据不足时返回None"""
+        closed = [r for r in records if r['Time'] < today_start]
+        if len(closed) < period + 1:
+            Log(f"⚠️ K线数据不足: 需要{period+1}根已收盘日线，实际{len(closed)}根")
+            return None
+        state = self.states.get(key)
+        times = [r['Time'] for r in closed]
+        if state and state['time'] in times:
+            # 只追加缓存之后新收盘的日线
+            for bar in closed[times.index(state['time']) + 1:]:
+                self._append(state, bar, period)
+        else:
+            state = self._build(closed, period)
+        self.states[key] = state
+        self.save_cache()
+        return state
+
+    def get_atr(self, symbol, period=20, exclude_today=True):
+        """
+        获取ATR值
+        exclude_today: True时使用昨日收盘的ATR (同一UTC日内命中缓存)；
+                       False时包含今日未完成K线, 需要拉取一次日线
+        """
+        try:
+            key = f"{symbol}:{period}"
+            today_start = int(UnixNano() / 1000000 // self.DAY_MS) * self.DAY_MS
+            state = self.states.get(key)
+            if exclude_today and state and state['time'] >= today_start - self.DAY_MS:
+                return state['atr']
+            records = self._fetch_records(symbol)
+            if not records:
+                Log(f"⚠️ K线数据不足: 需要{period+1}根已收盘日线，实际0根")
+                return None
+            state = self._update(key, records, period, today_start)
+            if not state:
+                return None
+            if exclude_today:
+                return state['atr']
+            today = records[-1]
+            if today['Time'] < today_start:
+                return state['atr']
+            tr = max(today['High'] - today['Low'], abs(today['High'] - state['close']), abs(state['close'] - today['Low']))
+            return self._step(state, tr, period)
+        except Exception as e:
+            Log(f"❌ ATR计算失败: {e}")
+            return None
+
+    def prefetch(self, symbols, period=20):
+        """启动时预热常用币种, 之后开仓确认无需等待K线请求; 结束后恢复原合约类型和交易对"""
+        contract_type = self.ex.GetContractType()
+        current = self.ex.GetCurrency()
+        for symbol in symbols:
+            self.get_atr(symbol, period)
+        # 恢复原合约类型和交易对 (同样先设置合约类型, 再设置币种)
+        if contract_type:
+            self.ex.SetContractType(contract_type)
+        self.ex.SetCurrency(current)
+
+
 class ATRCalculator:
     """ATR计算工具类"""
+    service = None
+
+    @staticmethod
+    def get_service(exchange):
+        """同一交易所对象共享一个 ATRService"""
+        if ATRCalculator.service is None or ATRCalculator.service.ex is not exchange:
+            ATRCalculator.service = ATRService(exchange)
+        return ATRCalculator.service
 
     @staticmethod
     def get_atr(exchange, symbol, period=20, exclude_today=True):
@@ -322,24 +1413,12 @@ class ATRCalculator:
         period: ATR周期
         exclude_today: True时排除今日K线,使用前20日数据
         """
-        try:
-            # 必须先设置合约类型，再设置币种
-            exchange.SetContractType("swap")
-            exchange.SetCurrency(symbol)
-            # 使用 _C() 包装 GetRecords，提供自动重试机制
-            records = _C(exchange.GetRecords, PERIOD_D1)
-            if not records or len(records) < period + 2:
-                Log(f"⚠️ K线数据不足: 需要{period+2}根，实际{len(records) if records else 0}根")
-                return None
-            atr_array = TA.ATR(records, period)
-            if exclude_today:
-                # 使用倒数第2根K线(昨日)的ATR, 排除今日未完成K线
-                return atr_array[-2]
-            else:
-                return atr_array[-1]
-        except Exception as e:
-            Log(f"❌ ATR计算失败: {e}")
-            return None
+        return ATRCalculator.get_service(exchange).get_atr(symbol, period, exclude_today)
+
+    @staticmethod
+    def prefetch(exchange, symbols, period=20):
+        """预热ATR缓存"""
+        ATRCalculator.get_service(exchange).prefetch(symbols, period)
 
     @staticmethod
     def get_atr_by_percentage(current_price, percentage):
@@ -350,10 +1429,912 @@ class ATRCalculator:
         """
         return current_price * (percentage / 100)
 
+# ============================================================
+# 5. 用户数据流与行情流 (事件驱动)
+# ============================================================
+class UserDataStream:
+    """
+    币安期货用户数据流 - 订阅 ORDER_TRADE_UPDATE / ACCOUNT_UPDATE 事件
+    用法: connect() 成功后, 主循环用 poll(timeout_ms) 代替 Sleep 等待事件
+    """
+    WS_BASE = "wss://fstream.binance.com/ws/"
+    LISTEN_KEY_ENDPOINT = "/fapi/v1/listenKey"
+    KEEPALIVE_INTERVAL = 30 * 60 * 1000       # listenKey 60分钟过期, 每30分钟续期
+    RECONNECT_INTERVAL = 23 * 60 * 60 * 1000  # 币安24小时强制断开, 提前重连
+
+    def __init__(self, exchange_obj, record_file=""):
+        """
+        record_file: 非空时把收到的原始事件逐行写入该文件, 供 ReplayEventSource 回放
+        """
+        self.ex = exchange_obj
+        self.record_file = record_file
+        self.listen_key = ""
+        self.conn = None
+        self.connected_at = 0
+        self.last_keepalive = 0
+        self.need_reconnect = False
+
+    @staticmethod
+    def _now():
+        """续期/重连计时使用平台时钟 (回放和回测中为模拟时钟)"""
+        return UnixNano() / 1000000
+
+    def connect(self):
+        """申请listenKey并建立websocket连接"""
+        self.close()
+        try:
+            ret = self.ex.IO("api", "POST", self.LISTEN_KEY_ENDPOINT, "")
+            if not ret or 'listenKey' not in ret:
+                Log("❌ listenKey获取失败", "#FF0000")
+                return False
+            self.listen_key = ret['listenKey']
+            self.conn = Dial(f"{self.WS_BASE}{self.listen_key}|reconnect=true")
+            if not self.conn:
+                Log("❌ 用户数据流连接失败", "#FF0000")
+                return False
+            now = self._now()
+            self.connected_at = now
+            self.last_keepalive = now
+            self.need_reconnect = False
+            Log("✅ 用户数据流已连接")
+            return True
+        except Exception as e:
+            Log(f"❌ 用户数据流连接异常: {e}", "#FF0000")
+            self.conn = None
+            return False
+
+    def close(self):
+        """关闭连接"""
+        if self.conn:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+
+    def _maintain(self):
+        """listenKey续期, 到期或收到过期事件时重连"""
+        now = self._now()
+        if self.need_reconnect or (self.conn and now - self.connected_at >= self.RECONNECT_INTERVAL):
+            Log("🔄 用户数据流重连...", "#FFA500")
+            self.connect()
+            return
+        if self.conn and now - self.last_keepalive >= self.KEEPALIVE_INTERVAL:
+            try:
+                self.ex.IO("api", "PUT", self.LISTEN_KEY_ENDPOINT, "")
+                self.last_keepalive = now
+            except Exception as e:
+                Log(f"⚠️ listenKey续期失败: {e}", "#FF9900")
+                self.need_reconnect = True
+
+    def _parse(self, msg):
+        """解析单条消息, 无法识别时返回None"""
+        try:
+            event = json.loads(msg)
+        except Exception:
+            return None
+        if not isinstance(event, dict) or 'e' not in event:
+            return None
+        if event['e'] == "listenKeyExpired":
+            Log("⚠️ listenKey已过期", "#FF9900")
+            self.need_reconnect = True
+            return None
+        if self.record_file:
+            try:
+                with open(self.record_file, 'a') as f:
+                    f.write(msg.strip() + "\n")
+            except Exception:
+                pass
+        return event
+
+    def poll(self, timeout_ms):
+        """
+        等待事件, 最多阻塞 timeout_ms 毫秒
+        收到第一条消息后立即返回, 同时取出已到达的其余消息
+        返回: 事件列表 (dict)
+        """
+        self._maintain()
+        if not self.conn:
+            Sleep(timeout_ms)
+            return []
+        events = []
+        try:
+            msg = self.conn.read(timeout_ms)
+            while msg:
+                event = self._parse(msg)
+                if event:
+                    events.append(event)
+                msg = self.conn.read(-1)  # -1: 不阻塞, 取出剩余消息
+        except Exception as e:
+            Log(f"⚠️ 用户数据流读取失败: {e}", "#FF9900")
+            self.need_reconnect = True
+        return events
+
+
+class ReplayEventSource:
+    """
+    回放录制的用户数据流事件 - 与 UserDataStream 接口一致, 用于本地测试
+    events: 事件列表, 或每行一个JSON事件的文件路径 (UserDataStream的record_file)
+    每次poll返回下一条事件; 列表元素本身是列表时作为一批同时返回
+    """
+    def __init__(self, events):
+        if isinstance(events, str):
+            with open(events, 'r') as f:
+                events = [json.loads(line) for line in f if line.strip()]
+        self.events = list(events)
+        self.pos = 0
+
+    def connect(self):
+        return True
+
+    def close(self):
+        pass
+
+    def poll(self, timeout_ms):
+        """取出下一批事件; 回放结束后按timeout等待并返回空列表"""
+        if self.pos >= len(self.events):
+            Sleep(timeout_ms)
+            return []
+        item = self.events[self.pos]
+        self.pos += 1
+        return list(item) if isinstance(item, list) else [item]
+
+
+class PriceStream:
+    """
+    币安期货行情流 - 程序内触发单 (强制止损/入场跟踪/跟踪止盈) 的高频价格源
+    stream: aggTrade (逐笔成交价) 或 bookTicker (最优买卖价的中间价)
+    用法与 UserDataStream 一致: watch(symbol_api) 订阅交易对, 主循环用 poll(timeout_ms) 代替 Sleep,
+    每条价格到达即返回, 触发检查不必等待下一轮仓位检查
+    公共行情流无需listenKey, 在主线程读取, 不与主循环并发调用 exchange
+    """
+    WS_BASE = "wss://fstream.binance.com/ws/"
+
+    def __init__(self, stream="aggTrade"):
+        self.stream = stream
+        self.symbol = ""
+        self.conn = None
+        self.need_reconnect = False
+
+    def watch(self, symbol_api):
+        """
+        订阅指定交易对 (如 BTCUSDT), 交易对变化时重连, 传空字符串时断开
+        返回: 是否已连接
+        """
+        if symbol_api != self.symbol:
+            self.symbol = symbol_api
+            if symbol_api:
+                self.connect()
+            else:
+                self.close()
+        elif self.need_reconnect and symbol_api:
+            self.connect()
+        return self.conn is not None
+
+    def connect(self):
+        """建立websocket连接"""
+        self.close()
+        self.need_reconnect = False
+        try:
+            self.conn = Dial(f"{self.WS_BASE}{self.symbol.lower()}@{self.stream}|reconnect=true")
+        except Exception as e:
+            Log(f"❌ 行情流连接异常: {e}", "#FF0000")
+            self.conn = None
+        if not self.conn:
+            Log("⚠️ 行情流不可用，程序内触发回退到轮询", "#FF9900")
+            return False
+        Log(f"✅ 行情流已连接: {self.symbol}@{self.stream}")
+        return True
+
+    def close(self):
+        """关闭连接"""
+        if self.conn:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+
+    def _parse(self, msg):
+        """解析单条消息为 (成交时间毫秒, 价格), 无法识别时返回None"""
+        try:
+            data = json.loads(msg)
+            if 'p' in data:  # aggTrade
+                return data['T'], float(data['p'])
+            if 'b' in data and 'a' in data:  # bookTicker
+                return data.get('T', 0), (float(data['b']) + float(data['a'])) / 2
+        except Exception:
+            pass
+        return None
+
+    def poll(self, timeout_ms):
+        """
+        等待价格更新, 最多阻塞 timeout_ms 毫秒
+        收到第一条消息后立即返回, 同时取出已到达的其余消息
+        返回: [(成交时间毫秒, 价格), ...], 按到达顺序
+        """
+        if not self.conn:
+            Sleep(timeout_ms)
+            return []
+        ticks = []
+        try:
+            msg = self.conn.read(timeout_ms)
+            while msg:
+                tick = self._parse(msg)
+                if tick:
+                    ticks.append(tick)
+                msg = self.conn.read(-1)  # -1: 不阻塞, 取出剩余消息
+        except Exception as e:
+            Log(f"⚠️ 行情流读取失败: {e}", "#FF9900")
+            self.close()
+            self.need_reconnect = True
+        return ticks
+
+class LoopScheduler:
+    """
+    主循环任务调度: 命令处理、仓位检查、界面刷新各按自己的间隔执行
+    - every(name, interval, fn): interval 为毫秒数, 或返回毫秒数的函数 (如自适应检查间隔), 每次执行后重新计算
+    - run_once(): 按注册顺序执行到期任务, 再等待到最近的到期时间; 命令处理注册在最前,
+      间隔100ms时操作员点击最迟100ms内被读取, 不必等仓位检查间隔
+    - 等待由 wait(ms) 完成 (Sleep 或事件/行情流的 poll), 事件到达时可立即处理
+    - trigger(name): 任务在下一次调度时立即执行 (如收到成交推送后立即对账)
+    单个任务出错只记录日志, 不影响其他任务
+    """
+    def __init__(self, wait):
+        self.wait = wait
+        self.tasks = []
+
+    @staticmethod
+    def _now():
+        return UnixNano() / 1000000
+
+    def every(self, name, interval, fn):
+        self.tasks.append({'name': name, 'interval': interval, 'fn': fn, 'due': 0})
+
+    def trigger(self, name):
+        for task in self.tasks:
+            if task['name'] == name:
+                task['due'] = 0
+
+    def run_once(self):
+        for task in self.tasks:
+            if self._now() < task['due']:
+                continue
+            try:
+                task['fn']()
+            except Exception as e:
+                Log(f"❌ 任务 {task['name']} 错误: {e}", "#FF0000")
+            try:
+                interval = task['interval']() if callable(task['interval']) else task['interval']
+            except Exception as e:
+                Log(f"❌ 任务 {task['name']} 间隔计算错误: {e}", "#FF0000")
+                interval = 1000
+            task['due'] = self._now() + interval
+        wait = min(task['due'] for task in self.tasks) - self._now()
+        if wait > 0:
+            self.wait(int(wait))
+
+    def run(self):
+        while True:
+            self.run_once()
+
+
+class StatusRenderer:
+    """
+    状态栏渲染: 按钮布局只序列化一次, 状态内容变化或超过心跳间隔时才调用 LogStatus
+    render(model, build):
+      model 为状态栏展示字段组成的可比较对象 (如tuple), 与上次相同时不重建状态文本;
+      内容未变化且未到心跳间隔时不推送, 心跳只用于刷新"最后更新"时间
+    """
+    def __init__(self, buttons, heartbeat=10000, log_status=None):
+        self.layout = "\n".join(f'`{json.dumps(button, ensure_ascii=False)}`' for button in buttons)
+        self.heartbeat = heartbeat
+        self.log_status = log_status or LogStatus
+        self.model = None
+        self.text = ""
+        self.pushed = None  # 上次推送时间(毫秒)
+        self.stats = {'pushed': 0, 'skipped': 0}
+
+    def render(self, model, build):
+        """返回是否调用了 LogStatus"""
+        now = UnixNano() / 1000000
+        if model != self.model or self.pushed is None:
+            self.model = model
+            self.text = build()
+        elif now - self.pushed < self.heartbeat:
+            self.stats['skipped'] += 1
+            return False
+        self.log_status(f"{self.layout}\n\n最后更新: {_D()}\n\n{self.text}")
+        self.pushed = now
+        self.stats['pushed'] += 1
+        return True
+
+    def invalidate(self):
+        """下一次 render 强制重建并推送 (如点击查看状态)"""
+        self.model = None
+
+    def report(self):
+        return f"状态栏: 推送{self.stats['pushed']}次 跳过{self.stats['skipped']}次 (心跳{self.heartbeat}ms)"
+
+
+# ============================================================
+# 6. 行情快照
+# ============================================================
+class MarketSnapshot:
+    """
+    单轮循环的行情和持仓快照
+    refresh() 通过 exchange.Go 并发获取 Ticker 和 Position, 本轮内所有处理函数读取同一份数据
+    """
+    def __init__(self, exchange_obj):
+        self.ex = exchange_obj
+        self.ticker = None
+        self.positions = None
+        self.time = 0  # 本地收到行情的时间(毫秒)
+
+    def refresh(self):
+        """并发拉取当前交易对的行情和持仓, 任一失败时退回带重试的同步请求"""
+        ticker_go = self.ex.Go("GetTicker")
+        position_go = self.ex.Go("GetPosition")
+        try:
+            self.ticker, _ = ticker_go.wait()
+        except Exception:
+            self.ticker = None
+        try:
+            self.positions, _ = position_go.wait()
+        except Exception:
+            self.positions = None
+        if self.ticker is None:
+            self.ticker = _C(self.ex.GetTicker)
+        self.time = UnixNano() / 1000000
+        if self.positions is None:
+            try:
+                self.positions = _C(self.ex.GetPosition)
+            except Exception as e:
+                Log(f"⚠️ 获取持仓失败: {e}")
+        return self.positions is not None
+
+    def update_price(self, price, trade_time=0):
+        """
+        用价格流的成交价更新最新价 (持仓保持上次refresh的结果)
+        trade_time: 成交时间(毫秒), 作为行情时间
+        """
+        ticker = dict(self.ticker) if self.ticker else {}
+        ticker['Last'] = price
+        if trade_time:
+            ticker['Time'] = trade_time
+        self.ticker = ticker
+        self.time = UnixNano() / 1000000
+
+    def clear(self):
+        """丢弃快照 (策略重置或切换币种后, 等待下一次refresh)"""
+        self.ticker = None
+        self.positions = None
+        self.time = 0
+
+    @property
+    def last(self):
+        """最新成交价"""
+        return self.ticker['Last']
+
+    def position(self, direction):
+        """
+        指定方向的持仓
+        direction: 1 做多, -1 做空
+        返回: (数量, 均价), 无持仓为 (0, 0), 快照失败为 (None, None)
+        """
+        if self.positions is None:
+            return None, None
+        target_type = PD_LONG if direction == 1 else PD_SHORT
+        for p in self.positions:
+            if p['Type'] == target_type and p['Amount'] > 0:
+                return p['Amount'], p['Price']
+        return 0, 0
+
+
+class PriceRangeTracker:
+    """
+    两次检查之间出现过的最高/最低价 (程序内跟踪监控用, 避免轮询间隔内的极值丢失)
+    每次 update() 拉取上次以来的1分钟K线 (通常2根, 请求权重1), 与上次看到的同一根K线比较:
+    高点抬高/低点降低的部分即上次检查之后的新极值, 上次之后才开始的K线整根计入
+    """
+    KLINES_ENDPOINT = "/fapi/v1/klines"
+
+    def __init__(self, exchange_obj):
+        self.ex = exchange_obj
+        self.symbol = ""
+        self.seen = {}  # K线开盘时间 -> (最高价, 最低价)
+
+    def reset(self):
+        """丢弃游标, 下次 update() 重新起算"""
+        self.symbol = ""
+        self.seen = {}
+
+    def update(self, symbol_api):
+        """
+        返回上次调用以来的 (最低价, 最高价), 没有新极值的一侧为None
+        首次调用 (或交易对变化、请求失败) 只记录游标, 返回 (None, None)
+        """
+        prev = self.seen if self.symbol == symbol_api else {}
+        latest = max(prev) if prev else None
+        # 间隔超过1分钟时多取几根, 中间整根经过的K线同样计入 (limit<100 权重仍为1)
+        limit = 2 if latest is None else min(99, max(2, int((UnixNano() / 1000000 - latest) // 60000) + 1))
+        try:
+            rows = self.ex.IO("api", "GET", self.KLINES_ENDPOINT, f"symbol={symbol_api}&interval=1m&limit={limit}")
+        except Exception as e:
+            Log(f"⚠️ 获取1分钟K线失败: {e}", "#FF9900")
+            rows = None
+        if not rows:
+            return None, None
+        low = high = None
+        seen = {}
+        for row in rows:
+            t, bar_high, bar_low = int(row[0]), float(row[2]), float(row[3])
+            seen[t] = (bar_high, bar_low)
+            if latest is None:
+                continue
+            if t in prev:
+                last_high, last_low = prev[t]
+                if bar_high > last_high:
+                    high = bar_high if high is None else max(high, bar_high)
+                if bar_low < last_low:
+                    low = bar_low if low is None else min(low, bar_low)
+            elif t > latest:
+                high = bar_high if high is None else max(high, bar_high)
+                low = bar_low if low is None else min(low, bar_low)
+        self.symbol = symbol_api
+        self.seen = seen
+        return low, high
+
+class AdaptivePoller:
+    """
+    自适应检查间隔: 按最新价到最近待触发价位的距离(ATR倍数)决定下一次检查的等待时间
+    - 距离 <= near_atr 时为 floor, >= far_atr 时为 ceiling, 之间线性插值
+    - 没有待触发价位时为 idle
+    每次检查的请求数不变, floor/ceiling 即请求频率的上下界
+    """
+    def __init__(self, floor=500, ceiling=5000, near_atr=0.05, far_atr=1.0, idle=None):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.near_atr = near_atr
+        self.far_atr = far_atr
+        self.idle = idle if idle is not None else ceiling
+        self.last = self.idle           # 最近一次计算的间隔(毫秒)
+        self.last_distance = None       # 最近一次计算的距离(ATR倍数)
+
+    @staticmethod
+    def distance(price, levels, atr):
+        """最新价到最近价位的ATR倍数; 价格/ATR无效或没有价位时返回None"""
+        levels = [level for level in levels if level and level > 0]
+        if not levels or not price or not atr or atr <= 0:
+            return None
+        return min(abs(price - level) for level in levels) / atr
+
+    def interval(self, targets, default=None):
+        """
+        下一次检查的间隔(毫秒), 多个交易时取最近的价位
+        targets: [(最新价, 待触发价位列表, ATR), ...], 价位为0的忽略
+        default: 没有待触发价位时的间隔, 默认为 idle
+        """
+        distances = [self.distance(price, levels, atr) for price, levels, atr in targets]
+        distances = [d for d in distances if d is not None]
+        self.last_distance = min(distances) if distances else None
+        if self.last_distance is None:
+            self.last = self.idle if default is None else default
+            return self.last
+        ratio = (self.last_distance - self.near_atr) / (self.far_atr - self.near_atr)
+        ratio = max(0.0, min(1.0, ratio))
+        self.last = int(self.floor + (self.ceiling - self.floor) * ratio)
+        return self.last
+
+    def report(self):
+        dist = "-" if self.last_distance is None else f"{self.last_distance:.3f} ATR"
+        return f"检查间隔 {self.last}ms (范围 {self.floor}-{self.ceiling}ms), 距最近触发价 {dist}"
+
+
+# ============================================================
+# 7. 性能统计
+# ============================================================
+class LatencyHistogram:
+    """
+    固定大小的对数分桶耗时直方图 (单位约为微秒, 即纳秒>>10)
+    每个2倍区间分4桶, 分位数误差约19%; 调用次数由分桶求和得到, 记录时只做整数运算
+    所有计时包装 (Profiler.timed / timed_io / TimedHandle) 都经 record() 记录, 分桶规则只此一处
+    """
+    __slots__ = ('buckets', 'errors', 'total')
+    SIZE = 112  # 覆盖到约2^27微秒, 超出的计入最后一桶
+
+    def __init__(self):
+        self.buckets = [0] * self.SIZE
+        self.errors = 0
+        self.total = 0
+
+    def record(self, elapsed_ns):
+        """记录一次耗时 (纳秒)"""
+        us = elapsed_ns >> 10
+        if us < 4:
+            self.buckets[us] += 1
+        else:
+            bits = us.bit_length()
+            idx = (bits - 2) * 4 + ((us >> (bits - 3)) & 3)
+            self.buckets[idx if idx < self.SIZE else self.SIZE - 1] += 1
+        self.total += us
+
+    @property
+    def count(self):
+        return sum(self.buckets)
+
+    @staticmethod
+    def _upper(idx):
+        """第 idx 桶的上界"""
+        if idx < 4:
+            return idx + 1
+        return (5 + idx % 4) << (idx // 4 - 1)
+
+    def percentile(self, q):
+        """分位数 (取所在桶的上界), 单位微秒"""
+        count = self.count
+        target = q * count
+        seen = 0
+        for idx, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return self._upper(idx)
+        return 0
+
+
+class TimedHandle:
+    """exchange.Go 句柄的计时包装: 记录从发起到 wait() 返回的耗时"""
+    __slots__ = ('handle', 'hist', 'start')
+
+    def __init__(self, handle, hist, start):
+        self.handle = handle
+        self.hist = hist
+        self.start = start
+
+    def wait(self, *args):
+        try:
+            ret = self.handle.wait(*args)
+        except Exception:
+            self.hist.errors += 1
+            raise
+        finally:
+            self.hist.record(time.perf_counter_ns() - self.start)
+        if not ret or ret[0] is None:
+            self.hist.errors += 1
+        return ret
+
+
+class InstrumentedExchange:
+    """
+    exchange 代理: 方法首次访问时替换为计时版本并缓存在代理上, 之后的调用不再经过 __getattr__
+    IO("api") 按 "IO 方法 端点" 分别统计, Go 按 "Go 方法" 统计从发起到 wait() 返回的耗时
+    返回 None 的调用 (FMZ的失败返回) 计为错误
+    """
+    def __init__(self, exchange_obj, profiler):
+        self._ex = exchange_obj
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        attr = getattr(self._ex, name)
+        if not callable(attr):
+            return attr
+        if name == "IO":
+            wrapped = self._profiler.timed_io(attr)
+        elif name == "Go":
+            wrapped = self._profiler.timed_go(attr)
+        else:
+            wrapped = self._profiler.timed(name, attr, none_is_error=True)
+        setattr(self, name, wrapped)
+        return wrapped
+
+
+class Profiler:
+    """
+    调用耗时统计: 每个名称一个 LatencyHistogram (调用次数、错误数、p50/p95/p99)
+    - wrap(exchange) 返回计时代理, 交给策略管理器代替原始 exchange
+    - instrument(obj, names) 把对象上的方法替换为计时版本 (状态处理函数)
+    - timed(name, func) 包装任意函数 (LogStatus / Sleep / GetCommand 等)
+    - end_loop() 每轮主循环调用一次, 用于折算每轮调用次数
+    未启用时策略不创建 Profiler, 直接使用原始对象, 没有任何额外开销
+    """
+    def __init__(self):
+        self.hists = {}
+        self.loops = 0
+        self.started = time.time()
+
+    def hist(self, name):
+        if name not in self.hists:
+            self.hists[name] = LatencyHistogram()
+        return self.hists[name]
+
+    def timed(self, name, func, none_is_error=False):
+        hist = self.hist(name)
+        record = hist.record
+        clock = time.perf_counter_ns
+
+        def timed_call(*args, **kwargs):
+            start = clock()
+            try:
+                ret = func(*args, **kwargs)
+            except Exception:
+                hist.errors += 1
+                raise
+            finally:
+                record(clock() - start)
+            if none_is_error and ret is None:
+                hist.errors += 1
+            return ret
+        return timed_call
+
+    def timed_io(self, func):
+        """IO 按 (类型, 方法, 端点) 分别统计"""
+        hists = {}
+        clock = time.perf_counter_ns
+
+        def timed_io(kind, *args):
+            key = args[0] + args[1] if kind == "api" else kind
+            hist = hists.get(key)
+            if hist is None:
+                hist = hists[key] = self.hist(f"IO {args[0]} {args[1]}" if kind == "api" else f"IO {kind}")
+            start = clock()
+            try:
+                ret = func(kind, *args)
+            except Exception:
+                hist.errors += 1
+                raise
+            finally:
+                hist.record(clock() - start)
+            if ret is None:
+                hist.errors += 1
+            return ret
+        return timed_io
+
+    def timed_go(self, func):
+        hist = self.hist
+        clock = time.perf_counter_ns
+
+        def timed_go(method, *args):
+            name = f"Go IO {args[1]} {args[2]}" if method == "IO" and args and args[0] == "api" else f"Go {method}"
+            return TimedHandle(func(method, *args), hist(name), clock())
+        return timed_go
+
+    def wrap(self, exchange_obj):
+        return InstrumentedExchange(exchange_obj, self)
+
+    def instrument(self, obj, names, prefix=""):
+        """将 obj 的方法替换为计时版本 (实例属性, 不影响类和其他实例)"""
+        for name in names:
+            setattr(obj, name, self.timed(prefix + name, getattr(obj, name)))
+
+    def end_loop(self):
+        self.loops += 1
+
+    def summary(self):
+        """按总耗时降序的统计表, 耗时单位毫秒"""
+        rows = []
+        loops = max(self.loops, 1)
+        for name, h in self.hists.items():
+            count = h.count
+            if not count:
+                continue
+            rows.append({
+                'name': name, 'calls': count, 'per_loop': count / loops, 'errors': h.errors,
+                'total_ms': h.total / 1000, 'p50_ms': h.percentile(0.5) / 1000,
+                'p95_ms': h.percentile(0.95) / 1000, 'p99_ms': h.percentile(0.99) / 1000,
+            })
+        rows.sort(key=lambda r: -r['total_ms'])
+        return rows
+
+    def report(self):
+        """统计表的文本行, 供 ShowInfo 输出"""
+        lines = [f"循环{self.loops}轮 | 名称 | 次数 | 每轮 | 错误 | p50/p95/p99(ms) | 合计(ms)"]
+        for r in self.summary():
+            lines.append(f"{r['name']} | {r['calls']} | {r['per_loop']:.2f} | {r['errors']} | "
+                         f"{r['p50_ms']:.2f}/{r['p95_ms']:.2f}/{r['p99_ms']:.2f} | {r['total_ms']:.1f}")
+        return lines
+
+    def dump(self, path):
+        """写出统计 (含原始分桶, 便于离线合并分析)"""
+        data = {
+            'started': self.started, 'dumped': time.time(), 'loops': self.loops,
+            'summary': self.summary(),
+            'buckets': {name: h.buckets for name, h in self.hists.items() if h.count},
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+class TriggerTracker:
+    """
+    程序内触发单的延迟与滑点记录 (order_strategy_limit.py 的入场跟踪/加仓/跟踪止盈)
+    每次触发记录三个时间点及对应价格:
+      检测 detect(): 快照价格越过触发价 (含行情时间, 可得行情到检测的延迟)
+      提交 submit(): 调用下单接口, 价格为委托价
+      确认 ack():    下单接口返回时立即记录, 价格为当时已持有的最新价 (快照/价格流, 不额外请求行情),
+                     立即成交时另记成交均价
+    record_native() 记录交易所原生条件单 (order_strategy_main.py) 的成交滑点作为对照
+    滑点按不利方向为正, 单位为触发价的万分之一 (bps)
+    """
+    LATENCY_BUCKETS = (50, 100, 200, 500, 1000, 2000)  # 检测到确认的延迟分组上界(毫秒)
+    MAX_RECORDS = 1000
+    FIELDS = ('kind', 'side', 'trigger_price', 'quote_time', 'detect_time', 'detect_price',
+              'submit_time', 'submit_price', 'ack_time', 'ack_price', 'fill_price', 'ok', 'native')
+    default = None
+
+    def __init__(self):
+        self.records = []
+
+    @staticmethod
+    def get_default():
+        """同一机器人内共享一份记录 (多币种托管时汇总)"""
+        if TriggerTracker.default is None:
+            TriggerTracker.default = TriggerTracker()
+        return TriggerTracker.default
+
+    @staticmethod
+    def _now():
+        return UnixNano() / 1000000
+
+    def _append(self, rec):
+        self.records.append(rec)
+        if len(self.records) > self.MAX_RECORDS:
+            del self.records[0]
+
+    def detect(self, kind, side, trigger_price, snapshot):
+        """
+        记录检测到触发
+        kind: entry / add / trail_tp; side: 下单方向; snapshot: 本轮 MarketSnapshot
+        """
+        rec = dict.fromkeys(self.FIELDS, 0)
+        rec.update({'kind': kind, 'side': side, 'trigger_price': trigger_price,
+                    'quote_time': snapshot.ticker.get('Time', 0) if snapshot.ticker else 0,
+                    'detect_time': snapshot.time or self._now(), 'detect_price': snapshot.last,
+                    'ok': False, 'native': False})
+        return rec
+
+    def submit(self, rec, price):
+        rec['submit_time'] = self._now()
+        rec['submit_price'] = price
+
+    def ack(self, rec, ret, price=0):
+        """
+        记录交易所确认, 应在下单接口返回后立即调用
+        ret: 下单返回; price: 调用方已持有的最新价 (MarketSnapshot.last), 不在此处请求行情
+        """
+        rec['ack_time'] = self._now()
+        rec['ack_price'] = price
+        rec['ok'] = bool(ret)
+        if isinstance(ret, dict) and float(ret.get('avgPrice', 0) or 0) > 0:
+            rec['fill_price'] = float(ret['avgPrice'])
+        self._append(rec)
+
+    def record_native(self, kind, side, trigger_price, fill_price):
+        """记录交易所条件单的成交 (无程序内延迟, 只有成交滑点)"""
+        rec = dict.fromkeys(self.FIELDS, 0)
+        rec.update({'kind': kind, 'side': side, 'trigger_price': trigger_price, 'fill_price': fill_price,
+                    'ok': True, 'native': True})
+        self._append(rec)
+
+    @staticmethod
+    def slippage(rec, price):
+        """相对触发价的不利滑点(bps); price为0时返回None"""
+        if not price or not rec['trigger_price']:
+            return None
+        move = (price - rec['trigger_price']) / rec['trigger_price'] * 10000
+        return move if rec['side'] == "BUY" else -move
+
+    @staticmethod
+    def _avg(values):
+        values = [v for v in values if v is not None]
+        return sum(values) / len(values) if values else None
+
+    def report(self):
+        """滑点-延迟汇总: 按触发类型和延迟分组统计, 末尾为原生条件单对照"""
+        fmt = lambda v, unit="": "-" if v is None else f"{v:.1f}{unit}"
+        own = [r for r in self.records if not r['native'] and r['ok']]
+        lines = []
+        if own:
+            lines.append("程序内触发: 类型 | 次数 | 行情→检测 | 检测→提交 | 提交→确认 | 检测滑点 | 确认滑点 | 成交滑点")
+            for kind in sorted({r['kind'] for r in own}):
+                rows = [r for r in own if r['kind'] == kind]
+                lines.append(" | ".join([
+                    kind, str(len(rows)),
+                    fmt(self._avg([r['detect_time'] - r['quote_time'] if r['quote_time'] else None for r in rows]), "ms"),
+                    fmt(self._avg([r['submit_time'] - r['detect_time'] for r in rows]), "ms"),
+                    fmt(self._avg([r['ack_time'] - r['submit_time'] for r in rows]), "ms"),
+                    fmt(self._avg([self.slippage(r, r['detect_price']) for r in rows]), "bps"),
+                    fmt(self._avg([self.slippage(r, r['ack_price']) for r in rows]), "bps"),
+                    fmt(self._avg([self.slippage(r, r['fill_price']) for r in rows]), "bps"),
+                ]))
+            lines.append("延迟分组: 检测→确认 | 次数 | 确认滑点 | 期间价格变动")
+            lower = 0
+            for upper in self.LATENCY_BUCKETS + (float('inf'),):
+                rows = [r for r in own if lower <= r['ack_time'] - r['detect_time'] < upper]
+                lower = upper
+                if not rows:
+                    continue
+                label = f"<{upper}ms" if upper != float('inf') else f">={self.LATENCY_BUCKETS[-1]}ms"
+                drift = [self.slippage(r, r['ack_price']) - self.slippage(r, r['detect_price'])
+                         if r['ack_price'] else None for r in rows]
+                lines.append(f"{label} | {len(rows)} | {fmt(self._avg([self.slippage(r, r['ack_price']) for r in rows]), 'bps')}"
+                             f" | {fmt(self._avg(drift), 'bps')}")
+        native = [r for r in self.records if r['native']]
+        if native:
+            lines.append("原生条件单: 类型 | 次数 | 成交滑点")
+            for kind in sorted({r['kind'] for r in native}):
+                rows = [r for r in native if r['kind'] == kind]
+                lines.append(f"{kind} | {len(rows)} | {fmt(self._avg([self.slippage(r, r['fill_price']) for r in rows]), 'bps')}")
+        return lines
+
+    def dump(self, path):
+        """逐条记录写出为CSV"""
+        with open(path, 'w') as f:
+            f.write(",".join(self.FIELDS) + "\n")
+            for rec in self.records:
+                f.write(",".join(str(rec[k]) for k in self.FIELDS) + "\n")
+
+
+# ============================================================
+# 8. 策略状态持久化
+# ============================================================
+class StateJournal:
+    """
+    策略状态持久化 (FMZ _G 存储, 机器人重启后仍保留)
+    每个实例对应一个键, 保存最近一次状态转换后的快照 (JSON)
+    - save() 内容与上次写入相同时跳过, 每轮调用也只在状态变化时写入
+    - load() 读取失败或内容损坏时返回None
+    """
+    def __init__(self, key):
+        self.key = key
+        self.last = None
+
+    def save(self, data):
+        """写入快照, 返回是否实际写入"""
+        text = json.dumps(data, sort_keys=True, ensure_ascii=False)
+        if text == self.last:
+            return False
+        try:
+            _G(self.key, text)
+        except Exception as e:
+            Log(f"⚠️ 状态持久化失败 [{self.key}]: {e}")
+            return False
+        self.last = text
+        return True
+
+    def load(self):
+        """读取快照, 不存在时返回None"""
+        try:
+            text = _G(self.key)
+            if not text:
+                return None
+            data = json.loads(text)
+        except Exception as e:
+            Log(f"⚠️ 状态读取失败 [{self.key}]: {e}")
+            return None
+        self.last = text
+        return data
+
 # ============================================================
 # 导出类 (通过ext对象导出,主策略可通过ext.XXX()调用)
 # ============================================================
 ext.NotificationManager = NotificationManager
+ext.MarketInfoStore = MarketInfoStore
 ext.PrecisionManager = PrecisionManager
+ext.RequestScheduler = RequestScheduler
+ext.RetryPolicy = RetryPolicy
 ext.OrderManager = OrderManager
+ext.DepthPricer = DepthPricer
+ext.OrderChaser = OrderChaser
+ext.OrderSet = OrderSet
+ext.ATRService = ATRService
 ext.ATRCalculator = ATRCalculator
+ext.UserDataStream = UserDataStream
+ext.ReplayEventSource = ReplayEventSource
+ext.PriceStream = PriceStream
+ext.LoopScheduler = LoopScheduler
+ext.StatusRenderer = StatusRenderer
+ext.MarketSnapshot = MarketSnapshot
+ext.PriceRangeTracker = PriceRangeTracker
+ext.AdaptivePoller = AdaptivePoller
+ext.Profiler = Profiler
+ext.TriggerTracker = TriggerTracker
+ext.StateJournal = StateJournal